@@ -14,8 +14,10 @@ from psycopg_pool import ConnectionPool
 from typing_extensions import TypedDict
 
 from app.ai.settings import langsmith_settigns, llm_settings
-from app.ai.tools import DisplayOperationTool, tools
+from app.ai.tools import DisplayOperationTool, SceneCatalogTool, tools
+from app.db_conn import DatabaseHandler
 from app.settings import load_settings
+from app.unity.catalog import AssetCatalog
 from app.unity_conn import SocketServer
 
 
@@ -24,13 +26,15 @@ class State(TypedDict):
 
 
 class ChatbotGraph:
-    def __init__(self, server: SocketServer, verbose: bool = False):
+    def __init__(self, server: SocketServer, verbose: bool = False, db: DatabaseHandler | None = None):
         self.graph_builder = StateGraph(State)
         langsmith_settigns()
         try:
             self.llm = llm_settings(verbose=verbose)
-            self.tools = tools
-            self.tools.append(DisplayOperationTool(server=server))
+            # モジュールの tools を変更すると、ChatbotGraph を作り直すたびにツールが重複するため複製する
+            self.tools = [*tools, DisplayOperationTool(server=server)]
+            if db is not None:
+                self.tools.append(SceneCatalogTool(catalog=AssetCatalog(db, server)))
             self.llm_with_tools = self.llm.bind_tools(self.tools)
             self._initialize_memory()
             self._initialize_graph()
@@ -42,7 +46,7 @@ class ChatbotGraph:
 
     def _initialize_graph(self) -> None:
         self.graph_builder.add_node("chatbot", self.chatbot)
-        tool_node = ToolNode(tools=tools)
+        tool_node = ToolNode(tools=self.tools)
         self.graph_builder.add_node("tools", tool_node)
         self.graph_builder.add_conditional_edges(
             "chatbot",
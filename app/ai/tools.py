@@ -1,4 +1,7 @@
+import asyncio
+from collections.abc import Coroutine
 from enum import Enum
+from typing import Any
 
 from langchain_core.callbacks import (
     AsyncCallbackManagerForToolRun,
@@ -9,6 +12,7 @@ from langchain_core.tools import BaseTool, tool
 from pydantic import BaseModel, Field
 
 from app.ai.vector_db import get_vector_store
+from app.unity.catalog import AssetCatalog
 from app.unity_conn import SocketServer
 
 
@@ -35,6 +39,29 @@ class OperationCommand(Enum):
     rotate_scene = "シーンを回転"
 
 
+# プレイリストで切り替えるコマンドと、移動するシーンの数
+NAVIGATION_STEPS = {"next": 1, "previous": -1}
+
+
+def broadcast_error(operation: str, results: dict[str, str | Exception]) -> str | None:
+    """
+    全てのDisplayへの操作の結果から、操作できなかった場合のメッセージを作成する
+
+    Args:
+        operation (str): 操作内容
+        results (dict[str, str | Exception]): セッションIDごとの結果 (失敗した場合は例外)
+
+    Returns:
+        str | None: 接続中のDisplayがない場合・全てのDisplayで失敗した場合のメッセージ (1つでも成功した場合はNone)
+    """
+    if not results:
+        return f"Displayが接続されていないため操作できませんでした: {operation}"
+    if all(isinstance(result, Exception) for result in results.values()):
+        errors = ", ".join(f"{session_id}: {result}" for session_id, result in results.items())
+        return f"Displayの操作に失敗しました: {operation} ({errors})"
+    return None
+
+
 class DisplayOperationInput(BaseModel):
     operation: str = Field(
         description=(
@@ -49,18 +76,76 @@ class DisplayOperationTool(BaseTool):
     args_schema: type[BaseModel] = DisplayOperationInput
 
     server: SocketServer
+    # 操作対象のセッションID (Noneの場合は接続中の全Displayを操作する)
+    session_id: str | None = None
+
+    def _to_command(self, operation: str) -> str:
+        """
+        操作内容をUnityに送信するコマンドに変換
+
+        Args:
+            operation (str): 操作内容
+
+        Raises:
+            ValueError: 操作内容が不正な場合
+        """
+        if OperationCommand.next_scene.value == operation:
+            # 次のシーンを表示する
+            return "next"
+        elif OperationCommand.previous_scene.value == operation:
+            # 前のシーンを表示する
+            return "previous"
+        elif OperationCommand.rotate_scene.value == operation:
+            # シーンを回転する
+            return "rotate"
+        raise ValueError(f"Invalid operation: {operation}")
 
-    def send_command(self, command: str) -> None:
+    def send_command(self, command: str) -> str | dict[str, str | Exception]:
         """
         クライアントにコマンドを送信
 
         Args:
             command (str): 送信するコマンド
+
+        Returns:
+            str | dict[str, str | Exception]: 実行結果 (全Displayに送信した場合はセッションIDごとの結果)
+        """
+        if self.session_id is None:
+            return self.server.broadcast_command(command)
+        return self.server.send_command(command, self.session_id)
+
+    def _navigate(self, command: str) -> Coroutine[Any, Any, Any]:
+        """
+        次・前のシーンへの切り替えを、プレイリストの順に行うコルーチンを返す (前後のシーンは先読みされる)
+        """
+        step = NAVIGATION_STEPS[command]
+        if self.session_id is None:
+            return self.server.prefetcher.navigate_all(step)
+        return self.server.prefetcher.navigate(step, self.session_id)
+
+    async def asend_command(self, command: str) -> str | dict[str, str | Exception]:
         """
-        try:
-            self.server.send_command(command)
-        except Exception as e:
-            raise e
+        クライアントにコマンドを送信 (サーバーのイベントループ上で実行し、完了を非同期に待機する)
+
+        Args:
+            command (str): 送信するコマンド
+
+        Returns:
+            str | dict[str, str | Exception]: 実行結果 (全Displayに送信した場合はセッションIDごとの結果)
+        """
+        if self.session_id is None:
+            coro = self.server.broadcast_command_async(command)
+        else:
+            coro = self.server.send_command_async(command, self.session_id)
+        return await asyncio.wrap_future(self.server.submit(coro))
+
+    def _result_message(self, operation: str, result: str | dict[str, str | Exception]) -> str:
+        """
+        操作結果のメッセージ (全Displayへの操作は失敗を例外にしないため、結果から判定する)
+        """
+        if self.session_id is None and (error := broadcast_error(operation, result)):
+            return error
+        return f"次の操作を行いました: {operation}"
 
     def _run(self, operation: str, run_manager: CallbackManagerForToolRun | None = None) -> str:
         """
@@ -73,19 +158,12 @@ class DisplayOperationTool(BaseTool):
         Returns:
             str: 操作結果
         """
-        if OperationCommand.next_scene.value == operation:
-            # 次のシーンを表示する
-            self.send_command("next")
-        elif OperationCommand.previous_scene.value == operation:
-            # 前のシーンを表示する
-            self.send_command("previous")
-        elif OperationCommand.rotate_scene.value == operation:
-            # シーンを回転する
-            self.send_command("rotate")
+        command = self._to_command(operation)
+        if command in NAVIGATION_STEPS:
+            result = self.server.submit(self._navigate(command)).result()
         else:
-            raise ValueError(f"Invalid operation: {operation}")
-
-        return f"次の操作を行いました: {operation}"
+            result = self.send_command(command)
+        return self._result_message(operation, result)
 
     async def _arun(
         self,
@@ -102,7 +180,44 @@ class DisplayOperationTool(BaseTool):
         Returns:
             str: 操作結果
         """
-        return self._run(operation, run_manager=run_manager.get_sync())
+        command = self._to_command(operation)
+        if command in NAVIGATION_STEPS:
+            result = await asyncio.wrap_future(self.server.submit(self._navigate(command)))
+        else:
+            result = await self.asend_command(command)
+        return self._result_message(operation, result)
+
+
+class SceneCatalogInput(BaseModel):
+    name: str = Field(default="", description="シーンのファイル名の先頭の文字列 (空の場合は新しい順に一覧する)")
+
+
+class SceneCatalogTool(BaseTool):
+    name: str = "scene_catalog_tool"
+    description: str = (
+        "アップロードされたシーン(3D Gaussian Splatting)の一覧と、Gaussianの数・サイズなどの情報を取得する"
+    )
+    args_schema: type[BaseModel] = SceneCatalogInput
+
+    catalog: AssetCatalog
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _run(self, name: str = "", run_manager: CallbackManagerForToolRun | None = None) -> str:
+        """
+        シーンの一覧を取得する関数
+
+        Args:
+            name (str): シーンのファイル名の先頭の文字列
+            run_manager (CallbackManagerForToolRun | None): Callback manager for tool run. Defaults to None.
+
+        Returns:
+            str: シーンの一覧 (1行に1シーン)
+        """
+        scenes = self.catalog.find(name) if name else self.catalog.list_scenes()
+        if not scenes:
+            return "該当するシーンはありません"
+        return "\n".join(str(scene) for scene in scenes)
 
 
 tools = [search_documents_tool]
@@ -1,3 +1,4 @@
+import threading
 
 from flet import (
     AlertDialog,
@@ -10,12 +11,14 @@ from flet import (
     FloatingActionButton,
     IconButton,
     InputBorder,
+    ListTile,
     MainAxisAlignment,
     Markdown,
     MarkdownExtensionSet,
     NavigationRail,
     NavigationRailDestination,
     NavigationRailLabelType,
+    OnScrollEvent,
     Page,
     RoundedRectangleBorder,
     Row,
@@ -32,6 +35,7 @@ from flet import (
 )
 
 from app.ai.vector_db import delete_document_from_vectorstore, indexing_document
+from app.document_store import DocumentPage, DocumentStore, SearchResult
 
 
 class RailDescription(Row):
@@ -54,29 +58,33 @@ class RailDescription(Row):
 
 
 class Sidebar(Container):
-    def __init__(self, page:Page, documents_list: list):
+    # ページの下端からこのピクセル数以内までスクロールしたら、次のページを読み込む
+    load_more_threshold = 200
+
+    def __init__(self, page:Page, documents_page: DocumentPage):
         super().__init__()
         self.page = page
         self.db = self.page.data["db"]
+        self.store = DocumentStore(self.db)
 
         self.nav_rail_visible = True
-        self.nav_rail_items = []
-        for document in documents_list:
-            self.nav_rail_items.append(
-                NavigationRailDestination(
-                    label_content=RailDescription(self.page, document[1], document[0]),
-                    label=document[1],
-                    selected_icon=icons.CHEVRON_RIGHT_ROUNDED,
-                    icon=icons.CHEVRON_RIGHT_OUTLINED,
-                    data=document[0],
-                )
-            )
+        self.nav_rail_items = [self.create_destination(document) for document in documents_page.documents]
+        # 次のページのカーソル (全て読み込んだ場合はNone)
+        self.next_cursor = documents_page.next_cursor
+        self._loading = threading.Lock()
+        self.load_more_button = TextButton(
+            text="さらに読み込む",
+            icon=icons.EXPAND_MORE,
+            on_click=self.load_more,
+            visible=documents_page.has_more,
+        )
 
         self.nav_rail = NavigationRail(
             selected_index=None,
             label_type=NavigationRailLabelType.ALL,
             # min_width=100,
             leading=FloatingActionButton(icon=icons.CREATE, text="ADD DOCUMENT", on_click=self.open_modal),
+            trailing=self.load_more_button,
             group_alignment=-0.9,
             destinations=self.nav_rail_items,
             on_change=self.tap_nav_icon,
@@ -125,6 +133,45 @@ class Sidebar(Container):
             vertical_alignment=CrossAxisAlignment.START,
         )
 
+    def create_destination(self, document: tuple[int, str]) -> NavigationRailDestination:
+        return NavigationRailDestination(
+            label_content=RailDescription(self.page, document[1], document[0]),
+            label=document[1],
+            selected_icon=icons.CHEVRON_RIGHT_ROUNDED,
+            icon=icons.CHEVRON_RIGHT_OUTLINED,
+            data=document[0],
+        )
+
+    def did_mount(self):
+        # 表示している間だけ、ページのスクロールで次のページを読み込む
+        self.page.on_scroll_interval = 100
+        self.page.on_scroll = self.on_page_scroll
+
+    def will_unmount(self):
+        if self.page.on_scroll == self.on_page_scroll:
+            self.page.on_scroll = None
+
+    def on_page_scroll(self, e: OnScrollEvent):
+        if e.max_scroll_extent - e.pixels <= self.load_more_threshold:
+            self.load_more(e)
+
+    def load_more(self, e=None):
+        """
+        ドキュメントの一覧の次のページを読み込み、サイドバーの最後に追加する
+        """
+        if self.next_cursor is None or not self._loading.acquire(blocking=False):
+            return
+        try:
+            documents_page = self.store.list_page(after=self.next_cursor)
+            self.nav_rail.destinations.extend(
+                self.create_destination(document) for document in documents_page.documents
+            )
+            self.next_cursor = documents_page.next_cursor
+            self.load_more_button.visible = documents_page.has_more
+            self.update()
+        finally:
+            self._loading.release()
+
     def toggle_nav_rail(self, e):
         self.nav_rail.visible = not self.nav_rail.visible
         self.toggle_nav_rail_button.selected = not self.toggle_nav_rail_button.selected
@@ -192,6 +239,53 @@ class DocumentBody(Container):
         )
 
 
+class DocumentSearch(Column):
+    """
+    ドキュメントの全文検索の検索欄と検索結果
+    """
+
+    def __init__(self, page: Page):
+        super().__init__()
+        self.page = page
+        self.expand = True
+        self.store = DocumentStore(self.page.data["db"])
+
+        self.search_field = TextField(
+            hint_text="ドキュメントを検索",
+            prefix_icon=icons.SEARCH,
+            border=InputBorder.UNDERLINE,
+            filled=True,
+            on_change=self.search,
+            on_submit=self.search,
+        )
+        self.results = Column(scroll="auto", expand=True)
+        self.controls = [self.search_field, self.results]
+
+    def search(self, e):
+        query = self.search_field.value or ""
+        try:
+            results = self.store.search(query)
+        except Exception as error:
+            self.search_field.error_text = f"検索できませんでした: {error}"
+            self.update()
+            return
+        # 入力中に古い検索の結果で上書きしないように、入力が変わっていれば表示しない
+        if query != self.search_field.value:
+            return
+        self.search_field.error_text = None
+        self.results.controls = [self.create_result(result) for result in results]
+        if query.strip() and not results:
+            self.results.controls = [Text("一致するドキュメントはありません")]
+        self.update()
+
+    def create_result(self, result: SearchResult) -> ListTile:
+        return ListTile(
+            title=Text(result.title, max_lines=1, overflow=TextOverflow.ELLIPSIS),
+            subtitle=Markdown(value=result.snippet),
+            on_click=lambda e, document_id=result.document_id: self.page.go(f"/documents/{document_id}"),
+        )
+
+
 class DocumentsBody(Row):
     def __init__(self, page: Page, document_id: int = 0):
         super().__init__()
@@ -204,18 +298,18 @@ class DocumentsBody(Row):
         self.settings = self.page.data["settings"]()
         self.db = self.page.data["db"]
 
-        self.documents_list = self.get_document_list()
+        self.documents_page = self.get_document_list()
 
         if document_id == 0:
             self.controls = [
-                Sidebar(self.page, documents_list=self.documents_list),
-                Text("test."),
+                Sidebar(self.page, documents_page=self.documents_page),
+                DocumentSearch(self.page),
             ]
         else:
             self.document_body = self.get_document_body(document_id)
             content = self.document_body[2] if self.document_body else "Document not found."
             self.controls = [
-                Sidebar(self.page, documents_list=self.documents_list),
+                Sidebar(self.page, documents_page=self.documents_page),
                 DocumentBody(self.page, content=content),
             ]
 
@@ -223,9 +317,9 @@ class DocumentsBody(Row):
         result = self.db.fetch_query("SELECT * FROM documents WHERE document_id = %s", (document_id,))
         return result[0] if result != [] else None
 
-    def get_document_list(self):
-        result = self.db.fetch_query("SELECT document_id, title FROM documents ORDER BY document_id ASC;")
-        return result
+    def get_document_list(self) -> DocumentPage:
+        # 最初のページだけを読み込み、残りはサイドバーのスクロールに合わせて読み込む
+        return DocumentStore(self.db).list_page()
 
 
 
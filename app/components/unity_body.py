@@ -1,5 +1,8 @@
 import logging
 import os
+import threading
+import time
+from concurrent.futures import Future
 
 from flet import (
     Column,
@@ -13,9 +16,15 @@ from flet import (
     TabAlignment,
     Tabs,
     Text,
+    TextButton,
     alignment,
 )
 
+from app.splat.workers import JobState, WorkerJob
+from app.unity.catalog import AssetCatalog
+from app.unity.transfer import GrowingFile
+from app.unity.transfer_manager import TransferJob, TransferManager, TransferState
+
 logger = logging.getLogger(__name__)
 
 class DisplaySettingsBody(Column):
@@ -37,6 +46,22 @@ class FileSettingsBody(Column):
         self.file_picker = FilePicker(on_result=self.on_file_result, on_upload=self.on_file_upload)
         self.page.overlay.append(self.file_picker)
         self.selected_files = Text("No files selected")
+        self.file_sizes: dict[str, int] = {}
+        # Unityに転送中のアップロード (ファイル名 -> 書き込み中のファイル)
+        self.streams: dict[str, GrowingFile] = {}
+        # アップロードの完了を待ってから送信・保持するアップロード
+        self.deferred: set[str] = set()
+        # 転送の一覧 (TransferManager の進捗を表示する)
+        self.transfer_list = Column(spacing=5)
+        self.transfer_update_interval = 0.5
+        self.last_transfer_update = 0.0
+        # PLYの検証・変換の一覧 (ワーカープロセスの進捗を表示する)
+        self.job_list = Column(spacing=5)
+        self.last_job_update = 0.0
+        # 取り込んだシーンの一覧 (assetsテーブルから取得する)
+        self.catalog = AssetCatalog(self.page.data["db"], self.page.data["server"])
+        self.scene_list = Column(spacing=5)
+        self.update_scene_list()
 
         self.controls = [
             Text("**********************"),
@@ -51,9 +76,24 @@ class FileSettingsBody(Column):
                 visible=False,
                 text="ファイルをアップロード",
                 on_click=self.upload_files,
-            )
+            ),
+            Text("処理"),
+            self.job_list,
+            Text("転送"),
+            self.transfer_list,
+            Text("シーン"),
+            self.scene_list,
         ]
 
+    def did_mount(self):
+        # 表示している間だけ、転送とPLYの処理の進捗を受け取る (タブを作り直すたびに登録が残らないようにする)
+        self.page.data["server"].transfers.add_listener(self.on_transfer_update)
+        self.page.data["server"].workers.add_listener(self.on_job_update)
+
+    def will_unmount(self):
+        self.page.data["server"].transfers.remove_listener(self.on_transfer_update)
+        self.page.data["server"].workers.remove_listener(self.on_job_update)
+
     def on_file_result(self, e):
         logger.debug(f"ファイルが選択されました: {e.files}")
         self.selected_files.value = (
@@ -68,6 +108,7 @@ class FileSettingsBody(Column):
         try:
             if self.file_picker.result is not None and self.file_picker.result.files is not None:
                 for f in self.file_picker.result.files:
+                    self.file_sizes[f.name] = f.size
                     upload_list.append(
                         FilePickerUploadFile(
                             f.name,
@@ -83,29 +124,145 @@ class FileSettingsBody(Column):
             self.page.update()
 
     def on_file_upload(self, e):
-        if e.progress == 1.0: # アップロードが完了した場合Unityにファイルを送信
-            try:
+        # アップロード中のファイルを、書き込まれた分から接続中の全Unityに転送する (送信完了は on_file_sent() で処理)
+        # Unityが接続されていない場合はアップロードの完了後にサーバーで保持し、接続後に送信する
+        file_path = f"{os.environ['FLET_ASSETS_DIR']}/uploads/{e.file_name}"
+        try:
+            server = self.page.data["server"]
+            source = self.streams.get(e.file_name)
+            if e.error:
+                raise OSError(e.error)
+            if source is None and e.file_name not in self.deferred:
+                if server.is_connected and not server.needs_complete_file(e.file_name):
+                    logger.debug(f"アップロード中のファイルをUnityに転送します: {e.file_name}")
+                    source = GrowingFile(file_path, self.file_sizes[e.file_name], server.loop)
+                    self.streams[e.file_name] = source
+                    future = server.transfers.submit_stream(source)
+                    future.add_done_callback(lambda f: self.on_file_sent(f, file_path, e.file_name))
+                else:
+                    # Unityが接続されていない場合・送信前に圧縮する場合は、アップロードの完了後に処理する
+                    self.deferred.add(e.file_name)
+            if source is not None:
+                if e.progress == 1.0:
+                    source.finish()
+                else:
+                    source.update()
+            elif e.progress == 1.0:
                 logger.debug("ファイルの一時アップロードが完了しました")
-                # Unityにファイルを送信する
-                file_path = f"{os.environ['FLET_ASSETS_DIR']}/uploads/{e.file_name}"
-                result = self.page.data["server"].send_file(file_path)
-                os.remove(file_path) # 一時ファイルを削除
+                self.deferred.discard(e.file_name)
+                if server.is_connected:
+                    # 送信前に圧縮するファイルはアップロードの完了を待ってから送信する
+                    future = server.transfers.submit_file(file_path)
+                    future.add_done_callback(lambda f: self.on_file_sent(f, file_path, e.file_name))
+                    return
+                server.spool_file(file_path)
+                self.selected_files.value = "Unityの接続後にファイルを送信します"
                 self.controls[5].visible = False
                 self.page.update()
-                logger.debug(f"ファイルのアップロードが完了しました\nunity message: {result}")
+        except Exception as error:
+            logger.error(f"ファイルのアップロード中にエラーが発生しました: {error}")
+            if (source := self.streams.get(e.file_name)) is not None:
+                source.fail(error)
+            self.deferred.discard(e.file_name)
+            self.selected_files.value = "Error uploading files"
+            self.controls[5].visible = False
+            self.page.update()
+
+    def on_transfer_update(self, job: TransferJob):
+        # 状態が変わったときと、一定間隔ごとに転送の一覧を更新する (サーバーのイベントループのスレッドから呼ばれる)
+        now = time.monotonic()
+        if job.state == TransferState.RUNNING and now - self.last_transfer_update < self.transfer_update_interval:
+            return
+        self.last_transfer_update = now
+        transfers = self.page.data["server"].transfers
+        self.transfer_list.controls = [self.transfer_row(job, transfers) for job in reversed(transfers.jobs.values())]
+        self.page.update()
+
+    @staticmethod
+    def transfer_row(job: TransferJob, transfers: TransferManager) -> Row:
+        status = f"{job.state.value} {job.progress:.0%}"
+        if job.state == TransferState.RUNNING:
+            eta = f"{job.eta:.0f}s" if job.eta is not None else "-"
+            status += f" {job.throughput / 1024**2:.1f} MiB/s 残り {eta}"
+        elif job.error is not None:
+            status += f" {job.error}"
+        return Row(
+            controls=[
+                Text(f"{job.file_name} → {job.display_id}: {status}"),
+                TextButton(
+                    text="キャンセル",
+                    visible=not job.finished,
+                    on_click=lambda _, job_id=job.job_id: transfers.cancel(job_id),
+                ),
+            ],
+        )
+
+    def on_job_update(self, job: WorkerJob):
+        # ワーカーの進捗を受け取るスレッドから呼ばれる (処理はワーカープロセスで行うため、UIは固まらない)
+        now = time.monotonic()
+        if job.state == JobState.RUNNING and now - self.last_job_update < self.transfer_update_interval:
+            return
+        self.last_job_update = now
+        jobs = self.page.data["server"].workers.jobs
+        self.job_list.controls = [
+            Text(
+                f"{job.kind}: {job.file_name} {job.state.value} {job.progress:.0%}"
+                + (f" {job.error!r}" if job.error is not None else "")
+            )
+            for job in reversed(list(jobs.values()))
+        ]
+        self.page.update()
+
+    def on_file_sent(self, future: Future, file_path: str, file_name: str):
+        self.streams.pop(file_name, None)
+        try:
+            results = future.result()
+            if not results:
+                raise ConnectionError("クライアントが接続されていません")
+            errors = {session_id: r for session_id, r in results.items() if isinstance(r, Exception)}
+            logger.debug(f"ファイルのアップロードが完了しました\nunity message: {results}")
+            if errors:
+                logger.error(f"一部のUnityへの送信に失敗しました: {errors}")
+                self.selected_files.value = f"{len(results) - len(errors)}/{len(results)}台のUnityに送信しました"
+            else:
                 self.selected_files.value = "ファイルのアップロードが完了しました"
+        except ConnectionError as error:
+            logger.error(f"Unityとの接続中にエラーが発生しました: {error}")
+            self.selected_files.value = "送信先のUnityと接続できませんでした。"
+        except Exception as error:
+            logger.error(f"ファイルのアップロード中にエラーが発生しました: {error}")
+            self.selected_files.value = "Error uploading files"
+        finally:
+            # シーンをカタログに記録してから一時ファイルを削除する (ワーカーの完了を待つため別スレッドで実行する)
+            threading.Thread(target=self.ingest, args=(file_path,), daemon=True).start()
+            self.controls[5].visible = False
+            self.page.update()
+
+    def ingest(self, file_path: str):
+        try:
+            if file_path.lower().endswith(".ply"):
+                record = self.catalog.ingest(file_path)
+                # 送信したシーンをプレイリストに追加し、前後のシーンを先読みさせる
+                server = self.page.data["server"]
+                index = server.playlist.add(file_path, record.digest)
+                server.submit(server.prefetcher.set_current(index))
+                self.update_scene_list()
                 self.page.update()
-            except ConnectionError as error:
-                logger.error(f"Unityとの接続中にエラーが発生しました: {error}")
+        except Exception as error:
+            logger.error(f"シーンをカタログに記録できませんでした: {error}")
+        finally:
+            if os.path.exists(file_path):
                 os.remove(file_path) # 一時ファイルを削除
-                self.selected_files.value = "送信先のUnityと接続できませんでした。"
-                self.controls[5].visible = False
-                self.page.update()
-            except Exception as error:
-                logger.error(f"ファイルのアップロード中にエラーが発生しました: {error}")
-                self.selected_files.value = "Error uploading files"
-                self.controls[5].visible = False
-                self.page.update()
+
+    def update_scene_list(self):
+        try:
+            scenes = self.catalog.list_scenes()
+        except Exception as error:
+            logger.error(f"シーンの一覧を取得できませんでした: {error}")
+            return
+        self.scene_list.controls = [Text(str(scene)) for scene in scenes] or [Text("シーンがありません")]
+        prefetcher = self.page.data["server"].prefetcher
+        self.scene_list.controls.append(Text(f"プレイリスト: {len(prefetcher.playlist)}件, 先読み: {prefetcher.stats}"))
 
 class TabBody(Tab):
     def __init__(self, page: Page, title: str):
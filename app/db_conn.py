@@ -1,8 +1,12 @@
 # postgresqlとの接続を行うモジュール
 import logging
 import sqlite3
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
 
+from psycopg import sql
 from psycopg_pool import ConnectionPool
 
 from app.settings import load_settings
@@ -11,8 +15,190 @@ from app.settings import load_settings
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 起動時に実行するスキーマの変更 (DatabaseHandler.migrate())
+MIGRATION_DIRS = {
+    "sqlite": "db/sqlite/migrate",
+    "postgres": "db/postgres/migrate",
+}
+
+# SQLiteの接続ごとに設定するPRAGMA
+# WALモードでは読み込みが書き込みを待たず、synchronous=normal でもDBは壊れない (電源断で直前のコミットが失われうるのみ)
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # ページキャッシュ (負の値はKiB単位)
+    "cache_size": -16000,
+    # 読み込みをメモリマップで行う最大のバイト数
+    "mmap_size": 256 * 1024**2,
+}
+
+
+class SQLiteConnectionPool:
+    """
+    スレッドごとにSQLiteの接続を作成して使い回すプール
+
+    Fletのイベントハンドラは複数のスレッドで並行して実行されるため、1つの接続を共有すると
+    カーソルの状態が混ざり、処理も直列になる。スレッドごとに接続を持たせ、WALモードにすることで
+    読み込みは書き込み中も並行して実行でき、書き込みが重なった場合は busy_timeout 秒まで待機する。
+    終了したスレッドの接続は、次に接続を作成するときに閉じる。
+    """
+
+    def __init__(self, database: str, pragmas: dict | None = None, busy_timeout: float = 5.0):
+        """
+        Args:
+            database (str): SQLiteのファイルのパス
+            pragmas (dict | None): 接続ごとに設定するPRAGMA (DEFAULT_SQLITE_PRAGMAS を上書きする)
+            busy_timeout (float): 他の接続が書き込み中の場合に待機する秒数
+        """
+        self.database = database
+        self.pragmas = {**DEFAULT_SQLITE_PRAGMAS, **(pragmas or {})}
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 作成した接続と、それを使用するスレッド (終了したスレッドの接続を閉じるため)
+        self._connections: list[tuple[threading.Thread, sqlite3.Connection]] = []
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        呼び出したスレッドの接続を返す (まだない場合は作成する)
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._lock:
+                self._close_finished()
+                self._connections.append((threading.current_thread(), connection))
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.database, timeout=self.busy_timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            result = connection.execute(f"PRAGMA {name} = {value}").fetchone()
+            # journal_mode は変更できなかった場合(メモリ上のDBなど)にエラーにならず、現在のモードを返す
+            if name == "journal_mode" and str(result[0]).lower() != str(value).lower():
+                logger.warning(f"SQLiteのジャーナルモードを {value} にできませんでした: {result[0]}")
+        logger.debug(f"SQLiteの接続を作成しました: {threading.current_thread().name}")
+        return connection
+
+    def _close_finished(self) -> None:
+        """
+        終了したスレッドの接続を閉じる
+        """
+        alive = []
+        for thread, connection in self._connections:
+            if thread.is_alive():
+                alive.append((thread, connection))
+            else:
+                connection.close()
+        self._connections = alive
+
+    @property
+    def size(self) -> int:
+        """
+        開いている接続の数
+        """
+        return len(self._connections)
+
+    def close(self) -> None:
+        """
+        全ての接続を閉じる
+        """
+        with self._lock:
+            for _, connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+@dataclass
+class Statement:
+    """
+    実行するSQL文と、その実行回数・処理時間の統計
+
+    Attributes:
+        query (str): 呼び出し元が渡したSQL (プレースホルダーは %s)
+        sql (str): 接続先のDBの書式に変換したSQL
+        calls (int): 実行した回数
+        errors (int): 失敗した回数
+        total_seconds (float): 処理時間の合計(秒)
+        max_seconds (float): 最も長かった処理時間(秒)
+    """
+    query: str
+    sql: str
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+class StatementCache:
+    """
+    SQL文を接続先のDBの書式に一度だけ変換して保持し、SQL文ごとの実行回数と処理時間を集計するクラス
+
+    SQLiteではプレースホルダーの %s を ? に変換する。変換したSQLは sqlite3 の接続が持つ
+    コンパイル済みの文のキャッシュにそのまま当たり、PostgreSQLでは psycopg の prepare で
+    サーバー側に準備した文を接続ごとに使い回す。
+    """
+    # 保持するSQL文の数の上限 (超えた場合は最も古いものから削除する)
+    max_size = 512
+
+    def __init__(self, dialect: str):
+        """
+        Args:
+            dialect (str): 接続先のDB ("sqlite" または "postgres")
+        """
+        self.dialect = dialect
+        self._statements: dict[str, Statement] = {}
+        self._lock = threading.Lock()
+
+    def translate(self, query: str) -> str:
+        """
+        SQLを接続先のDBの書式に変換する
+        """
+        if self.dialect == "sqlite":
+            return query.replace("%s", "?")
+        return query
+
+    def get(self, query: str) -> Statement:
+        """
+        SQLに対応する文を返す (初めてのSQLの場合は変換して保持する)
+        """
+        statement = self._statements.get(query)
+        if statement is None:
+            statement = Statement(query, self.translate(query))
+            with self._lock:
+                if len(self._statements) >= self.max_size:
+                    del self._statements[next(iter(self._statements))]
+                self._statements[query] = statement
+        return statement
+
+    def record(self, statement: Statement, seconds: float, failed: bool = False) -> None:
+        """
+        文の実行結果を統計に加える
+        """
+        with self._lock:
+            statement.calls += 1
+            statement.errors += failed
+            statement.total_seconds += seconds
+            statement.max_seconds = max(statement.max_seconds, seconds)
+
+    def stats(self) -> list[Statement]:
+        """
+        保持している文を、処理時間の合計が長い順に返す
+        """
+        with self._lock:
+            return sorted(self._statements.values(), key=lambda statement: statement.total_seconds, reverse=True)
+
 
 class DatabaseHandler:
+    # この秒数以上かかったクエリは警告としてログに出力する
+    slow_query_seconds = 0.5
+
     def __init__(self, settings: dict):
         """
         データベース接続情報を初期化するクラス
@@ -21,11 +207,13 @@ class DatabaseHandler:
         """
         self.settings = settings["db_settings"]
         self.use_postgres = self.settings.get("use_postgres", False)
+        self.statements = StatementCache("postgres" if self.use_postgres else "sqlite")
 
         if self.use_postgres:
             self._init_postgres()
         else:
             self._init_sqlite()
+        self.migrate()
 
     def _init_postgres(self):
         """PostgreSQLデータベースに接続するための初期化を行う"""
@@ -46,53 +234,161 @@ class DatabaseHandler:
                     connection.executescript(f.read())
             logging.info("SQLite database is created.")
 
-        self.connection = sqlite3.connect(sqlite_settings["database"], check_same_thread=False)
-        logging.info("SQLite connection is initialized.")
+        self.sqlite_pool = SQLiteConnectionPool(
+            sqlite_settings["database"], sqlite_settings.get("pragmas"), sqlite_settings.get("busy_timeout", 5.0)
+        )
+        logging.info("SQLite connection pool is initialized.")
+
+    def migrate(self):
+        """
+        既存のデータベースにも必要なテーブルや索引を作成する (起動時に毎回実行する)
+
+        MIGRATION_DIRS のSQLファイルをファイル名の順に実行する。各ファイルは何度実行しても
+        同じ結果になるように書く (CREATE ... IF NOT EXISTS など)。
+        """
+        directory = Path(MIGRATION_DIRS["postgres" if self.use_postgres else "sqlite"])
+        for path in sorted(directory.glob("*.sql")):
+            script = path.read_text(encoding="utf-8")
+            try:
+                if self.use_postgres:
+                    with self.pool.connection() as conn:
+                        conn.execute(script)
+                else:
+                    self.connection.executescript(script)
+            except Exception as error:
+                logger.error(f"Error migrating database ({path.name}): {error}")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        呼び出したスレッドのSQLiteの接続
+        """
+        return self.sqlite_pool.connection()
 
     def execute_query(self, query, params=None):
         """
         クエリを実行する（データ挿入や更新などの変更系）
         """
+        try:
+            self._execute(query, params)
+        except Exception as error:
+            logger.error(f"Error executing query: {error}")
+
+    def fetch_query(self, query, params=None) -> list:
+        """
+        クエリを実行し結果を取得する（データ取得系）
+        """
+        try:
+            return self._execute(query, params, fetch=True)
+        except Exception as error:
+            logger.error(f"Error fetching query: {error}")
+            raise error
+
+    def _execute(self, query: str, params=None, fetch: bool = False) -> list | None:
+        """
+        変換済みの文でクエリを実行し、処理時間を記録する (変更系はコミットする)
+        """
+        statement = self.statements.get(query)
+        started = time.perf_counter()
+        failed = True
         try:
             if self.use_postgres:
                 with self.pool.connection() as conn:
                     with conn.cursor() as cursor:
-                        cursor.execute(query, params)
+                        cursor.execute(statement.sql, params, prepare=True)
+                        result = cursor.fetchall() if fetch else None
                         conn.commit()
-                        logger.info("Query executed successfully (PostgreSQL).")
             else:
-                query = query.replace("%s", "?")
-                cursor = self.connection.cursor()
-                cursor.execute(query, params or [])
-                self.connection.commit()
-                logger.info("Query executed successfully (SQLite).")
-                # self.close_connection()
-        except Exception as error:
-            logger.error(f"Error executing query: {error}")
+                connection = self.connection
+                cursor = connection.execute(statement.sql, params or [])
+                result = cursor.fetchall() if fetch else None
+                if not fetch:
+                    connection.commit()
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            self.statements.record(statement, seconds, failed)
+            if seconds >= self.slow_query_seconds:
+                logger.warning(f"時間のかかったクエリ ({seconds:.3f}s): {statement.sql}")
 
-    def fetch_query(self, query, params=None) -> list:
+    def execute_many(self, query: str, params_seq) -> int:
         """
-        クエリを実行し結果を取得する（データ取得系）
+        同じクエリを複数のパラメーターで実行し、まとめて1回のトランザクションでコミットする（変更系）
+
+        Args:
+            query (str): 実行するクエリ (プレースホルダーは %s)
+            params_seq: パラメーターの一覧
+
+        Returns:
+            int: 変更した行数
+
+        Raises:
+            Exception: クエリの実行に失敗した場合 (変更は全て取り消される)
         """
+        statement = self.statements.get(query)
+        started = time.perf_counter()
+        failed = True
         try:
             if self.use_postgres:
                 with self.pool.connection() as conn:
                     with conn.cursor() as cursor:
-                        cursor.execute(query, params)
-                        result = cursor.fetchall()
-                        logger.info("Query fetched successfully (PostgreSQL).")
-                        return result
+                        cursor.executemany(statement.sql, params_seq)
+                        rowcount = cursor.rowcount
             else:
-                query = query.replace("%s", "?")
-                cursor = self.connection.cursor()
-                cursor.execute(query, params or [])
-                result = cursor.fetchall()
-                logger.info("Query fetched successfully (SQLite).")
-                # self.close_connection()
-                return result
+                with self.connection as connection:
+                    rowcount = connection.executemany(statement.sql, params_seq).rowcount
+            failed = False
+            return rowcount
         except Exception as error:
-            logger.error(f"Error fetching query: {error}")
+            logger.error(f"Error executing query: {error}")
+            raise error
+        finally:
+            self.statements.record(statement, time.perf_counter() - started, failed)
+
+    def bulk_insert(self, table: str, columns: list[str], rows) -> int:
+        """
+        複数の行を1回のトランザクションで追加する
+
+        PostgreSQLでは COPY で送信し、SQLiteでは executemany でまとめて追加する。
+        1行ずつ execute_query() で追加する場合と異なり、コミット(ディスクへの同期)は最後の1回だけになる。
+
+        Args:
+            table (str): 追加先のテーブル名
+            columns (list[str]): 値を指定する列名 (指定しない列は既定値になる)
+            rows: 各行の値 (columns と同じ順のタプル) の一覧
+
+        Returns:
+            int: 追加した行数
+
+        Raises:
+            Exception: 追加に失敗した場合 (追加は全て取り消される)
+        """
+        if not self.use_postgres:
+            placeholders = ", ".join(["%s"] * len(columns))
+            column_names = ", ".join(f'"{column}"' for column in columns)
+            return self.execute_many(f'INSERT INTO "{table}" ({column_names}) VALUES ({placeholders})', rows)
+        copy = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+        count = 0
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    with cursor.copy(copy) as writer:
+                        for row in rows:
+                            writer.write_row(row)
+                            count += 1
+        except Exception as error:
+            logger.error(f"Error copying rows: {error}")
             raise error
+        return count
+
+    def query_stats(self) -> list[Statement]:
+        """
+        SQL文ごとの実行回数と処理時間を、処理時間の合計が長い順に返す
+        """
+        return self.statements.stats()
 
     def close_connection(self):
         """
@@ -101,9 +397,9 @@ class DatabaseHandler:
         if self.use_postgres:
             self.pool.close()
             logger.info("PostgreSQL connection pool is closed.")
-        elif self.connection:
-            self.connection.close()
-            logger.info("SQLite connection is closed.")
+        else:
+            self.sqlite_pool.close()
+            logger.info("SQLite connection pool is closed.")
 
 
 if __name__ == "__main__":
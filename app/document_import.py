@@ -0,0 +1,133 @@
+# Markdownのファイルをドキュメントとしてまとめてデータベースに登録するモジュール
+import argparse
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.db_conn import DatabaseHandler
+from app.settings import load_settings
+
+logger = logging.getLogger(__name__)
+
+# 一度に登録するドキュメントの数
+DEFAULT_BATCH_SIZE = 500
+
+
+@dataclass
+class ImportReport:
+    """
+    ドキュメントの登録結果
+
+    Attributes:
+        documents (int): 登録したドキュメントの数
+        bytes (int): 登録した本文のバイト数
+        seconds (float): 処理時間(秒)
+        skipped (list[str]): 読み込めなかったファイル
+    """
+    documents: int
+    bytes: int
+    seconds: float
+    skipped: list[str]
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.documents} documents, {self.bytes / 1024**2:.1f} MiB in {self.seconds:.2f}s "
+            f"({self.documents_per_second:.0f} documents/s), skipped {len(self.skipped)}"
+        )
+
+
+def read_markdown(file_path: Path) -> tuple[str, str]:
+    """
+    Markdownのファイルからタイトルと本文を読み込む
+
+    タイトルは最初の見出し(# で始まる行)とし、見出しがない場合はファイル名(拡張子を除く)とする。
+
+    Returns:
+        tuple[str, str]: タイトルと本文
+    """
+    content = file_path.read_text(encoding="utf-8")
+    for line in content.splitlines():
+        if line.startswith("#"):
+            title = line.lstrip("#").strip()
+            if title:
+                return title, content
+    return file_path.stem, content
+
+
+def find_markdown(directory: Path) -> list[Path]:
+    """
+    ディレクトリ以下のMarkdownのファイルを、パスの順に返す
+    """
+    return sorted(path for path in directory.rglob("*.md") if path.is_file())
+
+
+def _batches(rows: Iterator[tuple[str, str]], batch_size: int) -> Iterator[list[tuple[str, str]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_documents(db: DatabaseHandler, files: list[Path], batch_size: int = DEFAULT_BATCH_SIZE) -> ImportReport:
+    """
+    Markdownのファイルをドキュメントとして登録する
+
+    batch_size 件ごとに DatabaseHandler.bulk_insert() で1回のトランザクションとして登録する
+    (PostgreSQLでは COPY、SQLiteでは executemany)。
+
+    Args:
+        db (DatabaseHandler): 登録先のデータベース
+        files (list[Path]): 登録するMarkdownのファイル
+        batch_size (int): 一度に登録するドキュメントの数
+
+    Raises:
+        Exception: 登録に失敗した場合 (失敗したバッチの登録は取り消される)
+    """
+    started = time.perf_counter()
+    skipped: list[str] = []
+    total_bytes = 0
+
+    def rows() -> Iterator[tuple[str, str]]:
+        nonlocal total_bytes
+        for file_path in files:
+            try:
+                title, content = read_markdown(file_path)
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"ファイルを読み込めませんでした: {file_path} {e}")
+                skipped.append(str(file_path))
+                continue
+            total_bytes += len(content.encode("utf-8"))
+            yield title, content
+
+    count = 0
+    for batch in _batches(rows(), batch_size):
+        count += db.bulk_insert("documents", ["title", "content"], batch)
+        logger.info(f"ドキュメントを登録しました: {count}/{len(files)}")
+    return ImportReport(count, total_bytes, time.perf_counter() - started, skipped)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ディレクトリ以下のMarkdownのファイルをドキュメントとして登録する")
+    parser.add_argument("directory", type=Path, help="Markdownのファイルがあるディレクトリ (例: db/postgres/init)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="一度に登録するドキュメントの数")
+    args = parser.parse_args()
+
+    files = find_markdown(args.directory)
+    if not files:
+        parser.exit(1, f"Markdownのファイルがありません: {args.directory}\n")
+    db = DatabaseHandler(load_settings())
+    try:
+        report = import_documents(db, files, args.batch_size)
+    finally:
+        db.close_connection()
+    print(report)
@@ -0,0 +1,206 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.db_conn import DatabaseHandler
+
+logger = logging.getLogger(__name__)
+
+# サイドバーに一度に読み込むドキュメントの数
+DEFAULT_PAGE_SIZE = 50
+# 検索結果の数
+DEFAULT_SEARCH_LIMIT = 20
+# 検索結果の抜粋で、一致した部分を囲む文字列 (Markdownの太字)
+HIGHLIGHT = ("**", "**")
+# 抜粋の、一致した部分の前後の文字数
+SNIPPET_CONTEXT = 30
+# SQLiteのtrigramの索引で検索できる最短の文字数 (短い語は LIKE で検索する)
+# (FTS5の snippet() の抜粋の長さも、trigramでは1文字が1トークンになるため SNIPPET_CONTEXT の2倍にする)
+TRIGRAM_LENGTH = 3
+
+
+@dataclass
+class DocumentPage:
+    """
+    ドキュメントの一覧の1ページ
+
+    Attributes:
+        documents (list[tuple[int, str]]): (document_id, title) の一覧
+        next_cursor (int | None): 次のページを読み込むときに渡すカーソル。最後のページの場合はNone
+    """
+    documents: list[tuple[int, str]]
+    next_cursor: int | None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+
+@dataclass
+class SearchResult:
+    """
+    ドキュメントの検索結果
+
+    Attributes:
+        document_id (int): ドキュメントのID
+        title (str): タイトル
+        snippet (str): 一致した部分の前後の抜粋 (一致した部分は HIGHLIGHT で囲む)
+        rank (float): 関連度 (大きいほど関連が高い)
+    """
+    document_id: int
+    title: str
+    snippet: str
+    rank: float
+
+
+def split_terms(query: str) -> list[str]:
+    """
+    検索語を空白(全角を含む)で区切る
+    """
+    return [term for term in re.split(r"\s+", query.strip()) if term]
+
+
+def _like_pattern(term: str) -> str:
+    """
+    LIKE で部分一致を検索するパターン (% と _ はそのままの文字として扱う)
+    """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def make_snippet(text: str, terms: list[str], context: int = SNIPPET_CONTEXT) -> str:
+    """
+    text のうち最初に一致した検索語の前後 context 文字を抜き出し、一致した部分を HIGHLIGHT で囲む
+    """
+    text = " ".join((text or "").split())
+    lowered = text.lower()
+    positions = [(lowered.find(term.lower()), term) for term in terms]
+    positions = [(position, term) for position, term in positions if position >= 0]
+    if not positions:
+        return text[:context * 2] + ("…" if len(text) > context * 2 else "")
+    position, term = min(positions)
+    start = max(0, position - context)
+    end = min(len(text), position + len(term) + context)
+    excerpt = text[start:end]
+    pattern = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    excerpt = re.sub(f"({pattern})", rf"{HIGHLIGHT[0]}\1{HIGHLIGHT[1]}", excerpt, flags=re.IGNORECASE)
+    return ("…" if start > 0 else "") + excerpt + ("…" if end < len(text) else "")
+
+
+class DocumentStore:
+    """
+    documents テーブルのドキュメントを一覧・検索するクラス
+
+    一覧は document_id の順に、前のページの最後の document_id より後の行を LIMIT 件だけ読み込む
+    (キーセットページネーション)。主キーの索引をそのまま辿るため、OFFSET と異なり
+    何ページ目でも読み込む行数は1ページ分だけになる。
+
+    検索は DatabaseHandler.migrate() で作成する全文検索の索引を使う。
+    SQLiteでは FTS5 (trigram) の documents_fts、PostgreSQLでは tsvector と pg_trgm のGIN索引を使う。
+    """
+
+    def __init__(self, db: "DatabaseHandler"):
+        self.db = db
+
+    def list_page(self, after: int | None = None, limit: int = DEFAULT_PAGE_SIZE) -> DocumentPage:
+        """
+        ドキュメントの一覧を1ページ分返す
+
+        Args:
+            after (int | None): 前のページの DocumentPage.next_cursor。Noneの場合は最初のページ
+            limit (int): 1ページのドキュメントの数
+        """
+        # 次のページがあるかを調べるために1件多く読み込む
+        if after is None:
+            rows = self.db.fetch_query(
+                "SELECT document_id, title FROM documents ORDER BY document_id ASC LIMIT %s;", (limit + 1,)
+            )
+        else:
+            rows = self.db.fetch_query(
+                "SELECT document_id, title FROM documents WHERE document_id > %s ORDER BY document_id ASC LIMIT %s;",
+                (after, limit + 1),
+            )
+        documents = [(row[0], row[1]) for row in rows[:limit]]
+        next_cursor = documents[-1][0] if len(rows) > limit else None
+        return DocumentPage(documents, next_cursor)
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[SearchResult]:
+        """
+        ドキュメントを全文検索し、関連の高い順に返す
+
+        検索語を空白で区切った場合は、全ての語を含むドキュメントを返す。
+        語は部分一致で検索するため、日本語の文章も単語に区切らずに検索できる。
+
+        Args:
+            query (str): 検索語
+            limit (int): 返す検索結果の最大の数
+        """
+        terms = split_terms(query)
+        if not terms:
+            return []
+        if self.db.use_postgres:
+            return self._search_postgres(terms, limit)
+        if any(len(term) >= TRIGRAM_LENGTH for term in terms):
+            return self._search_fts(terms, limit)
+        return self._search_like(terms, limit)
+
+    def _search_fts(self, terms: list[str], limit: int) -> list[SearchResult]:
+        """
+        SQLiteの FTS5 の索引で検索する
+
+        trigram の長さ以上の語を索引で検索し、短い語はその結果を LIKE で絞り込む。
+        """
+        long_terms = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+        short_terms = [term for term in terms if len(term) < TRIGRAM_LENGTH]
+        # 各語を引用符で囲んだフレーズにする (記号をFTS5の演算子として扱わないため)
+        match = " AND ".join('"{}"'.format(term.replace('"', '""')) for term in long_terms)
+        condition = "".join(
+            " AND (documents_fts.title LIKE %s ESCAPE '\\' OR documents_fts.content LIKE %s ESCAPE '\\')"
+            for _ in short_terms
+        )
+        patterns = [pattern for term in short_terms for pattern in [_like_pattern(term)] * 2]
+        rows = self.db.fetch_query(
+            "SELECT rowid, title, snippet(documents_fts, -1, %s, %s, '…', %s), bm25(documents_fts, 10.0, 1.0) "
+            f"FROM documents_fts WHERE documents_fts MATCH %s{condition} "
+            "ORDER BY bm25(documents_fts, 10.0, 1.0) LIMIT %s;",
+            (*HIGHLIGHT, SNIPPET_CONTEXT * 2, match, *patterns, limit),
+        )
+        # bm25() は関連が高いほど小さい(負の)値になる
+        return [SearchResult(row[0], row[1], row[2], -row[3]) for row in rows]
+
+    def _search_like(self, terms: list[str], limit: int) -> list[SearchResult]:
+        """
+        LIKE で検索する (全ての語が trigram の索引で検索できない短い語の場合)
+        """
+        condition = " AND ".join(["(title LIKE %s ESCAPE '\\' OR content LIKE %s ESCAPE '\\')"] * len(terms))
+        patterns = [pattern for term in terms for pattern in [_like_pattern(term)] * 2]
+        rows = self.db.fetch_query(
+            f"SELECT document_id, title, content FROM documents WHERE {condition} "
+            "ORDER BY updated_at DESC, document_id DESC LIMIT %s;",
+            (*patterns, limit),
+        )
+        return [
+            SearchResult(row[0], row[1], make_snippet(row[2], terms), float(sum(term in row[1] for term in terms)))
+            for row in rows
+        ]
+
+    def _search_postgres(self, terms: list[str], limit: int) -> list[SearchResult]:
+        """
+        PostgreSQLで検索する
+
+        空白で区切った単語は tsvector の索引、日本語などの部分一致は pg_trgm の索引で検索し、
+        単語の一致度(ts_rank)とタイトルの類似度(similarity)の和を関連度とする。
+        """
+        query = " ".join(terms)
+        condition = " AND ".join(["(title ILIKE %s ESCAPE '\\' OR content ILIKE %s ESCAPE '\\')"] * len(terms))
+        patterns = [pattern for term in terms for pattern in [_like_pattern(term)] * 2]
+        rows = self.db.fetch_query(
+            "SELECT document_id, title, content, "
+            "ts_rank(search_vector, plainto_tsquery('simple', %s)) + similarity(title, %s) AS rank "
+            f"FROM documents WHERE search_vector @@ plainto_tsquery('simple', %s) OR ({condition}) "
+            "ORDER BY rank DESC, document_id DESC LIMIT %s;",
+            (query, query, query, *patterns, limit),
+        )
+        return [SearchResult(row[0], row[1], make_snippet(row[2], terms), float(row[3])) for row in rows]
@@ -12,10 +12,11 @@ from flet import (
 from app.db_conn import DatabaseHandler
 from app.logging_config import setup_logging
 from app.settings import load_settings
-from app.unity_conn import SocketServer
+from app.unity_conn import ServerSettings, SocketServer
 from app.views import MyView
 
-server = SocketServer()
+# 既存の設定ファイルにunity_settingsがない場合はSocketServerの既定値を使用する
+server = SocketServer(ServerSettings(**(load_settings("unity_settings") or {})))
 server_thread = threading.Thread(target=server.start, daemon=True)
 server_thread.start()
 
@@ -15,9 +15,46 @@ DEFAULT_SETTINGS = {
             "password": "postgres",
         },
         "sqlite_settings": {
-            "database": "main_db.db"
+            "database": "main_db.db",
+            "pragmas": {
+                "journal_mode": "wal",
+                "synchronous": "normal",
+                "cache_size": -16000,
+                "mmap_size": 268435456,
+            },
+            "busy_timeout": 5.0,
         },
     },
+    "unity_settings": {
+        "host": "0.0.0.0",
+        "port": 8765,
+        "protocol": "text",
+        "command_timeout": 10.0,
+        "use_sendfile": True,
+        "chunk_size": 1048576,
+        "resumable": False,
+        "resume_timeout": 30.0,
+        "compression": ["zstd", "zlib"],
+        "asset_manifest": "unity_assets.json",
+        "max_transfers": 3,
+        "heartbeat_interval": 5.0,
+        "heartbeat_timeout": 15.0,
+        "keepalive_idle": 10,
+        "keepalive_interval": 5,
+        "keepalive_count": 3,
+        "reconnect_grace": 5.0,
+        "validate_splats": True,
+        "splat_compression": None,
+        "splat_cache_dir": "assets/uploads/.cache",
+        "splat_cache_size": 10 * 1024**3,
+        "splat_tile_size": None,
+        "splat_workers": 2,
+        "splat_job_memory": 4 * 1024**3,
+        "lod_fractions": [0.05, 0.25, 1.0],
+        "scene_dir": "assets/scenes",
+        "prefetch_radius": 1,
+        "delta_updates": True,
+    },
     "llm_settings": {
         "llm_provider": "azure",
         "embedding_provider": "azure",
@@ -48,7 +85,9 @@ def load_settings(return_custom: str = None):
     except FileNotFoundError:
         with open("local.settings.json", "w") as f:
             json.dump(DEFAULT_SETTINGS, f, indent=4)
-        return settings
+        if return_custom:
+            return DEFAULT_SETTINGS.get(return_custom)
+        return DEFAULT_SETTINGS
     except Exception as e:
         print(f"Error loading settings: {e}")
         return {}
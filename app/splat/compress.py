@@ -0,0 +1,347 @@
+import logging
+import math
+import os
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+import numpy as np
+
+from app.splat.ply import QUANTIZE_COMMENT, PlyError, PlyHeader, open_vertices, read_header, validate_splat_header
+
+logger = logging.getLogger(__name__)
+
+# ビット数 -> PLYの型名
+QUANTIZED_TYPES = {8: "uchar", 16: "ushort"}
+# ビット数 -> NumPyの型
+QUANTIZED_DTYPES = {8: "<u1", 16: "<u2"}
+
+
+@dataclass
+class SplatCompressionOptions:
+    """
+    3D Gaussian SplattingのPLYを圧縮する設定
+
+    Attributes:
+        min_opacity (float): これ未満の不透明度(シグモイド適用後)のGaussianを削除する
+        sh_degree (int | None): SHの次数の上限。Noneの場合は元の次数のまま
+        position_bits (int): 位置(x, y, z)のビット数
+        scale_bits (int): スケール(scale_*)のビット数
+        rotation_bits (int): 回転(rot_*、正規化したクォータニオン)のビット数
+        opacity_bits (int): 不透明度のビット数
+        color_bits (int): 基本色(f_dc_*)のビット数
+        sh_bits (int): SH係数(f_rest_*)のビット数
+        block_size (int): 一度に処理する頂点数 (メモリ使用量の上限を決める)
+    """
+    min_opacity: float = 0.005
+    sh_degree: int | None = None
+    position_bits: int = 16
+    scale_bits: int = 16
+    rotation_bits: int = 8
+    opacity_bits: int = 8
+    color_bits: int = 8
+    sh_bits: int = 8
+    block_size: int = 262_144
+
+
+@dataclass
+class Quantization:
+    bits: int
+    # "linear" または "sigmoid" (不透明度はシグモイドを適用した値を量子化し、復元時にロジットに戻す)
+    transform: str
+    low: float
+    high: float
+
+    @property
+    def levels(self) -> int:
+        return (1 << self.bits) - 1
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        if self.transform == "sigmoid":
+            values = _sigmoid(values)
+        span = self.high - self.low
+        scaled = (values - self.low) / span if span > 0 else np.zeros_like(values)
+        return np.clip(np.rint(scaled * self.levels), 0, self.levels).astype(QUANTIZED_DTYPES[self.bits])
+
+    def decode(self, quantized: np.ndarray, transformed: bool = False) -> np.ndarray:
+        """
+        量子化した値を復元する
+
+        Args:
+            quantized (np.ndarray): 量子化した値
+            transformed (bool): Trueの場合は変換(シグモイド)を戻さずに返す
+        """
+        values = self.low + quantized.astype(np.float32) / self.levels * (self.high - self.low)
+        if self.transform == "sigmoid" and not transformed:
+            values = np.clip(values, 1e-6, 1 - 1e-6)
+            values = np.log(values / (1 - values))
+        return values.astype(np.float32)
+
+
+@dataclass
+class CompressionReport:
+    """
+    圧縮の結果 (サイズと、量子化による誤差をプロパティのグループごとに記録する)
+    """
+    input_vertices: int
+    output_vertices: int
+    input_bytes: int
+    output_bytes: int
+    sh_degree: int
+    elapsed: float = 0.0
+    # グループ名 -> (RMSE, 最大誤差) (不透明度はシグモイド適用後の値で比較する)
+    errors: dict[str, tuple[float, float]] = field(default_factory=dict)
+
+    @property
+    def pruned(self) -> int:
+        return self.input_vertices - self.output_vertices
+
+    @property
+    def size_ratio(self) -> float:
+        """
+        圧縮後のサイズ / 元のサイズ
+        """
+        return self.output_bytes / self.input_bytes if self.input_bytes else 1.0
+
+    def __str__(self) -> str:
+        errors = ", ".join(
+            f"{group} rmse {rmse:.4g} max {max_error:.4g}" for group, (rmse, max_error) in self.errors.items()
+        )
+        return (
+            f"{self.input_bytes / 1024**2:.1f} MiB -> {self.output_bytes / 1024**2:.1f} MiB "
+            f"({self.size_ratio:.1%}), {self.pruned}/{self.input_vertices} pruned, "
+            f"SH degree {self.sh_degree}, {self.elapsed:.2f}s [{errors}]"
+        )
+
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-values))
+
+
+def _logit(value: float) -> float:
+    return math.log(value / (1 - value))
+
+
+def sh_rest_names(source_degree: int, target_degree: int) -> list[tuple[str, str]]:
+    """
+    SHの次数を下げたときに残す f_rest_* と、出力でのプロパティ名の対応
+
+    f_rest_* は色ごとに並んでいる (f_rest_[色 * 係数の数 + 係数]) ため、色ごとに先頭の係数を残して番号を振り直す。
+
+    Returns:
+        list[tuple[str, str]]: (元のプロパティ名, 出力のプロパティ名)
+    """
+    source_count = (source_degree + 1) ** 2 - 1
+    target_count = (target_degree + 1) ** 2 - 1
+    return [
+        (f"f_rest_{channel * source_count + k}", f"f_rest_{channel * target_count + k}")
+        for channel in range(3)
+        for k in range(target_count)
+    ]
+
+
+def read_quantization(header: PlyHeader) -> dict[str, Quantization]:
+    """
+    ヘッダーのコメントから、量子化したプロパティの復元方法を読み込む (量子化していない場合は空)
+    """
+    quantization = {}
+    for comment in header.comments:
+        words = comment.split()
+        if not words or words[0] != QUANTIZE_COMMENT:
+            continue
+        try:
+            name, bits, transform, low, high = words[1:]
+            quantization[name] = Quantization(int(bits), transform, float(low), float(high))
+        except ValueError as e:
+            raise PlyError(f"量子化の情報が不正です: {comment}") from e
+    return quantization
+
+
+def dequantize(block: np.ndarray, quantization: dict[str, Quantization]) -> dict[str, np.ndarray]:
+    """
+    量子化したPLYの頂点を float32 のプロパティごとの配列に復元する
+
+    Args:
+        block (np.ndarray): open_vertices() で開いた頂点 (の一部)
+        quantization (dict[str, Quantization]): read_quantization() の結果
+    """
+    return {
+        name: quantization[name].decode(block[name]) if name in quantization else block[name].astype(np.float32)
+        for name in block.dtype.names
+    }
+
+
+def _group(name: str) -> str:
+    if name in ("x", "y", "z"):
+        return "position"
+    if name == "opacity":
+        return "opacity"
+    return {"scale": "scale", "rot": "rotation", "f_dc": "color", "f_rest": "sh"}[name.rsplit("_", 1)[0]]
+
+
+def _normalized_rotation(block: np.ndarray) -> np.ndarray:
+    rotation = np.stack([block[f"rot_{i}"] for i in range(4)], axis=1).astype(np.float32)
+    norm = np.linalg.norm(rotation, axis=1, keepdims=True)
+    return rotation / np.where(norm > 0, norm, 1)
+
+
+def _output_columns(source_degree: int, sh_degree: int) -> list[tuple[str, str]]:
+    """
+    出力するプロパティ: (元のプロパティ名, 出力のプロパティ名)
+    """
+    columns = [(name, name) for name in ("x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2")]
+    columns += sh_rest_names(source_degree, sh_degree) if sh_degree else []
+    columns += [
+        (name, name) for name in ("opacity", "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3")
+    ]
+    return columns
+
+
+def _scan_ranges(blocks: Iterator[np.ndarray],
+                 columns: list[tuple[str, str]]) -> tuple[int, dict[str, float], dict[str, float]]:
+    """
+    1回目の走査: 残す頂点数と、各プロパティの範囲 (回転と不透明度は範囲が決まっているため除く)
+    """
+    kept = 0
+    low = {source: np.inf for source, _ in columns}
+    high = {source: -np.inf for source, _ in columns}
+    for block in blocks:
+        kept += len(block)
+        if not len(block):
+            continue
+        for source, _ in columns:
+            if source.startswith("rot_") or source == "opacity":
+                continue
+            low[source] = min(low[source], float(block[source].min()))
+            high[source] = max(high[source], float(block[source].max()))
+    return kept, low, high
+
+
+def _quantization(columns: list[tuple[str, str]], bits: dict[str, int], low: dict[str, float],
+                  high: dict[str, float]) -> dict[str, Quantization]:
+    quantization = {}
+    for source, target in columns:
+        group_bits = bits[_group(source)]
+        if source.startswith("rot_"):
+            quantization[target] = Quantization(group_bits, "linear", -1.0, 1.0)
+        elif source == "opacity":
+            quantization[target] = Quantization(group_bits, "sigmoid", 0.0, 1.0)
+        else:
+            quantization[target] = Quantization(group_bits, "linear", low[source], high[source])
+    return quantization
+
+
+def _compressed_header(source_path: str, quantization: dict[str, Quantization], vertex_count: int) -> bytes:
+    lines = ["ply", "format binary_little_endian 1.0", f"comment compressed from {os.path.basename(source_path)}"]
+    lines += [
+        f"comment {QUANTIZE_COMMENT} {target} {q.bits} {q.transform} {q.low!r} {q.high!r}"
+        for target, q in quantization.items()
+    ]
+    lines.append(f"element vertex {vertex_count}")
+    lines += [f"property {QUANTIZED_TYPES[q.bits]} {target}" for target, q in quantization.items()]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def _write_quantized(f: BinaryIO, blocks: Iterator[np.ndarray], columns: list[tuple[str, str]],
+                     quantization: dict[str, Quantization]) -> dict[str, tuple[float, float]]:
+    """
+    2回目の走査: 量子化して書き込み、復元した値との誤差をグループごとに集計する
+
+    Returns:
+        dict[str, tuple[float, float]]: グループ名 -> (RMSE, 最大誤差)
+    """
+    dtype = np.dtype([(target, QUANTIZED_DTYPES[q.bits]) for target, q in quantization.items()])
+    squared: dict[str, float] = {}
+    counts: dict[str, int] = {}
+    max_error: dict[str, float] = {}
+    for block in blocks:
+        if not len(block):
+            continue
+        rotation = _normalized_rotation(block)
+        out = np.empty(len(block), dtype=dtype)
+        for source, target in columns:
+            q = quantization[target]
+            values = rotation[:, int(source[-1])] if source.startswith("rot_") else block[source]
+            out[target] = q.encode(values)
+            original = _sigmoid(values) if q.transform == "sigmoid" else values
+            error = np.abs(q.decode(out[target], transformed=True) - original)
+            group = _group(source)
+            squared[group] = squared.get(group, 0.0) + float(np.square(error, dtype=np.float64).sum())
+            counts[group] = counts.get(group, 0) + len(error)
+            max_error[group] = max(max_error.get(group, 0.0), float(error.max()))
+        out.tofile(f)
+    return {group: (math.sqrt(squared[group] / counts[group]), max_error[group]) for group in counts}
+
+
+def compress_splat(source_path: str, output_path: str, options: SplatCompressionOptions | None = None,
+                   progress: Callable[[int, int], None] | None = None) -> CompressionReport:
+    """
+    3D Gaussian SplattingのPLYを、不透明度の低いGaussianの削除・SHの次数の削減・量子化で圧縮する
+
+    出力はPLYのまま各プロパティを uchar / ushort に量子化し、復元に必要な範囲をヘッダーのコメント
+    (comment quantize <名前> <ビット数> <変換> <最小値> <最大値>) に記録する。法線(nx, ny, nz)は出力しない。
+
+    頂点はメモリマップしたファイルから block_size 件ずつ処理するため、メモリ使用量はファイルサイズによらない。
+    1回目の走査で残す頂点数と各プロパティの範囲を求め、2回目の走査で量子化して書き込む。
+
+    Args:
+        source_path (str): 元のPLYファイルのパス
+        output_path (str): 圧縮したPLYファイルの出力先
+        options (SplatCompressionOptions | None): 圧縮の設定
+        progress (Callable[[int, int], None] | None): 進捗 (処理した頂点数, 2回の走査の合計頂点数)
+            を受け取るコールバック
+
+    Raises:
+        PlyError: 元のファイルが3D Gaussian SplattingのPLYでない、またはすでに量子化されている場合
+    """
+    options = options or SplatCompressionOptions()
+    started = time.perf_counter()
+    header = read_header(source_path)
+    if read_quantization(header):
+        raise PlyError(f"すでに量子化されたPLYです: {source_path}")
+    info = validate_splat_header(header, os.path.getsize(source_path))
+    vertices = open_vertices(source_path, header)
+    sh_degree = info.sh_degree if options.sh_degree is None else min(options.sh_degree, info.sh_degree)
+
+    bits = {
+        "position": options.position_bits, "scale": options.scale_bits, "rotation": options.rotation_bits,
+        "opacity": options.opacity_bits, "color": options.color_bits, "sh": options.sh_bits,
+    }
+    for group_bits in bits.values():
+        if group_bits not in QUANTIZED_TYPES:
+            raise ValueError(f"量子化のビット数は {list(QUANTIZED_TYPES)} のいずれかを指定してください: {group_bits}")
+    columns = _output_columns(info.sh_degree, sh_degree)
+    min_opacity_logit = _logit(min(max(options.min_opacity, 1e-6), 1 - 1e-6))
+
+    def blocks(scan: int) -> Iterator[np.ndarray]:
+        for start in range(0, info.vertex_count, options.block_size):
+            block = vertices[start:start + options.block_size]
+            yield block[block["opacity"] >= min_opacity_logit]
+            if progress:
+                progress(scan * info.vertex_count + start + len(block), 2 * info.vertex_count)
+
+    kept, low, high = _scan_ranges(blocks(0), columns)
+    if not kept:
+        raise PlyError(f"不透明度が {options.min_opacity} 以上のGaussianがありません: {source_path}")
+    quantization = _quantization(columns, bits, low, high)
+
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_compressed_header(source_path, quantization, kept))
+            errors = _write_quantized(f, blocks(1), columns, quantization)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        # 書き込みの途中で失敗した場合は、作成途中のファイルを残さない
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    report = CompressionReport(
+        info.vertex_count, kept, info.file_size, os.path.getsize(output_path), sh_degree,
+        time.perf_counter() - started, errors,
+    )
+    logger.info(f"PLYを圧縮しました: {os.path.basename(source_path)} {report}")
+    return report
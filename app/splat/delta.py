@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.splat.ply import read_header
+from app.unity.transfer import file_digest
+
+logger = logging.getLogger(__name__)
+
+# 差分ファイルの先頭 (この後にJSONの1行と、追加するデータが続く)
+DELTA_MAGIC = b"splat-delta 1\n"
+# ブロックの平均・最小・最大の頂点数 (平均は2の累乗)
+DEFAULT_AVERAGE_ROWS = 256
+DEFAULT_MIN_ROWS = 64
+DEFAULT_MAX_ROWS = 1024
+# 境界を決めるハッシュの元にする、頂点の先頭のバイト数と、ハッシュの乗数
+_FINGERPRINT_BYTES = 8
+_FINGERPRINT_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class DeltaError(ValueError):
+    """
+    差分を作成・適用できない場合の例外 (PLYの形式が異なる、元のファイルが一致しないなど)
+    """
+
+
+@dataclass
+class DeltaInfo:
+    """
+    作成した差分の概要
+
+    Attributes:
+        base_digest (str): 差分の元になるファイル(Displayが保持しているもの)のダイジェスト
+        target_digest (str): 差分を適用して得られるファイルのダイジェスト
+        target_size (int): 差分を適用して得られるファイルのバイト数
+        patch_size (int): 差分ファイルのバイト数
+        copied_bytes (int): 元のファイルからコピーするバイト数
+        added_bytes (int): 差分ファイルで送信するバイト数
+        blocks (int): 新しいファイルのブロックの数
+        changed_blocks (int): 元のファイルにないブロックの数
+    """
+    base_digest: str
+    target_digest: str
+    target_size: int
+    patch_size: int
+    copied_bytes: int
+    added_bytes: int
+    blocks: int
+    changed_blocks: int
+
+    @property
+    def ratio(self) -> float:
+        """
+        差分ファイルのサイズの、新しいファイル全体に対する割合
+        """
+        return self.patch_size / self.target_size if self.target_size else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.changed_blocks}/{self.blocks} blocks changed, {self.patch_size / 1024**2:.1f} MiB / "
+            f"{self.target_size / 1024**2:.1f} MiB ({self.ratio:.1%})"
+        )
+
+
+def _vertex_rows(file_path: str) -> tuple[int, np.ndarray]:
+    """
+    PLYの vertex の開始位置と、頂点ごとの生のバイト列 (頂点数 x 1頂点のバイト数) のメモリマップを返す
+    """
+    header = read_header(file_path)
+    vertex = header.element("vertex")
+    offset = header.element_offset("vertex")
+    stride = vertex.dtype(header.byte_order).itemsize
+    if vertex.has_list or offset + vertex.count * stride > os.path.getsize(file_path):
+        raise DeltaError(f"差分を作成できないPLYです: {os.path.basename(file_path)}")
+    if not vertex.count:
+        return offset, np.zeros((0, stride), dtype=np.uint8)
+    return offset, np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(vertex.count, stride))
+
+
+def block_boundaries(rows: np.ndarray, average: int = DEFAULT_AVERAGE_ROWS, minimum: int = DEFAULT_MIN_ROWS,
+                     maximum: int = DEFAULT_MAX_ROWS, block_size: int = 1_048_576) -> list[int]:
+    """
+    頂点の内容からブロックの境界を決める (各ブロックの終わりの頂点番号の一覧)
+
+    境界は頂点の先頭8バイト(座標)のハッシュで決めるため、頂点を追加・削除しても
+    その前後のブロックの境界だけが変わり、それ以外のブロックは同じ内容のまま残る。
+
+    Args:
+        rows (np.ndarray): 頂点ごとの生のバイト列
+        average (int): ブロックの平均の頂点数 (2の累乗)
+        minimum (int): ブロックの最小の頂点数
+        maximum (int): ブロックの最大の頂点数
+        block_size (int): 一度にハッシュを計算する頂点数
+    """
+    count = len(rows)
+    mask = np.uint64(average - 1)
+    candidates = []
+    for start in range(0, count, block_size):
+        head = np.ascontiguousarray(rows[start:start + block_size, :_FINGERPRINT_BYTES])
+        if head.shape[1] < _FINGERPRINT_BYTES:
+            head = np.pad(head, ((0, 0), (0, _FINGERPRINT_BYTES - head.shape[1])))
+        fingerprints = (head.view("<u8")[:, 0] * _FINGERPRINT_MULTIPLIER) >> np.uint64(32)
+        candidates.append(np.flatnonzero((fingerprints & mask) == 0) + start + 1)
+    boundaries = []
+    last = 0
+    for candidate in np.concatenate(candidates).tolist() if candidates else []:
+        while candidate - last > maximum:
+            last += maximum
+            boundaries.append(last)
+        if candidate - last >= minimum:
+            boundaries.append(candidate)
+            last = candidate
+    while count - last > maximum:
+        last += maximum
+        boundaries.append(last)
+    if last < count:
+        boundaries.append(count)
+    return boundaries
+
+
+def _block_hashes(rows: np.ndarray, boundaries: list[int]) -> list[bytes]:
+    hashes = []
+    start = 0
+    for end in boundaries:
+        hashes.append(hashlib.blake2b(rows[start:end], digest_size=16).digest())
+        start = end
+    return hashes
+
+
+def _append_op(ops: list[list], kind: str, position: int, length: int) -> None:
+    """
+    操作を追加する (直前の同じ種類の操作と連続する場合はまとめる)
+    """
+    if ops[-1][0] == kind and ops[-1][1] + ops[-1][2] == position:
+        ops[-1][2] += length
+    else:
+        ops.append([kind, position, length])
+
+
+def _delta_ops(base_path: str, target_path: str,
+               progress: Callable[[int, int], None] | None) -> tuple[list[list], int, int]:
+    """
+    新しいファイルを作る操作の一覧を返す (データの位置は新しいファイル内の位置)
+
+    Returns:
+        tuple[list[list], int, int]: (操作の一覧, 新しいファイルのブロックの数, 元のファイルにないブロックの数)
+    """
+    base_offset, base_rows = _vertex_rows(base_path)
+    target_offset, target_rows = _vertex_rows(target_path)
+    if base_rows.shape[1] != target_rows.shape[1]:
+        raise DeltaError(
+            f"頂点の形式が異なるため差分を作成できません: {base_rows.shape[1]} != {target_rows.shape[1]} bytes"
+        )
+    stride = target_rows.shape[1]
+    base_boundaries = block_boundaries(base_rows)
+    base_blocks: dict[bytes, int] = {}
+    start = 0
+    for block_hash, end in zip(_block_hashes(base_rows, base_boundaries), base_boundaries, strict=True):
+        base_blocks.setdefault(block_hash, start)
+        start = end
+
+    target_size = os.path.getsize(target_path)
+    target_end = target_offset + len(target_rows) * stride
+    ops: list[list] = [["data", 0, target_offset]]
+    boundaries = block_boundaries(target_rows)
+    changed = 0
+    start = 0
+    for i, end in enumerate(boundaries):
+        block_hash = hashlib.blake2b(target_rows[start:end], digest_size=16).digest()
+        length = (end - start) * stride
+        if (base_row := base_blocks.get(block_hash)) is not None:
+            _append_op(ops, "copy", base_offset + base_row * stride, length)
+        else:
+            changed += 1
+            _append_op(ops, "data", target_offset + start * stride, length)
+        start = end
+        if progress:
+            progress(i + 1, len(boundaries))
+    if target_end < target_size:
+        ops.append(["data", target_end, target_size - target_end])
+    return ops, len(boundaries), changed
+
+
+def build_delta(base_path: str, target_path: str, output_path: str,
+                progress: Callable[[int, int], None] | None = None) -> DeltaInfo:
+    """
+    base_path (Displayが保持している版) から target_path (新しい版) を作る差分ファイルを作成する
+
+    両方のPLYの頂点を内容で決めたブロックに分け、ハッシュが一致するブロックは元のファイルからのコピー、
+    一致しないブロック(変更・追加された頂点)とヘッダーはデータとして差分ファイルに書き込む。
+    削除された頂点のブロックは参照しないだけなので、差分ファイルには含まれない。
+
+    差分ファイルは DELTA_MAGIC、操作の一覧のJSON(1行)、追加するデータの順に書き込む。
+    操作は ["copy", 元のファイルの位置, バイト数] または ["data", データの位置, バイト数] で、
+    順に連結すると新しいファイルになる。
+
+    Args:
+        base_path (str): 元のPLYファイルのパス
+        target_path (str): 新しいPLYファイルのパス
+        output_path (str): 差分ファイルの出力先
+        progress (Callable[[int, int], None] | None): 進捗 (処理したブロック数, 全体のブロック数) を受け取るコールバック
+
+    Raises:
+        DeltaError: 頂点の形式(1頂点のバイト数)が異なるなど、差分を作成できない場合
+    """
+    started = time.perf_counter()
+    ops, blocks, changed = _delta_ops(base_path, target_path, progress)
+    target_size = os.path.getsize(target_path)
+
+    # データの位置を、新しいファイル内の位置から差分ファイル内の位置に置き換える
+    sources = []
+    data_offset = 0
+    for op in ops:
+        if op[0] == "data":
+            sources.append((op[1], op[2]))
+            op[1] = data_offset
+            data_offset += op[2]
+    base_digest = file_digest(base_path)
+    target_digest = file_digest(target_path)
+    manifest = {"base": base_digest, "target": target_digest, "size": target_size, "ops": ops}
+    tmp_path = f"{output_path}.tmp"
+    with open(target_path, "rb") as src, open(tmp_path, "wb") as f:
+        f.write(DELTA_MAGIC)
+        f.write(json.dumps(manifest, separators=(",", ":")).encode("ascii") + b"\n")
+        for position, length in sources:
+            src.seek(position)
+            f.write(src.read(length))
+    os.replace(tmp_path, output_path)
+
+    info = DeltaInfo(
+        base_digest, target_digest, target_size, os.path.getsize(output_path),
+        sum(op[2] for op in ops if op[0] == "copy"), data_offset, blocks, changed,
+    )
+    logger.info(
+        f"差分を作成しました: {os.path.basename(target_path)} {info} ({time.perf_counter() - started:.2f}s)"
+    )
+    return info
+
+
+def read_delta(patch_path: str) -> tuple[dict, int]:
+    """
+    差分ファイルの操作の一覧と、追加するデータの開始位置を返す
+
+    Raises:
+        DeltaError: 差分ファイルでない場合
+    """
+    with open(patch_path, "rb") as f:
+        if f.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise DeltaError(f"差分ファイルではありません: {os.path.basename(patch_path)}")
+        try:
+            manifest = json.loads(f.readline())
+        except ValueError as e:
+            raise DeltaError(f"差分ファイルが壊れています: {os.path.basename(patch_path)}") from e
+        return manifest, f.tell()
+
+
+def apply_delta(base_path: str, patch_path: str, output_path: str) -> str:
+    """
+    差分ファイルを元のファイルに適用して新しいファイルを作成し、そのダイジェストを返す (受信側の処理)
+
+    Args:
+        base_path (str): 元のファイルのパス
+        patch_path (str): build_delta() で作成した差分ファイルのパス
+        output_path (str): 新しいファイルの出力先
+
+    Raises:
+        DeltaError: 元のファイルが差分の作成時と異なる場合、または適用した結果が一致しない場合
+    """
+    manifest, data_start = read_delta(patch_path)
+    if file_digest(base_path) != manifest["base"]:
+        raise DeltaError(f"差分の元のファイルが一致しません: {os.path.basename(base_path)}")
+    tmp_path = f"{output_path}.tmp"
+    hasher = hashlib.sha256()
+    try:
+        with open(base_path, "rb") as base, open(patch_path, "rb") as patch, open(tmp_path, "wb") as f:
+            for kind, position, length in manifest["ops"]:
+                source = base if kind == "copy" else patch
+                source.seek(position if kind == "copy" else data_start + position)
+                remaining = length
+                while remaining > 0:
+                    data = source.read(min(remaining, 1024 * 1024))
+                    if not data:
+                        raise DeltaError(f"差分ファイルが壊れています: {os.path.basename(patch_path)}")
+                    hasher.update(data)
+                    f.write(data)
+                    remaining -= len(data)
+        if hasher.hexdigest() != manifest["target"]:
+            raise DeltaError(f"差分を適用した結果が一致しません: {os.path.basename(output_path)}")
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return manifest["target"]
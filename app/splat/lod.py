@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from app.splat.compress import dequantize, read_quantization
+from app.splat.ply import PlyHeader, open_vertices, read_header, validate_splat_header
+from app.splat.tiling import is_tiled, read_tiles, tile_splat
+from app.unity.transfer import file_digest
+
+logger = logging.getLogger(__name__)
+
+# 各LODに含めるGaussianの累積の割合 (重要度の高い順。最後は必ず1.0)
+DEFAULT_LOD_FRACTIONS = [0.05, 0.25, 1.0]
+LOD_MANIFEST = "lod.json"
+
+
+@dataclass
+class LodTier:
+    level: int
+    file_name: str
+    vertex_count: int
+    # このLODまでを合わせたGaussianの割合
+    fraction: float
+
+
+@dataclass
+class LodSet:
+    """
+    1つのシーンから作成したLODの一覧
+
+    tiers[0] が最も粗いLODで、以降のLODは前のLODに含まれないGaussianだけを含む差分になる。
+    全てのLODを合わせると元のシーンと同じGaussianになる。
+    Gaussianが1つも振り分けられなかったLODは tiers に含めないため、level は連続しない場合がある。
+    """
+    source_digest: str
+    directory: str
+    tiers: list[LodTier] = field(default_factory=list)
+    # 作成時に指定した累積の割合 (空のLODを除く前のもの。再利用できるかの判定に使う)
+    fractions: list[float] = field(default_factory=list)
+
+    def paths(self) -> list[str]:
+        """
+        送信する順(粗い順)のLODファイルのパス
+        """
+        return [os.path.join(self.directory, tier.file_name) for tier in self.tiers]
+
+    def save(self) -> None:
+        # ディレクトリごと移動・コピーできるように、保存先のパスは記録しない
+        data = {
+            "source_digest": self.source_digest,
+            "fractions": self.fractions,
+            "tiers": [asdict(tier) for tier in self.tiers],
+        }
+        with open(os.path.join(self.directory, LOD_MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, directory: str) -> "LodSet | None":
+        try:
+            with open(os.path.join(directory, LOD_MANIFEST), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        tiers = [LodTier(**tier) for tier in data["tiers"]]
+        return cls(data["source_digest"], directory, tiers, data.get("fractions", [tier.fraction for tier in tiers]))
+
+
+def lod_directory(source_path: str) -> str:
+    """
+    LODを保存するディレクトリ (元のファイルと同じ場所の <ファイル名>.lod)
+    """
+    return f"{source_path}.lod"
+
+
+def importance(block: np.ndarray, header: PlyHeader) -> np.ndarray:
+    """
+    Gaussianの重要度 (不透明度 x 体積)
+
+    3DGSのPLYでは不透明度はロジット、スケールは対数で保存されているため、
+    sigmoid(opacity) * exp(scale_0 + scale_1 + scale_2) を計算する。
+    """
+    quantization = read_quantization(header)
+    values = dequantize(block[["opacity", "scale_0", "scale_1", "scale_2"]], quantization) if quantization else block
+    opacity = 1.0 / (1.0 + np.exp(-values["opacity"].astype(np.float32)))
+    log_volume = values["scale_0"].astype(np.float32) + values["scale_1"] + values["scale_2"]
+    # 体積は桁が大きく変わるため、オーバーフローしないように対数のまま足し合わせる
+    return np.log(np.maximum(opacity, 1e-12)) + log_volume
+
+
+def build_lods(source_path: str, fractions: list[float] | None = None, block_size: int = 262_144,
+               directory: str | None = None, progress: Callable[[int, int], None] | None = None) -> LodSet:
+    """
+    シーンのPLYから重要度による間引きでLODを作成し、directory (既定では元のファイルと同じ場所) に保存する
+
+    重要度の高い順に fractions の割合ずつGaussianを振り分け、LODごとのPLYを作成する。
+    頂点数が少なく、丸めた結果Gaussianが1つも振り分けられないLODは作成しない。
+    各LODは元のPLYと同じ形式(量子化したPLYは量子化したまま)なので、そのまま検証・送信できる。
+    タイルに分割したPLYの場合は、各LODも元のPLYと同じタイルの大きさでタイルに分割する。
+    元のファイルの内容が変わっていなければ、前回作成したLODを再利用する。
+
+    Args:
+        source_path (str): 元のPLYファイルのパス
+        fractions (list[float] | None): 各LODまでに含めるGaussianの累積の割合
+        block_size (int): 一度に処理する頂点数
+        directory (str | None): LODの保存先。Noneの場合は lod_directory(source_path)
+        progress (Callable[[int, int], None] | None): 進捗 (書き込んだLODの数, LODの数) を受け取るコールバック
+
+    Raises:
+        PlyError: 元のファイルが3D Gaussian SplattingのPLYでない場合
+    """
+    fractions = sorted(set(fractions or DEFAULT_LOD_FRACTIONS) | {1.0})
+    directory = directory or lod_directory(source_path)
+    digest = file_digest(source_path)
+    cached = LodSet.load(directory)
+    if cached and cached.source_digest == digest and cached.fractions == fractions:
+        if all(os.path.exists(path) for path in cached.paths()):
+            return cached
+
+    started = time.perf_counter()
+    header = read_header(source_path)
+    info = validate_splat_header(header, os.path.getsize(source_path))
+    vertices = open_vertices(source_path, header)
+
+    # 重要度の順位からLODの境界となる値を求め、Gaussianごとに所属するLODを決める
+    scores = np.concatenate([
+        importance(vertices[start:start + block_size], header)
+        for start in range(0, info.vertex_count, block_size)
+    ])
+    order = np.argsort(-scores, kind="stable")
+    levels = np.empty(info.vertex_count, dtype=np.uint8)
+    start = 0
+    for level, fraction in enumerate(fractions):
+        end = max(start, min(info.vertex_count, round(info.vertex_count * fraction)))
+        levels[order[start:end]] = level
+        start = end
+    del scores, order
+    counts = np.bincount(levels, minlength=len(fractions))
+    tile_size = max(tile.count for tile in read_tiles(source_path, header)) if is_tiled(header) else None
+
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    lod_set = LodSet(digest, directory, fractions=fractions)
+    for level, fraction in enumerate(fractions):
+        if not counts[level]:
+            # 空のLODは送信しても表示が変わらないため、ファイルを作らない
+            if progress:
+                progress(level + 1, len(fractions))
+            continue
+        file_name = f"{stem}.lod{level}.ply"
+        # tile_splat() の一時ファイル (<出力先>.tmp) と重ならない名前にする
+        tmp_path = os.path.join(directory, f"{file_name}.part")
+        with open(tmp_path, "wb") as f:
+            f.write(_lod_header(source_path, header, int(counts[level])))
+            for start in range(0, info.vertex_count, block_size):
+                block = vertices[start:start + block_size]
+                block[levels[start:start + block_size] == level].tofile(f)
+        if tile_size:
+            # LODごとにタイルの索引を作り直す (元のタイルの範囲はLODの頂点番号と一致しないため)
+            tile_splat(tmp_path, os.path.join(directory, file_name), tile_size)
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, os.path.join(directory, file_name))
+        lod_set.tiers.append(LodTier(level, file_name, int(counts[level]), fraction))
+        if progress:
+            progress(level + 1, len(fractions))
+    lod_set.save()
+    logger.info(
+        f"LODを作成しました: {os.path.basename(source_path)} "
+        f"{[tier.vertex_count for tier in lod_set.tiers]} ({time.perf_counter() - started:.2f}s)"
+    )
+    return lod_set
+
+
+def _lod_header(source_path: str, header: PlyHeader, vertex_count: int) -> bytes:
+    """
+    LODのPLYのヘッダー (元のPLYのコメントとプロパティを引き継ぐ)
+
+    tile 要素は書き込まないため、タイルに分割したことを示すコメントは引き継がない。
+    """
+    vertex = header.element("vertex")
+    lines = ["ply", f"format {header.format} 1.0", f"comment lod of {os.path.basename(source_path)}"]
+    lines += [f"comment {comment}" for comment in header.comments if not comment.startswith("tiled from ")]
+    lines.append(f"element vertex {vertex_count}")
+    lines += [f"property {ply_type} {name}" for name, ply_type in vertex.properties]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
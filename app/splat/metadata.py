@@ -0,0 +1,67 @@
+import logging
+import os
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.splat.compress import read_quantization
+from app.splat.ply import open_vertices, read_header, validate_splat_header
+from app.unity.transfer import file_digest
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SceneMetadata:
+    """
+    シーン(3D Gaussian SplattingのPLY)のカタログに記録する情報
+    """
+    digest: str
+    file_name: str
+    byte_size: int
+    gaussian_count: int
+    sh_degree: int
+    bounds_min: tuple[float, float, float]
+    bounds_max: tuple[float, float, float]
+
+
+def read_metadata(file_path: str, block_size: int = 1_048_576,
+                  progress: Callable[[int, int], None] | None = None) -> SceneMetadata:
+    """
+    PLYのダイジェスト・頂点数・SHの次数・バウンディングボックスを求める
+
+    バウンディングボックスは座標だけを block_size 件ずつ読み出して求める。
+    量子化したPLYは、ヘッダーに記録された座標の範囲をそのまま使用する。
+
+    Args:
+        file_path (str): PLYファイルのパス
+        block_size (int): 一度に処理する頂点数
+        progress (Callable[[int, int], None] | None): 進捗 (処理した頂点数, 全体の頂点数) を受け取るコールバック
+
+    Raises:
+        PlyError: 3D Gaussian SplattingのPLYでない場合
+    """
+    header = read_header(file_path)
+    info = validate_splat_header(header, os.path.getsize(file_path))
+    quantization = read_quantization(header)
+    if all(axis in quantization for axis in ("x", "y", "z")):
+        bounds_min = tuple(quantization[axis].low for axis in ("x", "y", "z"))
+        bounds_max = tuple(quantization[axis].high for axis in ("x", "y", "z"))
+    else:
+        vertices = open_vertices(file_path, header)
+        low = np.full(3, np.inf)
+        high = np.full(3, -np.inf)
+        for start in range(0, info.vertex_count, block_size):
+            block = vertices[start:start + block_size]
+            for i, axis in enumerate(("x", "y", "z")):
+                low[i] = min(low[i], float(block[axis].min()))
+                high[i] = max(high[i], float(block[axis].max()))
+            if progress:
+                progress(start + len(block), info.vertex_count)
+        bounds_min = tuple(float(value) for value in low)
+        bounds_max = tuple(float(value) for value in high)
+    return SceneMetadata(
+        file_digest(file_path), os.path.basename(file_path), info.file_size, info.vertex_count, info.sh_degree,
+        bounds_min, bounds_max,
+    )
@@ -0,0 +1,274 @@
+import logging
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ヘッダーとして読み込む最大サイズ (これを超えても end_header がない場合はPLYではないとみなす)
+MAX_HEADER_SIZE = 64 * 1024
+
+# PLYの型名 -> NumPyの型
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+BYTE_ORDERS = {
+    "binary_little_endian": "<",
+    "binary_big_endian": ">",
+}
+
+# 3D Gaussian Splatting のPLYに必要なプロパティ (f_rest_* はSHの次数によって数が変わる)
+SPLAT_PROPERTIES = [
+    "x", "y", "z",
+    "f_dc_0", "f_dc_1", "f_dc_2",
+    "opacity",
+    "scale_0", "scale_1", "scale_2",
+    "rot_0", "rot_1", "rot_2", "rot_3",
+]
+# 量子化したプロパティ (app.splat.compress) の復元方法を記録するヘッダーのコメント
+# comment quantize <プロパティ名> <ビット数> <変換> <最小値> <最大値>
+QUANTIZE_COMMENT = "quantize"
+# SHの次数 -> f_rest_* の数 (色ごとに (次数+1)^2 - 1 個の係数)
+SH_REST_COUNTS = {3 * ((degree + 1) ** 2 - 1): degree for degree in range(4)}
+
+
+class PlyError(ValueError):
+    """
+    PLYファイルの形式が不正な場合、または3D Gaussian Splattingの形式に従っていない場合の例外
+    """
+
+
+@dataclass
+class PlyElement:
+    name: str
+    count: int
+    # (プロパティ名, PLYの型名)
+    properties: list[tuple[str, str]] = field(default_factory=list)
+    has_list: bool = False
+
+    def dtype(self, byte_order: str = "<") -> np.dtype:
+        """
+        要素1件分のNumPyの構造化型
+        """
+        if self.has_list:
+            raise PlyError(f"可変長のプロパティ(list)を含む要素はメモリマップできません: {self.name}")
+        return np.dtype([(name, byte_order + PLY_TYPES[ply_type]) for name, ply_type in self.properties])
+
+
+@dataclass
+class PlyHeader:
+    format: str
+    elements: list[PlyElement]
+    # ヘッダーのバイト数 (本体の開始位置)
+    header_size: int
+    comments: list[str] = field(default_factory=list)
+
+    @property
+    def byte_order(self) -> str:
+        if self.format not in BYTE_ORDERS:
+            raise PlyError(f"バイナリ形式ではないPLYには対応していません: {self.format}")
+        return BYTE_ORDERS[self.format]
+
+    def element(self, name: str) -> PlyElement:
+        for element in self.elements:
+            if element.name == name:
+                return element
+        raise PlyError(f"PLYに要素がありません: {name}")
+
+    def element_offset(self, name: str) -> int:
+        """
+        要素の本体の開始位置 (前にある要素の合計サイズ + ヘッダー)
+        """
+        offset = self.header_size
+        for element in self.elements:
+            if element.name == name:
+                return offset
+            offset += element.count * element.dtype(self.byte_order).itemsize
+        raise PlyError(f"PLYに要素がありません: {name}")
+
+    @property
+    def body_size(self) -> int:
+        return sum(element.count * element.dtype(self.byte_order).itemsize for element in self.elements)
+
+
+@dataclass
+class SplatInfo:
+    """
+    検証した3D Gaussian SplattingのPLYの情報
+    """
+    vertex_count: int
+    sh_degree: int
+    file_size: int
+    properties: list[str]
+
+
+def _add_property(element: PlyElement, line: str, words: list[str]) -> None:
+    """
+    ヘッダーの property の行を要素に追加する (リストのプロパティはリストの要素の型を記録し、has_list を設定する)
+    """
+    if words[1] == "list":
+        element.has_list = True
+        element.properties.append((words[4], words[3]))
+    elif words[1] in PLY_TYPES:
+        element.properties.append((words[2], words[1]))
+    else:
+        raise PlyError(f"未対応のプロパティの型です: {line}")
+
+
+def _header_lines(data: bytes) -> tuple[list[str], int]:
+    """
+    end_header の前までのヘッダーの行と、ヘッダーのバイト数を返す
+
+    コメントに含まれる end_header で終了しないように、1行ずつ end_header だけの行を探す。
+
+    Raises:
+        PlyError: data の範囲でヘッダーが終了していない場合
+    """
+    lines = []
+    position = 0
+    while (newline := data.find(b"\n", position)) != -1:
+        line = data[position:newline].decode("ascii", errors="replace").rstrip()
+        position = newline + 1
+        if line == "end_header":
+            return lines, position
+        lines.append(line)
+    raise PlyError("PLYのヘッダーが終了していません")
+
+
+def parse_header(data: bytes) -> PlyHeader:
+    """
+    PLYファイルの先頭のバイト列からヘッダーを解析する
+
+    Args:
+        data (bytes): ファイルの先頭 (end_header を含む範囲)
+
+    Raises:
+        PlyError: ヘッダーの形式が不正な場合
+    """
+    if not data.startswith(b"ply\n") and not data.startswith(b"ply\r\n"):
+        raise PlyError("PLYファイルではありません")
+    lines, header_size = _header_lines(data)
+
+    ply_format = None
+    elements: list[PlyElement] = []
+    comments: list[str] = []
+    for line in lines[1:]:
+        words = line.split()
+        if not words:
+            continue
+        try:
+            if words[0] == "format":
+                ply_format = words[1]
+            elif words[0] in ("comment", "obj_info"):
+                comments.append(line.partition(" ")[2])
+            elif words[0] == "element":
+                elements.append(PlyElement(words[1], int(words[2])))
+            elif words[0] == "property":
+                if not elements:
+                    raise PlyError(f"要素の前にプロパティがあります: {line}")
+                _add_property(elements[-1], line, words)
+        except (IndexError, ValueError) as e:
+            raise PlyError(f"PLYのヘッダーが不正です: {line}") from e
+    if ply_format is None:
+        raise PlyError("PLYのヘッダーに format がありません")
+    return PlyHeader(ply_format, elements, header_size, comments)
+
+
+def read_header(file_path: str) -> PlyHeader:
+    """
+    PLYファイルのヘッダーを読み込む (本体は読み込まない)
+
+    Args:
+        file_path (str): PLYファイルのパス
+    """
+    with open(file_path, "rb") as f:
+        data = f.read(MAX_HEADER_SIZE)
+    return parse_header(data)
+
+
+def open_vertices(file_path: str, header: PlyHeader | None = None) -> np.memmap:
+    """
+    PLYファイルの頂点(vertex)を、メモリに読み込まずに構造化配列としてメモリマップする
+
+    Args:
+        file_path (str): PLYファイルのパス
+        header (PlyHeader | None): 解析済みのヘッダー。Noneの場合は読み込む
+    """
+    header = header or read_header(file_path)
+    vertex = header.element("vertex")
+    return np.memmap(
+        file_path, dtype=vertex.dtype(header.byte_order), mode="r",
+        offset=header.element_offset("vertex"), shape=(vertex.count,),
+    )
+
+
+def validate_splat_header(header: PlyHeader, file_size: int) -> SplatInfo:
+    """
+    ヘッダーとファイルサイズから、3D Gaussian SplattingのPLYとして正しいかを検証する
+
+    ヘッダーだけで判定できるため、アップロード中のファイルにも使用できる。
+
+    Args:
+        header (PlyHeader): 解析済みのヘッダー
+        file_size (int): ファイル全体のサイズ
+
+    Raises:
+        PlyError: 必要なプロパティがない、型が float でない(量子化したプロパティを除く)、
+            頂点数とファイルサイズが合わない場合
+    """
+    vertex = header.element("vertex")
+    dtype = vertex.dtype(header.byte_order)
+    names = [name for name, _ in vertex.properties]
+    if missing := [name for name in SPLAT_PROPERTIES if name not in names]:
+        raise PlyError(f"3D Gaussian Splattingに必要なプロパティがありません: {', '.join(missing)}")
+    rest = [name for name in names if name.startswith("f_rest_")]
+    if len(rest) not in SH_REST_COUNTS:
+        raise PlyError(f"SH係数(f_rest_*)の数が不正です: {len(rest)}")
+    if rest != [f"f_rest_{i}" for i in range(len(rest))]:
+        raise PlyError("SH係数(f_rest_*)の番号が連続していません")
+    quantized = {
+        words[1] for words in map(str.split, header.comments) if len(words) > 1 and words[0] == QUANTIZE_COMMENT
+    }
+    if not_float := [name for name in SPLAT_PROPERTIES + rest if dtype[name].kind != "f" and name not in quantized]:
+        raise PlyError(f"浮動小数点数ではないプロパティがあります: {', '.join(not_float)}")
+    if vertex.count <= 0:
+        raise PlyError("頂点がありません")
+    expected = header.header_size + header.body_size
+    if file_size != expected:
+        raise PlyError(f"頂点数とファイルサイズが一致しません: {file_size} bytes (期待値 {expected} bytes)")
+    return SplatInfo(vertex.count, SH_REST_COUNTS[len(rest)], file_size, names)
+
+
+def validate_splat(file_path: str, sample_size: int = 1024) -> SplatInfo:
+    """
+    3D Gaussian SplattingのPLYファイルを送信前に検証する
+
+    ヘッダーとファイルサイズを検証した後、頂点を等間隔に sample_size 件だけ読み出して
+    値が有限であることを確認する。読み出すのはサンプルのページだけなので、
+    ファイルサイズによらず処理時間とメモリ使用量はほぼ一定になる。
+
+    Args:
+        file_path (str): PLYファイルのパス
+        sample_size (int): 値を確認する頂点の数
+
+    Raises:
+        PlyError: ファイルが3D Gaussian SplattingのPLYとして正しくない場合
+    """
+    header = read_header(file_path)
+    info = validate_splat_header(header, os.path.getsize(file_path))
+    vertices = open_vertices(file_path, header)
+    indices = np.linspace(0, info.vertex_count - 1, min(sample_size, info.vertex_count), dtype=np.int64)
+    sample = vertices[indices]
+    for name in SPLAT_PROPERTIES:
+        if not np.isfinite(sample[name]).all():
+            raise PlyError(f"有限でない値が含まれています: {name}")
+    logger.debug(f"PLYを検証しました: {file_path} ({info.vertex_count} vertices, SH degree {info.sh_degree})")
+    return info
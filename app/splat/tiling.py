@@ -0,0 +1,247 @@
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.splat.compress import read_quantization
+from app.splat.ply import PlyError, PlyHeader, open_vertices, read_header, validate_splat_header
+
+logger = logging.getLogger(__name__)
+
+# 1タイルに含めるGaussianの数の既定値
+DEFAULT_TILE_SIZE = 65_536
+# Mortonコードの1軸あたりのビット数 (3軸で63ビット)
+MORTON_BITS = 21
+# タイルの索引を保存するPLYの要素 (vertex の前に置き、ヘッダーの直後に読めるようにする)
+TILE_ELEMENT = "tile"
+TILE_PROPERTIES = [
+    ("start", "uint"), ("count", "uint"),
+    ("min_x", "float"), ("min_y", "float"), ("min_z", "float"),
+    ("max_x", "float"), ("max_y", "float"), ("max_z", "float"),
+]
+
+
+@dataclass
+class SplatTile:
+    """
+    空間的にまとまったGaussianの範囲 (タイル)
+
+    Attributes:
+        start (int): タイルの先頭の頂点番号
+        count (int): タイルに含まれる頂点数
+        bounds_min (tuple[float, float, float]): バウンディングボックスの最小値
+        bounds_max (tuple[float, float, float]): バウンディングボックスの最大値
+        offset (int): ファイル内のタイルの開始位置(バイト)
+        size (int): タイルのバイト数
+    """
+    start: int
+    count: int
+    bounds_min: tuple[float, float, float]
+    bounds_max: tuple[float, float, float]
+    offset: int
+    size: int
+
+    def intersects(self, bounds_min: tuple[float, float, float], bounds_max: tuple[float, float, float]) -> bool:
+        """
+        タイルのバウンディングボックスが指定した範囲と重なるか (カリングでタイルを飛ばす判定用)
+        """
+        return all(
+            low <= self_high and self_low <= high
+            for self_low, self_high, low, high in zip(
+                self.bounds_min, self.bounds_max, bounds_min, bounds_max, strict=True
+            )
+        )
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """
+    21ビットの整数の各ビットの間に2ビットずつ0を挟む (Mortonコードの1軸分)
+    """
+    v = values.astype(np.uint64) & np.uint64(0x1FFFFF)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_codes(x: np.ndarray, y: np.ndarray, z: np.ndarray,
+                 bounds_min: np.ndarray, bounds_max: np.ndarray) -> np.ndarray:
+    """
+    座標を範囲内で 2^21 段階に量子化し、3次元のMortonコード(Z-order)を計算する
+
+    Args:
+        x, y, z (np.ndarray): 座標
+        bounds_min (np.ndarray): 全体の最小値 (x, y, z)
+        bounds_max (np.ndarray): 全体の最大値 (x, y, z)
+
+    Returns:
+        np.ndarray: uint64のMortonコード (近い位置のGaussianほど近い値になる)
+    """
+    levels = (1 << MORTON_BITS) - 1
+    span = np.where(bounds_max > bounds_min, bounds_max - bounds_min, 1.0)
+    codes = np.zeros(len(x), dtype=np.uint64)
+    for axis, values in enumerate((x, y, z)):
+        scaled = (values.astype(np.float64) - bounds_min[axis]) / span[axis] * levels
+        quantized = np.clip(np.nan_to_num(scaled), 0, levels).astype(np.uint64)
+        codes |= _spread_bits(quantized) << np.uint64(axis)
+    return codes
+
+
+def morton_order(vertices: np.ndarray, block_size: int = 1_048_576) -> np.ndarray:
+    """
+    頂点をMortonコードの順に並べる順番を返す
+
+    座標だけを block_size 件ずつ読み出すため、メモリマップしたファイルでも他のプロパティは読み込まない。
+    """
+    count = len(vertices)
+    bounds_min = np.full(3, np.inf)
+    bounds_max = np.full(3, -np.inf)
+    for start in range(0, count, block_size):
+        block = vertices[start:start + block_size]
+        for axis, name in enumerate(("x", "y", "z")):
+            finite = block[name][np.isfinite(block[name])]
+            if len(finite):
+                bounds_min[axis] = min(bounds_min[axis], float(finite.min()))
+                bounds_max[axis] = max(bounds_max[axis], float(finite.max()))
+    bounds_min = np.where(np.isfinite(bounds_min), bounds_min, 0.0)
+    bounds_max = np.where(np.isfinite(bounds_max), bounds_max, 0.0)
+
+    codes = np.empty(count, dtype=np.uint64)
+    for start in range(0, count, block_size):
+        block = vertices[start:start + block_size]
+        codes[start:start + len(block)] = morton_codes(block["x"], block["y"], block["z"], bounds_min, bounds_max)
+    return np.argsort(codes, kind="stable")
+
+
+def tile_splat(source_path: str, output_path: str, tile_size: int = DEFAULT_TILE_SIZE,
+               progress: Callable[[int, int], None] | None = None) -> list[SplatTile]:
+    """
+    3D Gaussian SplattingのPLYをMortonコードの順に並べ替え、tile_size 件ずつのタイルに分けて保存する
+
+    出力はPLYのまま、vertex の前に tile 要素 (先頭の頂点番号・頂点数・バウンディングボックス) を追加する。
+    各タイルは vertex の連続した範囲なので、転送側はタイルごとに送信したり、範囲外のタイルを飛ばしたりできる。
+    vertex のプロパティとコメント(量子化の情報など)は元のPLYのまま引き継ぐ。
+    タイルのバウンディングボックスは、量子化したPLYでも復元した座標で記録する。
+
+    Args:
+        source_path (str): 元のPLYファイルのパス
+        output_path (str): 出力先のPLYファイルのパス
+        tile_size (int): 1タイルに含めるGaussianの数
+        progress (Callable[[int, int], None] | None): 進捗 (書き込んだ頂点数, 全体の頂点数) を受け取るコールバック
+
+    Raises:
+        PlyError: 元のファイルが3D Gaussian SplattingのPLYでない場合
+    """
+    started = time.perf_counter()
+    header = read_header(source_path)
+    info = validate_splat_header(header, os.path.getsize(source_path))
+    vertices = open_vertices(source_path, header)
+    # 量子化した座標も軸ごとに単調なので並べ替えはそのまま行い、タイルの範囲だけ元の座標に戻す
+    quantization = read_quantization(header)
+    order = morton_order(vertices)
+    sorted_at = time.perf_counter()
+
+    tile_count = -(-info.vertex_count // tile_size)
+    tile_dtype = np.dtype([(name, "<u4" if ply_type == "uint" else "<f4") for name, ply_type in TILE_PROPERTIES])
+    index = np.zeros(tile_count, dtype=tile_dtype)
+    vertex = header.element("vertex")
+    lines = ["ply", f"format {header.format} 1.0", f"comment tiled from {os.path.basename(source_path)}"]
+    lines += [f"comment {comment}" for comment in header.comments]
+    lines.append(f"element {TILE_ELEMENT} {tile_count}")
+    lines += [f"property {ply_type} {name}" for name, ply_type in TILE_PROPERTIES]
+    lines.append(f"element vertex {info.vertex_count}")
+    lines += [f"property {ply_type} {name}" for name, ply_type in vertex.properties]
+    lines.append("end_header")
+    if header.byte_order != "<":
+        # 索引はリトルエンディアンで書き込むため、頂点もリトルエンディアンに揃える
+        lines[1] = "format binary_little_endian 1.0"
+    header_bytes = ("\n".join(lines) + "\n").encode("ascii")
+    output_dtype = vertex.dtype("<")
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header_bytes)
+        # 索引は頂点を書き込みながら求めるため、先に領域だけ確保して最後に書き込む
+        index_offset = f.tell()
+        f.write(bytes(index.nbytes))
+        for i, start in enumerate(range(0, info.vertex_count, tile_size)):
+            # 並べ替えた順のまとまりを読み出す (ファイル上の位置順に読むとページの読み込みが少ない)
+            indices = order[start:start + tile_size]
+            by_position = np.argsort(indices)
+            tile = np.empty(len(indices), dtype=output_dtype)
+            tile[by_position] = vertices[indices[by_position]]
+            index[i]["start"] = start
+            index[i]["count"] = len(tile)
+            for name in ("x", "y", "z"):
+                extremes = np.array([tile[name].min(), tile[name].max()])
+                if name in quantization:
+                    extremes = quantization[name].decode(extremes)
+                index[i][f"min_{name}"] = extremes[0]
+                index[i][f"max_{name}"] = extremes[1]
+            tile.tofile(f)
+            if progress:
+                progress(start + len(tile), info.vertex_count)
+        f.seek(index_offset)
+        index.tofile(f)
+    os.replace(tmp_path, output_path)
+
+    tiles = read_tiles(output_path)
+    logger.info(
+        f"PLYをタイルに分割しました: {os.path.basename(source_path)} {info.vertex_count} vertices -> "
+        f"{len(tiles)} tiles (sort {sorted_at - started:.2f}s, total {time.perf_counter() - started:.2f}s)"
+    )
+    return tiles
+
+
+def read_tiles(file_path: str, header: PlyHeader | None = None) -> list[SplatTile]:
+    """
+    タイルに分割したPLYから、タイルの索引を読み込む (頂点は読み込まない)
+
+    Args:
+        file_path (str): tile_splat() で作成したPLYファイルのパス
+        header (PlyHeader | None): 解析済みのヘッダー。Noneの場合は読み込む
+
+    Raises:
+        PlyError: タイルの索引がない場合
+    """
+    header = header or read_header(file_path)
+    tile = header.element(TILE_ELEMENT)
+    vertex = header.element("vertex")
+    index = np.fromfile(
+        file_path, dtype=tile.dtype(header.byte_order), count=tile.count, offset=header.element_offset(TILE_ELEMENT)
+    )
+    vertex_offset = header.element_offset("vertex")
+    item_size = vertex.dtype(header.byte_order).itemsize
+    tiles = []
+    for row in index:
+        start, count = int(row["start"]), int(row["count"])
+        if start + count > vertex.count:
+            raise PlyError(f"タイルの範囲が頂点数を超えています: {start} + {count} > {vertex.count}")
+        tiles.append(SplatTile(
+            start, count,
+            (float(row["min_x"]), float(row["min_y"]), float(row["min_z"])),
+            (float(row["max_x"]), float(row["max_y"]), float(row["max_z"])),
+            vertex_offset + start * item_size, count * item_size,
+        ))
+    return tiles
+
+
+def is_tiled(header: PlyHeader) -> bool:
+    return any(element.name == TILE_ELEMENT for element in header.elements)
+
+
+if __name__ == "__main__":
+    # 500万個のGaussianの座標でMortonコードの計算と並べ替えの時間を計測する
+    count = 5_000_000
+    rng = np.random.default_rng(0)
+    positions = np.zeros(count, dtype=[("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+    for axis in ("x", "y", "z"):
+        positions[axis] = rng.normal(0, 10, count)
+    started = time.perf_counter()
+    order = morton_order(positions)
+    print(f"{count} splats: morton sort {time.perf_counter() - started:.2f}s")
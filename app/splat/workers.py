@@ -0,0 +1,278 @@
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any
+
+if sys.platform == "win32":
+    # Windowsには resource がないため、ワーカーのメモリ使用量は制限しない
+    resource = None
+else:
+    import resource
+
+logger = logging.getLogger(__name__)
+
+# ワーカープロセスから進捗を通知する最短の間隔(秒) (細かすぎる通知でキューが詰まらないようにする)
+PROGRESS_INTERVAL = 0.1
+
+
+class _WorkerState:
+    """
+    ワーカープロセス内の状態 (ワーカーの初期化時に設定する)
+
+    Attributes:
+        progress_queue (Any): 実行中のジョブの進捗の送信先
+    """
+    progress_queue: Any = None
+
+
+class JobState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class WorkerJob:
+    """
+    ワーカープロセスで実行するアセットの処理 (検証・圧縮・タイル分割・LODの作成など)
+    """
+    job_id: int
+    kind: str
+    file_name: str
+    state: JobState = JobState.QUEUED
+    done: int = 0
+    total: int = 0
+    queued_at: float = field(default_factory=time.perf_counter)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: Exception | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (JobState.DONE, JobState.FAILED)
+
+    @property
+    def progress(self) -> float:
+        """
+        進捗 (0.0 - 1.0)
+        """
+        return self.done / self.total if self.total else float(self.finished)
+
+
+# ジョブの状態や進捗が変わったときに呼ばれるコールバック (進捗を受け取るスレッドで呼ばれる)
+JobListener = Callable[[WorkerJob], None]
+
+
+def _init_worker(progress_queue: Any, memory_limit: int | None) -> None:
+    """
+    ワーカープロセスの初期化 (進捗の送信先と、メモリ使用量の上限を設定する)
+
+    上限は RLIMIT_DATA (ヒープと書き込み可能な匿名メモリ) に設定する。
+    PLYは読み込み専用でメモリマップするため、ファイルサイズが上限を超えていても処理できる。
+    """
+    _WorkerState.progress_queue = progress_queue
+    if not memory_limit:
+        return
+    if resource is None:
+        logger.warning("この環境ではワーカーのメモリ使用量の上限を設定できません")
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+    except (ValueError, OSError) as e:
+        logger.warning(f"ワーカーのメモリ使用量の上限を設定できませんでした: {e}")
+
+
+def _run_job(job_id: int, func: Callable[..., Any], args: tuple, kwargs: dict, with_progress: bool) -> Any:
+    """
+    ワーカープロセスでジョブを実行し、開始・進捗をキューで通知する
+    """
+    last_report = 0.0
+
+    def progress(done: int, total: int) -> None:
+        # PROGRESS_INTERVAL 秒ごと(と完了時)に通知する
+        nonlocal last_report
+        now = time.monotonic()
+        if done >= total or now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            _WorkerState.progress_queue.put((job_id, done, total))
+
+    _WorkerState.progress_queue.put((job_id, 0, 0))
+    if with_progress:
+        kwargs = {**kwargs, "progress": progress}
+    return func(*args, **kwargs)
+
+
+class SplatWorkerPool:
+    """
+    アセットの検証・変換をワーカープロセスで実行するクラス
+
+    PLYの処理は数GBのファイルで数十秒かかり、NumPyの処理中もGILを保持する時間があるため、
+    FletのUIやUnityとの通信と同じプロセスで実行すると画面が固まる。
+    ジョブは ProcessPoolExecutor で最大 max_workers 件まで並行に実行し、
+    各ワーカーのメモリ使用量を memory_limit バイトまでに制限する (超えた場合はジョブが MemoryError で失敗する)。
+
+    進捗はワーカーからキュー経由で受け取り、add_listener() で登録したコールバックに通知する。
+    プールは最初のジョブで作成し、ワーカーが異常終了した場合は作り直す。
+    """
+    # 一覧に残す完了済みのジョブの数
+    max_history = 50
+
+    def __init__(self, max_workers: int = 2, memory_limit: int | None = 4 * 1024**3):
+        self.max_workers = max_workers
+        self.memory_limit = memory_limit
+        self.jobs: dict[int, WorkerJob] = {}
+        self._job_ids = itertools.count(1)
+        self._listeners: list[JobListener] = []
+        self._lock = threading.Lock()
+        # 親プロセスのスレッド(イベントループなど)を引き継がないように、ワーカーは spawn で起動する
+        self._context = multiprocessing.get_context("spawn")
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self._progress_queue: Any = None
+        self._progress_thread: threading.Thread | None = None
+
+    def add_listener(self, listener: JobListener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: JobListener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, job: WorkerJob) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"ジョブの通知中にエラーが発生しました: {e}")
+
+    def submit(self, kind: str, file_name: str, func: Callable[..., Any], *args: Any,
+               with_progress: bool = False, **kwargs: Any) -> concurrent.futures.Future:
+        """
+        ジョブを追加し、結果を受け取るFutureを返す (ブロックしない)
+
+        Args:
+            kind (str): ジョブの種類 (表示用)
+            file_name (str): 処理するファイル名 (表示用)
+            func (Callable[..., Any]): ワーカーで実行する関数 (モジュールの最上位で定義したもの)
+            *args: func に渡す引数
+            with_progress (bool): func に progress=コールバック(処理済み, 全体) を渡して進捗を受け取るか
+            **kwargs: func に渡すキーワード引数
+        """
+        job = WorkerJob(next(self._job_ids), kind, os.path.basename(file_name))
+        with self._lock:
+            executor = self._ensure_executor()
+            self.jobs[job.job_id] = job
+            self._prune()
+        future = executor.submit(_run_job, job.job_id, func, args, kwargs, with_progress)
+        future.add_done_callback(lambda f: self._finish(job, f, executor))
+        self._notify(job)
+        return future
+
+    def run(self, kind: str, file_name: str, func: Callable[..., Any], *args: Any,
+            with_progress: bool = False, **kwargs: Any) -> Any:
+        """
+        ジョブを実行し、完了まで待って結果を返す (イベントループからは asyncio.to_thread で呼び出す)
+
+        Raises:
+            Exception: ジョブで発生した例外
+        """
+        return self.submit(kind, file_name, func, *args, with_progress=with_progress, **kwargs).result()
+
+    def shutdown(self) -> None:
+        """
+        ワーカープロセスを終了する (実行中のジョブの完了は待たない)
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._progress_queue is not None:
+                self._progress_queue.put(None)
+                self._progress_queue = None
+            # 終了処理でキューが閉じられた後に受信を続けないように、進捗を受け取るスレッドの終了を待つ
+            if self._progress_thread is not None and self._progress_thread is not threading.current_thread():
+                self._progress_thread.join(timeout=5)
+            self._progress_thread = None
+
+    def _ensure_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._progress_queue = self._context.Queue()
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=self._context,
+                initializer=_init_worker, initargs=(self._progress_queue, self.memory_limit),
+            )
+            self._progress_thread = threading.Thread(
+                target=self._receive_progress, args=(self._progress_queue,), daemon=True
+            )
+            self._progress_thread.start()
+            logger.info(f"アセット処理のワーカーを起動しました: {self.max_workers} workers")
+        return self._executor
+
+    def _receive_progress(self, progress_queue: Any) -> None:
+        """
+        ワーカーから届いた進捗をジョブに反映し、通知する (専用のスレッドで実行する)
+        """
+        while True:
+            try:
+                message = progress_queue.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            job_id, done, total = message
+            if (job := self.jobs.get(job_id)) is None or job.finished:
+                continue
+            if job.state == JobState.QUEUED:
+                job.state = JobState.RUNNING
+                job.started_at = time.perf_counter()
+            job.done, job.total = done, total
+            self._notify(job)
+
+    def _discard_executor(self, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """
+        ワーカーが異常終了したプールを破棄する (次のジョブで作り直す)
+
+        同じプールの複数のジョブが失敗を通知するため、既に作り直した新しいプールは破棄しない。
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            progress_queue, self._progress_queue = self._progress_queue, None
+            # 進捗を受け取るスレッドは、終了の通知(None)を受け取って終了する
+            self._progress_thread = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        progress_queue.put(None)
+
+    def _finish(self, job: WorkerJob, future: concurrent.futures.Future,
+                executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        job.finished_at = time.perf_counter()
+        error = concurrent.futures.CancelledError() if future.cancelled() else future.exception()
+        if error is None:
+            job.state = JobState.DONE
+            job.done = job.total
+        else:
+            job.state = JobState.FAILED
+            job.error = error
+            logger.error(f"アセットの処理に失敗しました: {job.kind} {job.file_name} {type(error).__name__}")
+            if isinstance(error, BrokenProcessPool):
+                # ワーカーが異常終了した(メモリ不足で強制終了された場合など)プールは使えないため、次のジョブで作り直す
+                self._discard_executor(executor)
+        self._notify(job)
+
+    def _prune(self) -> None:
+        """
+        完了したジョブのうち古いものを一覧から削除する
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job_id]
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class AssetManifest:
+    """
+    どのDisplayがどのアセット(ファイル内容のsha256ダイジェスト)を保持しているかを記録するクラス
+
+    送信時の判断はクライアントへの問い合わせ(HAVE)を正とし、このマニフェストはその結果を記録する。
+    path を指定した場合は変更のたびにJSONファイルへ保存し、サーバーを再起動しても引き継ぐ。
+    """
+    def __init__(self, path: str | None = None):
+        self.path = path
+        # display_id -> {ダイジェスト: ファイル名}
+        self._displays: dict[str, dict[str, str]] = {}
+        if path:
+            self.load()
+
+    def load(self) -> None:
+        """
+        マニフェストをファイルから読み込む (ファイルがない場合は空のまま)
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._displays = {display_id: dict(assets) for display_id, assets in json.load(f).items()}
+        except FileNotFoundError:
+            self._displays = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"アセットのマニフェストを読み込めませんでした: {self.path} {e}")
+            self._displays = {}
+
+    def save(self) -> None:
+        """
+        マニフェストをファイルに保存する (書き込み途中で壊れないように一時ファイルから置き換える)
+        """
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._displays, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"アセットのマニフェストを保存できませんでした: {self.path} {e}")
+
+    def has(self, display_id: str, digest: str) -> bool:
+        return digest in self._displays.get(display_id, {})
+
+    def add(self, display_id: str, digest: str, name: str) -> None:
+        """
+        Displayがアセットを保持していることを記録する
+
+        Args:
+            display_id (str): Displayの表示名
+            digest (str): アセットのsha256ダイジェスト
+            name (str): アセットのファイル名
+        """
+        assets = self._displays.setdefault(display_id, {})
+        if assets.get(digest) != name:
+            assets[digest] = name
+            self.save()
+
+    def discard(self, display_id: str, digest: str) -> None:
+        """
+        Displayがアセットを保持していないことを記録する
+        """
+        if self._displays.get(display_id, {}).pop(digest, None) is not None:
+            self.save()
+
+    def assets(self, display_id: str) -> dict[str, str]:
+        """
+        Displayが保持しているアセット (ダイジェスト -> ファイル名)
+        """
+        return dict(self._displays.get(display_id, {}))
+
+    def displays_with(self, digest: str) -> list[str]:
+        """
+        アセットを保持しているDisplayの一覧
+        """
+        return [display_id for display_id, assets in self._displays.items() if digest in assets]
@@ -0,0 +1,138 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.splat.metadata import SceneMetadata, read_metadata
+
+if TYPE_CHECKING:
+    from app.db_conn import DatabaseHandler
+    from app.unity_conn import SocketServer
+
+logger = logging.getLogger(__name__)
+
+ASSET_COLUMNS = (
+    "asset_id, digest, file_name, byte_size, gaussian_count, sh_degree, "
+    "min_x, min_y, min_z, max_x, max_y, max_z, variants, created_at"
+)
+
+
+@dataclass
+class SceneRecord:
+    """
+    カタログ(assetsテーブル)に記録したシーン
+    """
+    asset_id: int
+    digest: str
+    file_name: str
+    byte_size: int
+    gaussian_count: int
+    sh_degree: int
+    bounds_min: tuple[float, float, float]
+    bounds_max: tuple[float, float, float]
+    # 変換の種類ごとの概要 (SocketServer.prepare_splat_async() の結果)
+    variants: dict[str, Any] = field(default_factory=dict)
+    created_at: Any = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "SceneRecord":
+        try:
+            variants = json.loads(row[12] or "{}")
+        except ValueError:
+            variants = {}
+        return cls(
+            row[0], row[1].strip(), row[2], row[3], row[4], row[5],
+            (row[6], row[7], row[8]), (row[9], row[10], row[11]), variants, row[13],
+        )
+
+    def __str__(self) -> str:
+        variants = ", ".join(self.variants) or "なし"
+        return (
+            f"{self.file_name} ({self.gaussian_count:,} Gaussians, {self.byte_size / 1024**2:.1f} MiB, "
+            f"SH degree {self.sh_degree}, 変換: {variants})"
+        )
+
+
+class AssetCatalog:
+    """
+    アップロードしたシーンの情報を assets テーブルに記録し、一覧・検索するクラス
+
+    シーンの情報(ダイジェスト・サイズ・Gaussianの数・バウンディングボックス・SHの次数)と
+    作成した変換(LOD・タイル分割など)は取り込み時に一度だけ求めて記録するため、
+    一覧や選択のたびに数GBのファイルを読み直す必要はない。
+    """
+    def __init__(self, db: "DatabaseHandler", server: "SocketServer | None" = None):
+        self.db = db
+        self.server = server
+
+    def ingest(self, file_path: str) -> SceneRecord:
+        """
+        シーンを取り込み、カタログに記録する (ブロックするため、UIからは別スレッドで呼び出す)
+
+        情報の読み取りと変換はサーバーのワーカープロセスで実行する。
+
+        Args:
+            file_path (str): アップロードしたPLYファイルのパス
+
+        Raises:
+            PlyError: 3D Gaussian SplattingのPLYでない場合
+        """
+        if self.server is not None:
+            metadata = self.server.workers.run("scan", file_path, read_metadata, file_path, with_progress=True)
+            variants = self.server.submit(self.server.prepare_splat_async(file_path)).result()
+        else:
+            metadata = read_metadata(file_path)
+            variants = {}
+        record = self.record(metadata, variants)
+        logger.info(f"シーンをカタログに記録しました: {record}")
+        return record
+
+    def record(self, metadata: SceneMetadata, variants: dict[str, Any] | None = None) -> SceneRecord:
+        """
+        シーンの情報を記録する (同じダイジェストのシーンは上書きする)
+        """
+        params = (
+            metadata.digest, metadata.file_name, metadata.byte_size, metadata.gaussian_count, metadata.sh_degree,
+            *metadata.bounds_min, *metadata.bounds_max, json.dumps(variants or {}, ensure_ascii=False),
+        )
+        self.db.execute_query(
+            "INSERT INTO assets (digest, file_name, byte_size, gaussian_count, sh_degree, "
+            "min_x, min_y, min_z, max_x, max_y, max_z, variants) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+            "ON CONFLICT (digest) DO UPDATE SET file_name = excluded.file_name, variants = excluded.variants, "
+            "updated_at = CURRENT_TIMESTAMP;",
+            params,
+        )
+        record = self.get(metadata.digest)
+        if record is None:
+            raise RuntimeError(f"シーンをカタログに記録できませんでした: {metadata.file_name}")
+        return record
+
+    def get(self, digest: str) -> SceneRecord | None:
+        rows = self.db.fetch_query(f"SELECT {ASSET_COLUMNS} FROM assets WHERE digest = %s;", (digest,))
+        return SceneRecord.from_row(rows[0]) if rows else None
+
+    def list_scenes(self, limit: int = 50) -> list[SceneRecord]:
+        """
+        記録したシーンを新しい順に返す
+        """
+        rows = self.db.fetch_query(
+            f"SELECT {ASSET_COLUMNS} FROM assets ORDER BY created_at DESC, asset_id DESC LIMIT %s;", (limit,)
+        )
+        return [SceneRecord.from_row(row) for row in rows]
+
+    def find(self, name: str, limit: int = 20) -> list[SceneRecord]:
+        """
+        ファイル名が name で始まるシーンを返す
+
+        前方一致にすることで、ファイル名の索引 (db/*/migrate/2_assets.sql) で検索できる。
+        """
+        prefix = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self.db.fetch_query(
+            f"SELECT {ASSET_COLUMNS} FROM assets WHERE file_name LIKE %s ESCAPE '\\' ORDER BY file_name ASC LIMIT %s;",
+            (f"{prefix}%", limit),
+        )
+        return [SceneRecord.from_row(row) for row in rows]
+
+    def remove(self, digest: str) -> None:
+        self.db.execute_query("DELETE FROM assets WHERE digest = %s;", (digest,))
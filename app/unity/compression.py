@@ -0,0 +1,101 @@
+import logging
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstdはオプション (poetry install -E zstd。未インストールの場合はzlibのみ使用する)
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# サーバーが優先する圧縮方式の順序 (zstandardが未インストールの場合、zstdは合意の対象にならない)
+DEFAULT_ENCODINGS = ["zstd", "zlib"]
+# サンプルの圧縮後サイズがこの割合を超える場合は圧縮せずに送信する
+COMPRESSIBLE_RATIO = 0.9
+
+
+def available_encodings() -> list[str]:
+    """
+    この環境で使用できる圧縮方式
+    """
+    encodings = ["zlib"]
+    if zstandard is not None:
+        encodings.insert(0, "zstd")
+    return encodings
+
+
+def negotiate_encoding(preferred: list[str], offered: list[str]) -> str | None:
+    """
+    サーバーの優先順位とクライアントが対応する圧縮方式から、使用する方式を決める
+
+    Args:
+        preferred (list[str]): サーバーが優先する圧縮方式 (空の場合は圧縮しない)
+        offered (list[str]): クライアントが対応する圧縮方式
+
+    Returns:
+        str | None: 使用する圧縮方式 (共通の方式がない場合はNone)
+    """
+    available = available_encodings()
+    return next((e for e in preferred if e in offered and e in available), None)
+
+
+def is_compressible(sample: bytes, threshold: float = COMPRESSIBLE_RATIO) -> bool:
+    """
+    サンプルを高速な設定で圧縮し、圧縮する価値があるかを判定する
+
+    Args:
+        sample (bytes): ファイル先頭のチャンクなどのサンプル
+        threshold (float): 圧縮後サイズの割合の上限
+    """
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) <= len(sample) * threshold
+
+
+class ChunkEncoder:
+    """
+    チャンクをストリームとして圧縮するクラス
+
+    圧縮の辞書はチャンクをまたいで引き継ぎ、チャンクごとにフラッシュするため
+    受信側は届いたチャンクから順に展開できる。
+    encode() はスレッドから呼び出せるように、消費したCPU時間をスレッドごとに計測する。
+    """
+    def __init__(self, encoding: str, level: int | None = None):
+        self.encoding = encoding
+        self.cpu_seconds = 0.0
+        if encoding == "zstd":
+            if zstandard is None:
+                raise ValueError("zstandardがインストールされていません")
+            self._compressor = zstandard.ZstdCompressor(level=level if level is not None else 3).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        elif encoding == "zlib":
+            self._compressor = zlib.compressobj(level if level is not None else 6)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+        else:
+            raise ValueError(f"未対応の圧縮方式です: {encoding}")
+
+    def encode(self, data: bytes) -> bytes:
+        started = time.thread_time()
+        encoded = self._compressor.compress(data) + self._compressor.flush(self._flush_mode)
+        self.cpu_seconds += time.thread_time() - started
+        return encoded
+
+
+class ChunkDecoder:
+    """
+    ChunkEncoder で圧縮したチャンクを順に展開するクラス
+    """
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            if zstandard is None:
+                raise ValueError("zstandardがインストールされていません")
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        elif encoding == "zlib":
+            self._decompressor = zlib.decompressobj()
+        else:
+            raise ValueError(f"未対応の圧縮方式です: {encoding}")
+
+    def decode(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+from app.unity.transfer import file_digest
+
+if TYPE_CHECKING:
+    from app.unity_conn import SocketServer, UnitySession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlaylistScene:
+    """
+    プレイリストのシーン
+
+    Attributes:
+        name (str): シーンのファイル名
+        path (str): プレイリストが保持しているファイルのパス
+        digest (str): ファイル内容のsha256ダイジェスト
+    """
+    name: str
+    path: str
+    digest: str
+
+
+class ScenePlaylist:
+    """
+    Displayで次・前のシーンに切り替えるときの順番 (プレイリスト)
+
+    アップロードしたファイルは送信後に削除されるため、シーンのファイルは directory にコピーして保持する。
+    ファイル名は元のまま(ダイジェストごとのディレクトリに保存)にするため、変換のキャッシュや
+    Displayが保持しているアセットは、アップロード時に送信したものをそのまま使える。
+    一覧は directory/playlist.json に保存し、サーバーを再起動しても引き継ぐ。同じ内容のシーンは1つだけ保持する。
+
+    add() と remove() は他のスレッドから呼び出せる。
+    """
+    index_name = "playlist.json"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._scenes: list[PlaylistScene] = []
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._scenes)
+
+    def __getitem__(self, index: int) -> PlaylistScene:
+        return self._scenes[index]
+
+    @property
+    def scenes(self) -> list[PlaylistScene]:
+        return list(self._scenes)
+
+    def load(self) -> None:
+        """
+        プレイリストをファイルから読み込む (ファイルが残っていないシーンは除く)
+        """
+        path = os.path.join(self.directory, self.index_name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                scenes = [PlaylistScene(**scene) for scene in json.load(f)]
+        except FileNotFoundError:
+            scenes = []
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"プレイリストを読み込めませんでした: {path} {e}")
+            scenes = []
+        self._scenes = [scene for scene in scenes if os.path.isfile(scene.path)]
+
+    def save(self) -> None:
+        """
+        プレイリストをファイルに保存する (書き込み途中で壊れないように一時ファイルから置き換える)
+        """
+        path = os.path.join(self.directory, self.index_name)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([asdict(scene) for scene in self._scenes], f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"プレイリストを保存できませんでした: {path} {e}")
+
+    def add(self, file_path: str, digest: str | None = None) -> int:
+        """
+        シーンをプレイリストの最後に追加し、その番号を返す (同じ内容のシーンがある場合はその番号を返す)
+
+        Args:
+            file_path (str): シーンのファイルのパス (プレイリストの保存先にコピーする)
+            digest (str | None): ファイル内容のsha256ダイジェスト。Noneの場合は計算する
+        """
+        digest = digest or file_digest(file_path)
+        with self._lock:
+            if (index := self.index_of(digest)) is not None:
+                return index
+            name = os.path.basename(file_path)
+            scene_dir = os.path.join(self.directory, digest[:16])
+            os.makedirs(scene_dir, exist_ok=True)
+            path = os.path.join(scene_dir, name)
+            try:
+                # 同じファイルシステムであればコピーせずにハードリンクを作成する
+                os.link(file_path, path)
+            except OSError:
+                shutil.copyfile(file_path, path)
+            self._scenes.append(PlaylistScene(name, path, digest))
+            self.save()
+            logger.info(f"プレイリストにシーンを追加しました: {name} ({len(self._scenes)}番目)")
+            return len(self._scenes) - 1
+
+    def remove(self, index: int) -> None:
+        """
+        シーンをプレイリストから削除し、保持していたファイルを削除する
+        """
+        with self._lock:
+            scene = self._scenes.pop(index)
+            self.save()
+        shutil.rmtree(os.path.dirname(scene.path), ignore_errors=True)
+
+    def index_of(self, digest: str) -> int | None:
+        for index, scene in enumerate(self._scenes):
+            if scene.digest == digest:
+                return index
+        return None
+
+    def neighbors(self, index: int, radius: int) -> list[int]:
+        """
+        index の前後 radius 件のシーンの番号を、近い順(次、前、2つ次、...)に返す (端は反対側につながる)
+        """
+        neighbors: list[int] = []
+        for distance in range(1, radius + 1):
+            for step in (distance, -distance):
+                neighbor = (index + step) % len(self._scenes)
+                if neighbor != index and neighbor not in neighbors:
+                    neighbors.append(neighbor)
+        return neighbors
+
+
+@dataclass
+class PrefetchStats:
+    # 切り替え先のシーンを先読み済みだった回数と、そうでなかった回数
+    hits: int = 0
+    misses: int = 0
+    # 先読みしたシーンの数と送信したバイト数
+    prefetched: int = 0
+    prefetched_bytes: int = 0
+    # 切り替えなどで中断した先読みの数
+    cancelled: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"hits {self.hits}, misses {self.misses} ({self.hit_rate:.0%}), prefetched {self.prefetched} "
+            f"({self.prefetched_bytes / 1024**2:.1f} MiB), cancelled {self.cancelled}"
+        )
+
+
+class ScenePrefetcher:
+    """
+    プレイリストで表示中のシーンの前後を、Displayにバックグラウンドで先読みさせるクラス
+
+    次・前のシーンへの切り替え(navigate())はプレイリストのシーンを送信して行い、
+    切り替えが終わると前後 radius 件のシーンを先読みする。
+    先読みは "assets" と "prefetch" に対応したDisplayに、表示させずに保持だけさせる転送で行うため、
+    先読み済みのシーンへの切り替えは読み込みの指示(LOAD)だけで完了する。
+
+    先読みは優先度を低くし、UIからの転送(transfers)が実行中の間は待機する。
+    切り替えを行うと、そのDisplayの先読みは中断して切り替えを優先する
+    (中断した転送は分割転送の続きから再開されるため、送信済みの部分は無駄にならない)。
+
+    メソッドはサーバーのイベントループ上で呼び出す。
+    """
+    # UIからの転送が終わるのを確認する間隔(秒)
+    idle_interval = 0.2
+
+    def __init__(self, server: "SocketServer", playlist: ScenePlaylist, radius: int = 1):
+        self.server = server
+        self.playlist = playlist
+        self.radius = radius
+        self.stats = PrefetchStats()
+        # display_id -> 表示中のシーンの番号
+        self.positions: dict[str, int] = {}
+        # display_id -> 保持しているシーン(先読みまたは表示したもの)のダイジェスト
+        self.resident: dict[str, set[str]] = {}
+        # display_id -> 実行中の先読み
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def supports(session: "UnitySession") -> bool:
+        """
+        Displayが先読み(表示させずに保持だけさせる転送)に対応しているか
+        """
+        return {"assets", "prefetch"} <= session.capabilities
+
+    async def navigate(self, step: int, session_id: str | None = None, timeout: float | None = None) -> str:
+        """
+        プレイリストで step 件先(負の場合は前)のシーンに切り替える
+
+        プレイリストが空の場合や、Displayが先読みに対応していない(アセットとして受信できない)場合は、
+        これまで通りDisplayに next / previous コマンドを送信する。
+
+        Args:
+            step (int): 移動するシーンの数 (1: 次のシーン, -1: 前のシーン)
+            session_id (str | None): 切り替えるセッションID
+            timeout (float | None): 応答までの期限(秒)
+
+        Returns:
+            str: Displayの受信結果
+        """
+        session = self.server.get_session(session_id)
+        if not len(self.playlist) or not self.supports(session):
+            return await self.server.send_command_async("next" if step > 0 else "previous", session.session_id, timeout)
+        current = self.positions.get(session.display_id, -1 if step > 0 else 0)
+        return await self.show(current + step, session.session_id, timeout)
+
+    async def navigate_all(self, step: int, timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        接続中の全Displayのシーンを切り替える
+
+        Returns:
+            dict[str, str | Exception]: セッションIDごとの受信結果 (失敗した場合は例外)
+        """
+        session_ids = list(self.server.sessions)
+        results = await asyncio.gather(
+            *(self.navigate(step, session_id, timeout) for session_id in session_ids), return_exceptions=True
+        )
+        return dict(zip(session_ids, results, strict=True))
+
+    async def show(self, index: int, session_id: str | None = None, timeout: float | None = None) -> str:
+        """
+        プレイリストの index 番目のシーンを表示させ、前後のシーンの先読みを始める
+
+        Returns:
+            str: Displayの受信結果
+        """
+        session = self.server.get_session(session_id)
+        display_id = session.display_id
+        index %= len(self.playlist)
+        scene = self.playlist[index]
+        # 先読みの転送と帯域を取り合わないように、先に止める
+        await self.cancel(display_id)
+        resident = self.resident.setdefault(display_id, set())
+        hit = scene.digest in resident
+        if hit:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        started = time.perf_counter()
+        result = await self.server.send_file_async(scene.path, session.session_id, timeout)
+        resident.add(scene.digest)
+        self.positions[display_id] = index
+        logger.info(
+            f"シーンを切り替えました({display_id}): {scene.name} "
+            f"(先読み{'済み' if hit else 'なし'}, {time.perf_counter() - started:.2f}s) [{self.stats}]"
+        )
+        self.schedule(session)
+        return result
+
+    async def set_current(self, index: int) -> None:
+        """
+        接続中の全Displayが index 番目のシーンを表示していることを記録し、前後のシーンの先読みを始める
+        (プレイリストを使わずに送信したシーンを、プレイリストに追加した場合に呼び出す)
+        """
+        scene = self.playlist[index]
+        for session in list(self.server.sessions.values()):
+            self.positions[session.display_id] = index
+            self.resident.setdefault(session.display_id, set()).add(scene.digest)
+            self.schedule(session)
+
+    def schedule(self, session: "UnitySession") -> None:
+        """
+        表示中のシーンの前後の先読みを始める (実行中の先読みは中断する)
+        """
+        if self.radius <= 0 or not self.supports(session) or session.display_id not in self.positions:
+            return
+        if (task := self._tasks.pop(session.display_id, None)) is not None:
+            task.cancel()
+        self._tasks[session.display_id] = asyncio.ensure_future(self._prefetch(session))
+
+    async def cancel(self, display_id: str) -> None:
+        """
+        Displayの先読みを中断し、終わるまで待機する
+        """
+        task = self._tasks.pop(display_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _prefetch(self, session: "UnitySession") -> None:
+        """
+        表示中のシーンに近い順に、Displayが保持していないシーンを先読みさせる
+        """
+        display_id = session.display_id
+        resident = self.resident.setdefault(display_id, set())
+        for index in self.playlist.neighbors(self.positions[display_id], self.radius):
+            scene = self.playlist[index]
+            if session.closed:
+                return
+            if scene.digest in resident:
+                continue
+            sent = 0
+
+            def progress(done: int, total: int) -> None:
+                nonlocal sent
+                sent = done
+
+            try:
+                await self._wait_idle()
+                await self.server.send_file_async(scene.path, session.session_id, progress=progress, prefetch=True)
+            except asyncio.CancelledError:
+                self.stats.cancelled += 1
+                logger.info(f"シーンの先読みを中断しました({display_id}): {scene.name}")
+                raise
+            except Exception as e:
+                logger.warning(f"シーンを先読みできませんでした({display_id}): {scene.name} {e}")
+                continue
+            resident.add(scene.digest)
+            self.stats.prefetched += 1
+            self.stats.prefetched_bytes += sent
+            logger.info(f"シーンを先読みしました({display_id}): {scene.name} [{self.stats}]")
+
+    async def _wait_idle(self) -> None:
+        """
+        UIからの転送が実行中・待機中の間は待機する
+        """
+        while self.server.transfers.running or self.server.transfers.queued:
+            await asyncio.sleep(self.idle_interval)
@@ -0,0 +1,251 @@
+import logging
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass
+from enum import IntEnum
+
+logger = logging.getLogger(__name__)
+
+# バイナリフレームのバージョン (ヘッダーの形式を変更したら上げる)
+PROTOCOL_VERSION = 1
+# バイナリフレームの先頭2バイト (UTF-8の先頭バイトにならない値にしてテキスト形式と判別できるようにする)
+MAGIC = b"\xa7\x3d"
+# magic(2) / version(1) / type(1) / request_id(4) / payload length(4)
+HEADER = struct.Struct("!2sBBII")
+# 1メッセージの最大サイズ (ファイル本体はメッセージに含めず、ヘッダーの直後に送信する)
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """
+    受信したデータがプロトコルに従っていない場合の例外
+    """
+
+
+class MessageType(IntEnum):
+    HELLO = 1
+    COMMAND = 2
+    RESULT = 3
+    FILE = 4
+    CANCEL = 5
+    # 再開可能な分割転送 (UPLOAD -> CHUNK... -> UPLOAD_END)
+    UPLOAD = 6
+    CHUNK = 7
+    UPLOAD_END = 8
+    # コンテンツアドレスのアセット (HAVEで保持しているか問い合わせ、保持していればLOADで読み込ませる)
+    HAVE = 9
+    LOAD = 10
+    # 死活監視 (PINGを受け取った側は同じリクエストIDでPONGを返す)
+    PING = 11
+    PONG = 12
+
+
+@dataclass
+class Message:
+    type: MessageType
+    request_id: int | None
+    payload: bytes
+
+    @property
+    def text(self) -> str:
+        return self.payload.decode("utf-8", errors="replace")
+
+
+class LineDecoder:
+    """
+    テキスト形式 (<種別>:<リクエストID>:<内容>\\n) の受信データをメッセージに分割するクラス
+
+    受信データは再利用するbytearrayに追記し、前回探索した位置以降だけ改行を探すため、
+    長い行が細切れに届いても処理量は受信量に比例する。
+    改行単位でデコードするので、マルチバイト文字が受信の区切りで分割されても壊れない。
+
+    feed() で受信データを追加し、イテレートして完成したメッセージを1つずつ取り出す。
+    メッセージの後に生データ(ファイル本体)が続く場合は take() で取り出す。
+    """
+    max_line_size = 1024 * 1024
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+        self._scan_from = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        受信データを追加する
+
+        Args:
+            data (bytes): 受信データ
+        """
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._scan_from -= self._offset
+            self._offset = 0
+        self._buffer.extend(data)
+
+    def __iter__(self) -> Iterator[Message]:
+        while (message := self.next_message()) is not None:
+            yield message
+
+    def next_message(self) -> Message | None:
+        """
+        完成したメッセージを1つ取り出す (未完成の場合はNone)
+
+        Raises:
+            ProtocolError: 改行のない行が max_line_size を超えた場合
+        """
+        while (end := self._buffer.find(b"\n", max(self._offset, self._scan_from))) != -1:
+            line = self._buffer[self._offset:end].decode("utf-8", errors="replace").strip()
+            self._offset = end + 1
+            if line and (message := self._parse(line)) is not None:
+                return message
+        self._scan_from = len(self._buffer)
+        if self._scan_from - self._offset > self.max_line_size:
+            raise ProtocolError(f"行が長すぎます: {self._scan_from - self._offset} bytes")
+        return None
+
+    def take(self, size: int) -> bytes:
+        """
+        メッセージの後に続く生データを、受信済みのバッファから最大 size バイト取り出す
+
+        Args:
+            size (int): 取り出す最大バイト数
+        """
+        end = min(self._offset + size, len(self._buffer))
+        data = bytes(self._buffer[self._offset:end])
+        self._offset = end
+        return data
+
+    @staticmethod
+    def _parse(line: str) -> Message | None:
+        kind, _, rest = line.partition(":")
+        try:
+            message_type = MessageType[kind]
+        except KeyError:
+            logger.debug(f"不明なメッセージを受信しました: {line}")
+            return None
+        request_id, sep, body = rest.partition(":")
+        if sep and request_id.isdigit():
+            return Message(message_type, int(request_id), body.encode())
+        if rest.isdigit():
+            return Message(message_type, int(rest), b"")
+        # リクエストIDのない旧形式 (RESULT:<結果>)
+        return Message(message_type, None, rest.encode())
+
+
+class FrameDecoder:
+    """
+    バイナリ形式のフレームを受信データから取り出すクラス
+
+    フレームは HEADER (magic, version, type, request_id, length) とlengthバイトのペイロードで構成される。
+    受信データは再利用するbytearrayに追記し、memoryview上でヘッダーを解析する。
+    使い方は LineDecoder と同じ。
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        受信データを追加する
+
+        Args:
+            data (bytes): 受信データ
+        """
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer.extend(data)
+
+    def __iter__(self) -> Iterator[Message]:
+        while (message := self.next_message()) is not None:
+            yield message
+
+    def next_message(self) -> Message | None:
+        """
+        完成したフレームを1つ取り出す (未完成の場合はNone)
+
+        Raises:
+            ProtocolError: フレームの形式が不正な場合
+        """
+        with memoryview(self._buffer) as view:
+            while len(view) - self._offset >= HEADER.size:
+                magic, version, message_type, request_id, length = HEADER.unpack_from(view, self._offset)
+                if magic != MAGIC:
+                    raise ProtocolError(f"フレームの先頭が不正です: {magic!r}")
+                if version != PROTOCOL_VERSION:
+                    raise ProtocolError(f"未対応のプロトコルバージョンです: {version}")
+                if length > MAX_PAYLOAD_SIZE:
+                    raise ProtocolError(f"フレームが大きすぎます: {length} bytes")
+                start = self._offset + HEADER.size
+                if start + length > len(view):
+                    return None
+                self._offset = start + length
+                try:
+                    return Message(MessageType(message_type), request_id, bytes(view[start:start + length]))
+                except ValueError:
+                    logger.debug(f"不明なメッセージ種別を受信しました: {message_type}")
+        return None
+
+    def take(self, size: int) -> bytes:
+        """
+        フレームの後に続く生データを、受信済みのバッファから最大 size バイト取り出す
+
+        Args:
+            size (int): 取り出す最大バイト数
+        """
+        end = min(self._offset + size, len(self._buffer))
+        data = bytes(self._buffer[self._offset:end])
+        self._offset = end
+        return data
+
+
+class TextCodec:
+    """
+    テキスト形式 (<種別>:<リクエストID>:<内容>\\n) のエンコード・デコードを行うクラス
+
+    request_id が None の場合は、リクエストIDに対応していないクライアント向けの旧形式 (<種別>:<内容>\\n) にする。
+    """
+    name = "text"
+
+    def encode(self, message_type: MessageType, request_id: int | None, payload: bytes = b"") -> bytes:
+        if b"\n" in payload:
+            raise ValueError("テキスト形式のメッセージに改行は含められません")
+        if request_id is None:
+            return f"{message_type.name}:".encode() + payload + b"\n"
+        return f"{message_type.name}:{request_id}:".encode() + payload + b"\n"
+
+    def decoder(self) -> LineDecoder:
+        return LineDecoder()
+
+
+class BinaryCodec:
+    """
+    バイナリ形式 (HEADER + ペイロード) のエンコード・デコードを行うクラス
+    """
+    name = "binary"
+
+    def encode(self, message_type: MessageType, request_id: int, payload: bytes = b"") -> bytes:
+        if len(payload) > MAX_PAYLOAD_SIZE:
+            raise ValueError(f"メッセージが大きすぎます: {len(payload)} bytes")
+        return HEADER.pack(MAGIC, PROTOCOL_VERSION, message_type, request_id, len(payload)) + payload
+
+    def decoder(self) -> FrameDecoder:
+        return FrameDecoder()
+
+
+CODECS = {
+    TextCodec.name: TextCodec(),
+    BinaryCodec.name: BinaryCodec(),
+}
+
+
+def detect_codec(data: bytes) -> TextCodec | BinaryCodec:
+    """
+    クライアントから最初に届いたデータから通信形式を判別する
+
+    Args:
+        data (bytes): 最初の受信データ
+    """
+    if data[:1] == MAGIC[:1]:
+        return CODECS[BinaryCodec.name]
+    return CODECS[TextCodec.name]
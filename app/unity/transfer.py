@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+# バッファ経由で送信する場合の既定の読み込みサイズ
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# sendfileで一度に送信するサイズ (この単位で進捗を通知する)
+SENDFILE_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# 送信済みバイト数と全体のバイト数を受け取る進捗通知用のコールバック
+ProgressCallback = Callable[[int, int], None]
+
+
+@dataclass
+class TransferStats:
+    file_name: str
+    total_bytes: int
+    method: str = ""
+    bytes_sent: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: float | None = None
+    # 再開した転送の場合、再開した位置
+    resumed_from: int = 0
+    # 圧縮して送信した場合の圧縮方式・実際に送信したバイト数・圧縮に使用したCPU時間
+    encoding: str | None = None
+    wire_bytes: int = 0
+    compress_seconds: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """
+        転送速度 (bytes/s)
+        """
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        """
+        送信したバイト数 / 元のバイト数 (圧縮していない場合は1.0)
+        """
+        return self.wire_bytes / self.bytes_sent if self.encoding and self.bytes_sent else 1.0
+
+    def __str__(self) -> str:
+        resumed = f", resumed from {self.resumed_from}" if self.resumed_from else ""
+        compressed = (
+            f", {self.encoding} ratio {self.compression_ratio:.2f} cpu {self.compress_seconds:.2f}s"
+            if self.encoding else ""
+        )
+        return (
+            f"{self.file_name}: {self.bytes_sent / 1024**2:.1f} MiB / {self.elapsed:.2f}s "
+            f"({self.throughput / 1024**2:.1f} MiB/s, {self.method}{resumed}{compressed})"
+        )
+
+
+@dataclass
+class SendOptions:
+    """
+    ファイルを送信するときの設定
+
+    Attributes:
+        timeout (float | None): 送信完了から応答までを含めた期限(秒)。Noneの場合は無期限
+        progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+        resumable (bool): 再開可能な分割転送で送信するか
+        prefetch (bool): クライアントに表示させず、保持だけさせるか (先読み)
+    """
+    timeout: float | None = None
+    progress: ProgressCallback | None = None
+    resumable: bool = False
+    prefetch: bool = False
+
+
+# ファイルのダイジェストのキャッシュ ((パス, サイズ, 更新時刻) -> sha256)
+_digest_cache: dict[tuple[str, int, int], str] = {}
+
+
+def file_digest(file_path: str) -> str:
+    """
+    ファイル全体のsha256ダイジェストを計算する
+
+    同じパス・サイズ・更新時刻のファイルは再計算しない。
+    大きなファイルでは時間がかかるため、イベントループからは asyncio.to_thread で呼び出す。
+
+    Args:
+        file_path (str): ファイルのパス
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if (digest := _digest_cache.get(key)) is None:
+        with open(file_path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        _digest_cache[key] = digest
+    return digest
+
+
+@dataclass
+class FileSender:
+    """
+    ファイルの内容をソケットに送信するクラス
+
+    use_sendfile が有効な場合は loop.sendfile (os.sendfile) でカーネル内でコピーし、
+    利用できない環境(TLSやuvloop等)では chunk_size ごとに読み込んで送信する。
+
+    Attributes:
+        chunk_size (int): バッファ経由で送信する場合の読み込みサイズ
+        use_sendfile (bool): sendfileを使用するか
+    """
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    use_sendfile: bool = True
+
+    async def send(self, writer: asyncio.StreamWriter, f: BinaryIO, stats: TransferStats, offset: int = 0,
+                   progress: ProgressCallback | None = None) -> TransferStats:
+        """
+        ファイルの offset から終端までをソケットに送信する
+
+        Args:
+            writer (asyncio.StreamWriter): 送信先のストリーム
+            f (BinaryIO): バイナリモードで開いたファイル
+            stats (TransferStats): 送信量と時間を記録する統計情報
+            offset (int): 送信を開始する位置
+            progress (ProgressCallback | None): 進捗通知用のコールバック
+        """
+        f.seek(0, 2)
+        end = f.tell()
+
+        if self.use_sendfile:
+            stats.method = "sendfile"
+            loop = asyncio.get_running_loop()
+            await writer.drain()
+            try:
+                while offset < end:
+                    sent = await loop.sendfile(
+                        writer.transport, f, offset, min(SENDFILE_SEGMENT_SIZE, end - offset), fallback=False
+                    )
+                    if sent == 0:
+                        raise ConnectionError("ファイルの送信中に接続が切断されました")
+                    offset += sent
+                    stats.bytes_sent += sent
+                    if progress:
+                        progress(stats.bytes_sent, stats.total_bytes)
+                return stats
+            except (NotImplementedError, asyncio.SendfileNotAvailableError) as e:
+                logger.debug(f"sendfileを利用できないためバッファ経由で送信します: {e}")
+        stats.method = "buffered"
+
+        f.seek(offset)
+        while offset < end:
+            chunk = f.read(min(self.chunk_size, end - offset))
+            if not chunk:
+                raise EOFError(f"ファイルが途中で終了しました: {stats.file_name}")
+            writer.write(chunk)
+            await writer.drain()
+            offset += len(chunk)
+            stats.bytes_sent += len(chunk)
+            if progress:
+                progress(stats.bytes_sent, stats.total_bytes)
+        return stats
+
+
+class GrowingFile:
+    """
+    書き込み中のファイルを、書き込まれた分から順に読み出すクラス
+
+    アップロード中のファイルをUnityへ転送するために使用する。
+    書き込み側は別スレッドから update() / finish() / fail() で進捗を通知し、
+    読み出し側は chunks() で書き込み済みの範囲だけを読み出す。
+    読み出しは送信側の drain() に合わせて進むため、メモリに溜めるのは1チャンク分だけになる。
+    """
+    # 書き込みが進まない場合に失敗とするまでの時間(秒)
+    stall_timeout = 60.0
+    poll_interval = 0.5
+
+    def __init__(self, path: str, size: int, loop: asyncio.AbstractEventLoop):
+        self.path = path
+        self.size = size
+        self.finished = False
+        self.error: Exception | None = None
+        self._loop = loop
+        # 進捗を通知するたびにセットして差し替えるイベント (複数の読み出し側が待機できるようにする)
+        self._changed = asyncio.Event()
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(self.path)
+
+    def update(self) -> None:
+        """
+        書き込みが進んだことを通知する (他スレッドから呼び出せる)
+        """
+        self._loop.call_soon_threadsafe(self._notify)
+
+    def finish(self) -> None:
+        """
+        書き込みが完了したことを通知する (他スレッドから呼び出せる)
+        """
+        self._loop.call_soon_threadsafe(self._notify, True)
+
+    def fail(self, error: Exception) -> None:
+        """
+        書き込みが失敗したことを通知する (他スレッドから呼び出せる)
+        """
+        self._loop.call_soon_threadsafe(self._notify, False, error)
+
+    def _notify(self, finished: bool = False, error: Exception | None = None) -> None:
+        self.finished = self.finished or finished
+        self.error = self.error or error
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _written(self) -> int:
+        try:
+            return min(os.path.getsize(self.path), self.size)
+        except FileNotFoundError:
+            return 0
+
+    async def head(self, size: int) -> bytes:
+        """
+        ファイルの先頭 size バイトが書き込まれるまで待って返す (ファイルが size より小さい場合は全体)
+
+        Args:
+            size (int): 読み出すバイト数
+        """
+        data = bytearray()
+        chunks = self.chunks(size)
+        try:
+            async for chunk in chunks:
+                data += chunk
+                if len(data) >= size:
+                    break
+        finally:
+            await chunks.aclose()
+        return bytes(data[:size])
+
+    async def chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        書き込み済みのデータを chunk_size ごとに返す
+
+        Raises:
+            TimeoutError: stall_timeout 秒の間、書き込みが進まなかった場合
+            EOFError: 書き込みが完了したのにファイルが size に満たない場合
+        """
+        offset = 0
+        last_progress = time.perf_counter()
+        f = None
+        try:
+            while offset < self.size:
+                changed = self._changed
+                if self.error is not None:
+                    raise self.error
+                available = self._written()
+                if available <= offset:
+                    if self.finished:
+                        raise EOFError(f"ファイルが途中で終了しました: {self.file_name} {available}/{self.size}")
+                    if time.perf_counter() - last_progress > self.stall_timeout:
+                        raise TimeoutError(f"ファイルの書き込みが進みません: {self.file_name} {offset}/{self.size}")
+                    # 通知が届かなくても書き込みは進むため、poll_interval ごとにファイルサイズを確認する
+                    try:
+                        await asyncio.wait_for(changed.wait(), self.poll_interval)
+                    except TimeoutError:
+                        pass
+                    continue
+                last_progress = time.perf_counter()
+                if f is None:
+                    f = open(self.path, "rb")
+                f.seek(offset)
+                while offset < available:
+                    chunk = f.read(min(chunk_size, available - offset))
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    yield chunk
+        finally:
+            if f is not None:
+                f.close()
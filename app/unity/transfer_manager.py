@@ -0,0 +1,260 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import TYPE_CHECKING
+
+from app.unity.transfer import GrowingFile
+
+if TYPE_CHECKING:
+    from app.unity_conn import SocketServer, UnitySession
+
+logger = logging.getLogger(__name__)
+
+
+class TransferState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class TransferCancelled(Exception):
+    """
+    転送がキャンセルされた場合の例外
+    """
+
+
+@dataclass
+class TransferJob:
+    """
+    1つのファイルを1台のDisplayに送信する転送
+    """
+    job_id: int
+    file_name: str
+    session_id: str
+    display_id: str
+    total_bytes: int
+    state: TransferState = TransferState.QUEUED
+    bytes_sent: int = 0
+    queued_at: float = field(default_factory=time.perf_counter)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: str | None = None
+    error: Exception | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (TransferState.DONE, TransferState.FAILED, TransferState.CANCELLED)
+
+    @property
+    def progress(self) -> float:
+        """
+        進捗 (0.0 - 1.0)
+        """
+        return self.bytes_sent / self.total_bytes if self.total_bytes else float(self.finished)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """
+        転送速度 (bytes/s)
+        """
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """
+        残り時間の見込み(秒) (転送が始まっていない場合はNone)
+        """
+        if self.finished:
+            return 0.0
+        if not self.throughput:
+            return None
+        return (self.total_bytes - self.bytes_sent) / self.throughput
+
+
+# 転送の状態や進捗が変わったときに呼ばれるコールバック (イベントループのスレッドで呼ばれる)
+TransferListener = Callable[[TransferJob], None]
+
+
+class TransferManager:
+    """
+    Unityへのファイル転送をバックグラウンドで実行するクラス
+
+    ファイルは送信先のセッションごとの TransferJob に分けて並行に送信し、
+    同時に実行する転送は max_workers 件までに制限する (それ以外は QUEUED で順番を待つ)。
+    jobs で待機中・実行中・完了した転送の一覧と進捗を参照でき、cancel() で転送を中止できる。
+
+    イベントループは SocketServer のものを使用し、submit_*() と cancel() は他のスレッドから呼び出せる。
+    """
+    # 一覧に残す完了済みの転送の数
+    max_history = 50
+
+    def __init__(self, server: "SocketServer", max_workers: int = 3):
+        self.server = server
+        self.max_workers = max_workers
+        self.jobs: dict[int, TransferJob] = {}
+        self._job_ids = itertools.count(1)
+        self._listeners: list[TransferListener] = []
+        self._slots: asyncio.Semaphore | None = None
+
+    def add_listener(self, listener: TransferListener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: TransferListener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, job: TransferJob) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"転送の通知中にエラーが発生しました: {e}")
+
+    @property
+    def queued(self) -> list[TransferJob]:
+        """
+        実行を待っている転送 (実行される順)
+        """
+        return [job for job in self.jobs.values() if job.state == TransferState.QUEUED]
+
+    @property
+    def running(self) -> list[TransferJob]:
+        return [job for job in self.jobs.values() if job.state == TransferState.RUNNING]
+
+    def submit_file(self, file_path: str, session_ids: list[str] | None = None,
+                    timeout: float | None = None) -> concurrent.futures.Future:
+        """
+        ファイルの転送を追加し、全ての送信先の結果を受け取るFutureを返す (ブロックしない)
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            session_ids (list[str] | None): 送信先のセッションID。Noneの場合は接続中の全クライアント
+            timeout (float | None): 送信先ごとの応答までの期限(秒)
+
+        Returns:
+            concurrent.futures.Future: セッションIDごとの受信結果 (失敗した場合は例外) の辞書を返すFuture
+        """
+        if not os.path.isfile(file_path):
+            logger.error(f"ファイルが見つかりません: {file_path}")
+            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
+        return self.server.submit(self.fan_out(file_path, session_ids, timeout))
+
+    def submit_stream(self, source: GrowingFile, session_ids: list[str] | None = None,
+                      timeout: float | None = None) -> concurrent.futures.Future:
+        """
+        書き込み中のファイルの転送を追加し、全ての送信先の結果を受け取るFutureを返す (ブロックしない)
+
+        Args:
+            source (GrowingFile): 書き込み中のファイル
+            session_ids (list[str] | None): 送信先のセッションID。Noneの場合は接続中の全クライアント
+            timeout (float | None): 送信先ごとの応答までの期限(秒)
+        """
+        return self.server.submit(self.fan_out(source, session_ids, timeout))
+
+    def cancel(self, job_id: int) -> None:
+        """
+        転送をキャンセルする (他のスレッドから呼び出せる)
+
+        Args:
+            job_id (int): キャンセルする転送のID
+        """
+        self.server.loop.call_soon_threadsafe(self._cancel, job_id)
+
+    def _cancel(self, job_id: int) -> None:
+        job = self.jobs.get(job_id)
+        if job is not None and job.task is not None and not job.finished:
+            logger.info(f"転送をキャンセルします: {job.file_name} -> {job.display_id}")
+            job.task.cancel()
+
+    async def fan_out(self, file: str | GrowingFile, session_ids: list[str] | None = None,
+                      timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        ファイルを送信先ごとの転送に分けて追加し、全ての転送が終わるまで待機する
+
+        Args:
+            file (str | GrowingFile): 送信するファイルのパス、または書き込み中のファイル
+            session_ids (list[str] | None): 送信先のセッションID。Noneの場合は接続中の全クライアント
+            timeout (float | None): 送信先ごとの応答までの期限(秒)
+
+        Returns:
+            dict[str, str | Exception]: セッションIDごとの受信結果 (失敗した場合は例外)
+
+        Raises:
+            ConnectionError: 送信先のクライアントが接続されていない場合 (転送は1件も追加しない)
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if session_ids is None:
+            session_ids = list(self.server.sessions)
+        # 送信先が1つでも見つからない場合は、転送を始める前に失敗させる
+        sessions = [self.server.get_session(session_id) for session_id in session_ids]
+        jobs = [self._add(file, session, timeout) for session in sessions]
+        if jobs:
+            await asyncio.wait([job.task for job in jobs])
+        return {job.session_id: job.result if job.state == TransferState.DONE else job.error for job in jobs}
+
+    def _add(self, file: str | GrowingFile, session: "UnitySession", timeout: float | None) -> TransferJob:
+        if isinstance(file, GrowingFile):
+            file_name, total_bytes = file.file_name, file.size
+        else:
+            file_name, total_bytes = os.path.basename(file), os.path.getsize(file)
+        job = TransferJob(next(self._job_ids), file_name, session.session_id, session.display_id, total_bytes)
+        job.task = asyncio.ensure_future(self._run(job, file, timeout))
+        self.jobs[job.job_id] = job
+        self._prune()
+        self._notify(job)
+        return job
+
+    async def _run(self, job: TransferJob, file: str | GrowingFile, timeout: float | None) -> None:
+        """
+        空きを待って転送を実行し、結果を job に記録する
+        """
+        def progress(sent: int, total: int) -> None:
+            # 圧縮やLODで実際に送信するサイズは元のファイルと異なるため、送信側の合計に合わせる
+            job.bytes_sent, job.total_bytes = sent, total
+            self._notify(job)
+
+        try:
+            async with self._slots:
+                job.state = TransferState.RUNNING
+                job.started_at = time.perf_counter()
+                self._notify(job)
+                if isinstance(file, GrowingFile):
+                    job.result = await self.server.stream_file_async(file, job.session_id, timeout, progress)
+                else:
+                    job.result = await self.server.send_file_async(file, job.session_id, timeout, progress)
+            job.state = TransferState.DONE
+        except asyncio.CancelledError:
+            job.state = TransferState.CANCELLED
+            job.error = TransferCancelled(f"転送がキャンセルされました: {job.file_name}")
+        except Exception as e:
+            logger.error(f"ファイルの転送に失敗しました: {job.file_name} -> {job.display_id} {e}")
+            job.state = TransferState.FAILED
+            job.error = e
+        finally:
+            job.finished_at = time.perf_counter()
+            self._notify(job)
+
+    def _prune(self) -> None:
+        """
+        完了した転送のうち古いものを一覧から削除する
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job_id]
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # キャッシュ全体のサイズ(バイト)
+    size: int = 0
+    entries: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"hits {self.hits}, misses {self.misses} ({self.hit_rate:.0%}), evictions {self.evictions}, "
+            f"{self.entries} entries / {self.size / 1024**2:.1f} MiB"
+        )
+
+
+@dataclass
+class _CreatingLock:
+    """
+    作成中のエントリのロックと、そのロックを待っている(使用している)スレッドの数
+    """
+    lock: threading.Lock
+    waiters: int = 0
+
+
+class VariantCache:
+    """
+    アセットを変換したファイル(圧縮・タイル分割・LODなど)をディスクに保持するキャッシュ
+
+    エントリは (元のファイルのsha256ダイジェスト, 変換の設定) ごとのディレクトリで、
+    一時ディレクトリに作成してから名前を変更するため、作成途中のエントリが使われることはない。
+    最後に使用した時刻はディレクトリの更新時刻に記録し、合計サイズが max_size を超えたら
+    最も長く使われていないエントリから削除する (サーバーを再起動しても引き継ぐ)。
+
+    get_or_create() は別スレッドから呼び出せる (同じエントリの作成は1回だけ行う)。
+    送信中のエントリは pin=True で取得して unpin() するまで削除しない。
+    """
+    # 作成途中のエントリの接尾辞 (起動時に残っていれば削除する)
+    tmp_suffix = ".tmp"
+
+    def __init__(self, root: str, max_size: int = 10 * 1024**3):
+        self.root = root
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # 作成中のエントリ -> 作成が終わるまで他のスレッドを待たせるロック (待っているスレッドがなくなったら削除する)
+        self._creating: dict[str, _CreatingLock] = {}
+        # 使用中のエントリ -> 使用している数
+        self._pins: dict[str, int] = {}
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                if name.endswith(self.tmp_suffix):
+                    shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        self._refresh_size()
+
+    @staticmethod
+    def key(digest: str, params: str) -> str:
+        """
+        エントリのキー (ダイジェストの先頭と、変換の設定のハッシュ)
+
+        Args:
+            digest (str): 元のファイルのsha256ダイジェスト
+            params (str): 変換の種類と設定を表す文字列
+        """
+        return f"{digest[:16]}-{hashlib.sha256(params.encode()).hexdigest()[:16]}"
+
+    def get(self, digest: str, params: str, pin: bool = False) -> str | None:
+        """
+        エントリのディレクトリを返す (ない場合はNone)。見つかった場合は最後に使用した時刻を更新する
+
+        Args:
+            digest (str): 元のファイルのsha256ダイジェスト
+            params (str): 変換の種類と設定を表す文字列
+            pin (bool): Trueの場合は unpin() するまでエントリを削除しない
+        """
+        path = os.path.join(self.root, self.key(digest, params))
+        with self._lock:
+            if not os.path.isdir(path):
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            if pin:
+                self._pins[path] = self._pins.get(path, 0) + 1
+        self._touch(path)
+        logger.debug(f"キャッシュした変換を使用します: {os.path.basename(path)} ({self.stats})")
+        return path
+
+    def has(self, digest: str, params: str) -> bool:
+        """
+        エントリがあるか (get() と異なり、使用した時刻と統計は更新しない)
+        """
+        return os.path.isdir(os.path.join(self.root, self.key(digest, params)))
+
+    def get_or_create(self, digest: str, params: str, create: Callable[[str], object], pin: bool = False) -> str:
+        """
+        エントリのディレクトリを返し、ない場合は create(一時ディレクトリ) で作成する
+
+        Args:
+            digest (str): 元のファイルのsha256ダイジェスト
+            params (str): 変換の種類と設定を表す文字列
+            create (Callable[[str], object]): 渡されたディレクトリに変換したファイルを書き込む関数
+            pin (bool): Trueの場合は unpin() するまでエントリを削除しない
+
+        Raises:
+            Exception: create で発生した例外 (作成途中のエントリは削除する)
+        """
+        key = self.key(digest, params)
+        path = os.path.join(self.root, key)
+        with self._lock:
+            creating = self._creating.setdefault(key, _CreatingLock(threading.Lock()))
+            creating.waiters += 1
+        try:
+            with creating.lock:
+                # 待っている間に他のスレッドが作成した場合は、それを使用する
+                if (cached := self.get(digest, params, pin)) is not None:
+                    return cached
+                started = time.perf_counter()
+                self._create(path, create)
+                size = _directory_size(path)
+                with self._lock:
+                    self.stats.size += size
+                    self.stats.entries += 1
+                    if pin:
+                        self._pins[path] = self._pins.get(path, 0) + 1
+        finally:
+            # 待っているスレッドが残っている間はロックを削除しない (後から来たスレッドも同じロックを待つ)
+            with self._lock:
+                creating.waiters -= 1
+                if not creating.waiters:
+                    del self._creating[key]
+        logger.info(
+            f"変換したアセットをキャッシュしました: {key} ({size / 1024**2:.1f} MiB, "
+            f"{time.perf_counter() - started:.2f}s) [{self.stats}]"
+        )
+        self.evict(keep=path)
+        return path
+
+    def _create(self, path: str, create: Callable[[str], object]) -> None:
+        """
+        一時ディレクトリにエントリを作成し、完成してから path に移動する
+        """
+        tmp_path = f"{path}{self.tmp_suffix}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            create(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def unpin(self, path: str) -> None:
+        """
+        エントリの使用を終える (容量を超えていれば、使われていないエントリを削除する)
+        """
+        with self._lock:
+            if (count := self._pins.pop(path, 0) - 1) > 0:
+                self._pins[path] = count
+        self.evict()
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        合計サイズが max_size 以下になるまで、最も長く使われていないエントリを削除する
+
+        Args:
+            keep (str | None): 削除しないエントリ (直前に作成したもの)
+        """
+        with self._lock:
+            if self.stats.size <= self.max_size:
+                return
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            for path, _, size in entries:
+                if self.stats.size <= self.max_size:
+                    break
+                if path == keep or path in self._pins or os.path.basename(path) in self._creating:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                self.stats.size -= size
+                self.stats.entries -= 1
+                self.stats.evictions += 1
+                logger.info(f"キャッシュから削除しました: {os.path.basename(path)} ({size / 1024**2:.1f} MiB)")
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in self._entries():
+                shutil.rmtree(path, ignore_errors=True)
+            self.stats.size = 0
+            self.stats.entries = 0
+
+    def _entries(self) -> list[tuple[str, float, int]]:
+        """
+        (パス, 最後に使用した時刻, サイズ) の一覧
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(self.tmp_suffix) or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((path, os.stat(path).st_mtime, _directory_size(path)))
+            except OSError:
+                continue
+        return entries
+
+    def _refresh_size(self) -> None:
+        with self._lock:
+            entries = self._entries()
+            self.stats.size = sum(size for _, _, size in entries)
+            self.stats.entries = len(entries)
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                continue
+    return total
@@ -1,169 +1,1510 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import itertools
+import json
 import logging
 import os
+import shutil
 import socket
+import threading
+import time
+import uuid
+import zlib
+from collections.abc import Awaitable, Callable, Coroutine
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+from app.splat.compress import SplatCompressionOptions, compress_splat, read_quantization
+from app.splat.delta import DeltaError, build_delta
+from app.splat.lod import LodSet, build_lods
+from app.splat.ply import MAX_HEADER_SIZE, parse_header, read_header, validate_splat, validate_splat_header
+from app.splat.tiling import is_tiled, tile_splat
+from app.splat.workers import SplatWorkerPool
+from app.unity.assets import AssetManifest
+from app.unity.compression import DEFAULT_ENCODINGS, ChunkEncoder, is_compressible, negotiate_encoding
+from app.unity.prefetch import ScenePlaylist, ScenePrefetcher
+from app.unity.protocol import CODECS, Message, MessageType, TextCodec, detect_codec
+from app.unity.transfer import (
+    DEFAULT_CHUNK_SIZE,
+    FileSender,
+    GrowingFile,
+    ProgressCallback,
+    SendOptions,
+    TransferStats,
+    file_digest,
+)
+from app.unity.transfer_manager import TransferManager
+from app.unity.variant_cache import VariantCache
 
 logger = logging.getLogger(__name__)
 
+
+class SessionState(Enum):
+    """
+    Unityクライアントとの接続状態
+
+    CONNECTING -> READY (HELLOまたは最初のデータを受信) <-> DEGRADED (ハートビートの応答が遅れている) -> CLOSED
+    """
+    CONNECTING = "connecting"
+    READY = "ready"
+    DEGRADED = "degraded"
+    CLOSED = "closed"
+
+
+# 接続状態が変わったときに呼ばれるコールバック (イベントループのスレッドで呼ばれる)
+StateListener = Callable[["UnitySession", SessionState], None]
+
+
+@dataclass
+class ServerSettings:
+    """
+    SocketServer の設定 (local.settings.json の unity_settings)
+
+    各項目の意味は SocketServer と UnitySession を参照。
+    """
+    host: str = "0.0.0.0"
+    port: int = 8765
+    # 送信から応答までの既定の期限(秒) Noneの場合は無期限
+    command_timeout: float | None = 10.0
+    file_timeout: float | None = None
+    # 通信形式・ファイル本体の送信方法
+    protocol: str = TextCodec.name
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    use_sendfile: bool = True
+    # 分割転送と再開
+    resumable: bool = False
+    resume_timeout: float = 30.0
+    max_resume_attempts: int = 5
+    # 分割転送で使用する圧縮方式 (優先順。Noneの場合は DEFAULT_ENCODINGS)
+    compression: list[str] | None = None
+    asset_manifest: str | None = None
+    max_transfers: int = 3
+    # ハートビートとTCPのkeepalive(秒)・再接続の待機
+    heartbeat_interval: float = 5.0
+    heartbeat_timeout: float = 15.0
+    keepalive_idle: int = 10
+    keepalive_interval: int = 5
+    keepalive_count: int = 3
+    reconnect_grace: float = 5.0
+    max_queued_commands: int = 32
+    # PLYの検証と変換
+    validate_splats: bool = True
+    splat_compression: dict | None = None
+    splat_cache_dir: str = "assets/uploads/.cache"
+    splat_cache_size: int = 10 * 1024**3
+    splat_tile_size: int | None = None
+    splat_workers: int = 2
+    splat_job_memory: int | None = 4 * 1024**3
+    lod_fractions: list[float] | None = None
+    # プレイリスト・先読み・差分転送
+    scene_dir: str = "assets/scenes"
+    prefetch_radius: int = 1
+    delta_updates: bool = True
+
+
+class UnitySession:
+    """
+    接続中のUnityクライアント1台分の通信を管理するクラス
+
+    送信するリクエストにはリクエストIDを付与し、クライアントは
+    RESULT:<リクエストID>:<結果> の形式で応答する。
+    応答はIDで対応するFutureに振り分けるため、複数のリクエストを同時に送信できる。
+    テキスト形式では、HELLOの capabilities で "request_id" を通知するまでは旧形式
+    (COMMAND:<コマンド> / FILE:<ファイル名>:<サイズ>) で送信し、IDのない応答は古いリクエストから順に割り当てる。
+
+    通信形式はテキスト形式とバイナリ形式(app.unity.protocol)に対応し、
+    クライアントから最初に届いたデータで判別する。それまでは codec の形式で送信する。
+
+    ファイル本体は use_sendfile が有効な場合はsendfileで、それ以外は chunk_size ごとに送信する。
+    send_file_resumable() ではチャンクごとにCRC32を付けて送信し、途中で切断されても続きから再開できる。
+
+    クライアントは接続直後にHELLOで自身の表示名(display_id)を送信する。
+    再接続しても同じdisplay_idを送信することで、同じDisplayとして扱われる。
+    HELLOはJSON ({"display_id": ..., "capabilities": [...], "compression": [...]}) でも送信でき、
+    サーバーは使用する圧縮方式をHELLOで返す。圧縮は分割転送のチャンクに適用する。
+
+    capabilities に "assets" を含むクライアントは受信したファイルをダイジェストで保持し、
+    HAVE (保持しているかの問い合わせ) と LOAD (保持しているファイルの読み込み) に応答する。
+    capabilities に "lod" を含むクライアントには、シーンを <名前>.lod0.ply (最も粗いLOD) から順に分けて送信する。
+    lod1 以降は前のLODに含まれないGaussianだけを含むため、クライアントは同じ名前のシーンに追加して表示する。
+    capabilities に "prefetch" を含むクライアントは、UPLOAD に "prefetch": true が付いたファイルを表示せずに保持する。
+    capabilities に "delta" を含むクライアントには、UPLOAD に "delta": {"base", "digest", "name"} を付けて
+    差分ファイル(app.splat.delta)を送信することがある。クライアントは保持している base に差分を適用し、
+    digest のファイルとして受信する。
+
+    接続状態は state (SessionState) で管理し、変わるたびに on_state_change を呼び出す。
+    capabilities に "heartbeat" を含むクライアントには heartbeat() でPINGを送信し、
+    応答が遅れている間は DEGRADED、heartbeat_timeout 秒を超えたら接続を閉じる。
+    """
+    read_size = 64 * 1024
+    # 1回の分割転送でチェックサムの不一致から再送する回数の上限
+    max_upload_attempts = 3
+
+    def __init__(self, session_id: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 settings: ServerSettings | None = None):
+        settings = settings or ServerSettings()
+        self.session_id = session_id
+        self.state = SessionState.CONNECTING
+        # 接続状態が変わったとき・HELLOで名乗ったときに呼ばれるコールバック
+        self.on_state_change: StateListener | None = None
+        self.on_hello: Callable[[UnitySession], None] | None = None
+        # 最後にクライアントからデータを受信した時刻
+        self.last_seen = time.monotonic()
+        self._display_id: str | None = None
+        # サーバーが優先する圧縮方式と、HELLOで決まった圧縮方式・クライアントの対応機能
+        self.compression = settings.compression if settings.compression is not None else DEFAULT_ENCODINGS
+        self.encoding: str | None = None
+        self.capabilities: set[str] = set()
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.codec = CODECS[settings.protocol]
+        self.chunk_size = settings.chunk_size
+        self.sender = FileSender(settings.chunk_size, settings.use_sendfile)
+        self.closed = False
+        # 最後に送信したファイルの転送統計
+        self.last_transfer: TransferStats | None = None
+        self._request_ids = itertools.count(1)
+        # 応答待ちのリクエスト (リクエストID -> Future)
+        self._pending: dict[int, asyncio.Future[str]] = {}
+        # ファイル本体の途中に他のメッセージが混ざらないように書き込みを排他する
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def display_id(self) -> str:
+        """
+        クライアントがHELLOで名乗った表示名 (未受信の場合はセッションID)
+        """
+        return self._display_id or self.session_id
+
+    @property
+    def identified(self) -> bool:
+        """
+        クライアントがHELLOで表示名を名乗ったか
+        """
+        return self._display_id is not None
+
+    @property
+    def uses_request_ids(self) -> bool:
+        """
+        送信するメッセージにリクエストIDを付けるか (バイナリ形式はヘッダーに必ずリクエストIDを含む)
+        """
+        return self.codec.name != TextCodec.name or "request_id" in self.capabilities
+
+    def _encode(self, message_type: MessageType, request_id: int, payload: bytes = b"") -> bytes:
+        """
+        メッセージをクライアントの通信形式でエンコードする (リクエストIDに対応していない場合は旧形式)
+        """
+        return self.codec.encode(message_type, request_id if self.uses_request_ids else None, payload)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        応答待ちのリクエスト数
+        """
+        return len(self._pending)
+
+    async def read_loop(self) -> None:
+        """
+        クライアントから届くデータを読み続け、RESULTを対応するリクエストに振り分ける
+        """
+        decoder = None
+        try:
+            while data := await self.reader.read(self.read_size):
+                self.last_seen = time.monotonic()
+                if self.state != SessionState.READY:
+                    self._set_state(SessionState.READY)
+                if decoder is None:
+                    self.codec = detect_codec(data)
+                    decoder = self.codec.decoder()
+                    logger.debug(f"通信形式を判別しました({self.session_id}): {self.codec.name}")
+                decoder.feed(data)
+                for message in decoder:
+                    self._dispatch(message)
+        finally:
+            self.closed = True
+            self._set_state(SessionState.CLOSED)
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("クライアントとの接続が切断されました"))
+            self._pending.clear()
+
+    def _dispatch(self, message: Message) -> None:
+        """
+        受信したメッセージを処理する
+
+        Args:
+            message (Message): 受信したメッセージ
+        """
+        if message.type == MessageType.RESULT:
+            self._resolve(message)
+        elif message.type == MessageType.HELLO:
+            self._hello(message.text)
+        elif message.type == MessageType.PING:
+            asyncio.ensure_future(self._send_message(MessageType.PONG, message.request_id or 0))
+        elif message.type == MessageType.PONG:
+            pass
+        else:
+            logger.debug(f"クライアント({self.session_id})からのデータ: {message.type.name} {message.text}")
+
+    def _hello(self, text: str) -> None:
+        """
+        HELLOの内容から表示名と対応機能を設定し、使用する圧縮方式をクライアントに通知する
+
+        JSONとして解析できない場合は、旧形式 (HELLO:<表示名>) として扱う。
+
+        Args:
+            text (str): 表示名、またはJSON形式の対応機能
+        """
+        hello = None
+        if text.startswith("{"):
+            try:
+                hello = json.loads(text)
+            except ValueError as e:
+                logger.warning(f"HELLOを解析できないため、表示名として扱います({self.session_id}): {e}")
+        if isinstance(hello, dict):
+            self._display_id = hello.get("display_id") or None
+            self.capabilities = set(hello.get("capabilities", []))
+            self.encoding = negotiate_encoding(self.compression, hello.get("compression", []))
+            reply = json.dumps({"session_id": self.session_id, "compression": self.encoding})
+            asyncio.ensure_future(self._send_message(MessageType.HELLO, 0, reply.encode()))
+        else:
+            self._display_id = text or None
+        logger.info(
+            f"クライアントが名乗りました({self.session_id}): {self.display_id} "
+            f"(capabilities: {sorted(self.capabilities)}, compression: {self.encoding})"
+        )
+        if self.on_hello:
+            self.on_hello(self)
+
+    def _set_state(self, state: SessionState) -> None:
+        if state == self.state:
+            return
+        logger.info(f"接続状態が変わりました({self.session_id}): {self.state.value} -> {state.value}")
+        self.state = state
+        if self.on_state_change:
+            self.on_state_change(self, state)
+
+    async def heartbeat(self, interval: float, timeout: float) -> None:
+        """
+        interval 秒ごとにPINGを送信し、クライアントからの応答を監視する
+
+        PINGに応答しないクライアントもあるため、"heartbeat" に対応したクライアントだけ監視する。
+        最後の受信から interval の1.5倍を過ぎたら DEGRADED にし、timeout 秒を過ぎたら接続を閉じる。
+        ファイル本体の送信中はクライアントが応答できないため監視しない
+        (送信の停止は送信側の期限とTCPのkeepaliveで検出する)。
+
+        Args:
+            interval (float): PINGを送信する間隔(秒)
+            timeout (float): 応答がない場合に接続を閉じるまでの時間(秒)
+        """
+        ping_ids = itertools.count(1)
+        while not self.closed:
+            await asyncio.sleep(interval)
+            if "heartbeat" not in self.capabilities or self.closed:
+                continue
+            if self._write_lock.locked():
+                self.last_seen = time.monotonic()
+                continue
+            silence = time.monotonic() - self.last_seen
+            if silence > timeout:
+                logger.warning(f"ハートビートの応答がないため接続を閉じます({self.session_id}): {silence:.1f}s")
+                self.writer.close()
+                return
+            if silence > interval * 1.5:
+                self._set_state(SessionState.DEGRADED)
+            await self._send_message(MessageType.PING, next(ping_ids))
+
+    async def _send_message(self, message_type: MessageType, request_id: int, payload: bytes = b"") -> None:
+        """
+        応答を待たないメッセージを送信する
+        """
+        try:
+            async with self._write_lock:
+                if not self.closed:
+                    self.writer.write(self._encode(message_type, request_id, payload))
+                    await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            logger.debug(f"メッセージの送信に失敗しました({self.session_id}): {e}")
+
+    def _resolve(self, message: Message) -> None:
+        """
+        RESULTの内容を対応するリクエストのFutureに設定する
+
+        リクエストIDが付いていない応答(旧形式)は最も古い応答待ちのリクエストに割り当てる
+
+        Args:
+            message (Message): 受信したRESULTメッセージ
+        """
+        if message.request_id is not None:
+            future = self._pending.get(message.request_id)
+        else:
+            future = next((f for f in self._pending.values() if not f.done()), None)
+        if future is None:
+            logger.warning(f"応答待ちでないリクエストの結果を受信しました({self.session_id}): {message.text}")
+        elif not future.done():
+            future.set_result(message.text)
+
+    async def _request(self, message_type: MessageType, payload: str,
+                       send_body: Callable[[], Awaitable[None]] | None = None, timeout: float | None = None) -> str:
+        """
+        リクエストIDを付与してメッセージを送信し、応答を待機する
+
+        Args:
+            message_type (MessageType): メッセージの種別 (COMMAND, FILE)
+            payload (str): メッセージの内容
+            send_body (Callable[[], Awaitable[None]] | None): メッセージに続けて生データ(ファイル本体)を送信する関数
+            timeout (float | None): 送信から応答までの期限(秒)。Noneの場合は無期限
+
+        Raises:
+            ConnectionError: クライアントとの接続が切断された場合
+            TimeoutError: 期限までに応答がなかった場合
+        """
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        writing = False
+        try:
+            async with asyncio.timeout(timeout):
+                async with self._write_lock:
+                    if self.closed:
+                        raise ConnectionError("クライアントとの接続が切断されました")
+                    writing = True
+                    self.writer.write(self._encode(message_type, request_id, payload.encode()))
+                    if send_body is not None:
+                        await send_body()
+                    await self.writer.drain()
+                    writing = False
+                return await future
+        except ConnectionError as e:
+            if writing:
+                self._connection_lost(e)
+            raise
+        except (TimeoutError, asyncio.CancelledError):
+            if writing:
+                # 送信途中で中断するとストリームの区切りが壊れるため接続ごと閉じる
+                logger.warning(f"送信中にリクエストが中断されたため接続を閉じます({self.session_id}): {request_id}")
+                self.writer.close()
+            elif not self.closed and self.uses_request_ids:
+                # 期限切れ・キャンセルしたリクエストの中止をクライアントに通知する (旧形式ではリクエストを指定できない)
+                asyncio.ensure_future(self._send_message(MessageType.CANCEL, request_id))
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def send_command(self, command: str, timeout: float | None = None) -> str:
+        """
+        クライアントにコマンドを送信し、実行結果を返す
+
+        Args:
+            command (str): 送信するコマンド
+            timeout (float | None): 応答までの期限(秒)
+        """
+        result = await self._request(MessageType.COMMAND, command, timeout=timeout)
+        logger.debug(f"コマンドを送信しました({self.session_id}): {command}")
+        return result
+
+    async def send_file(self, file_path: str, timeout: float | None = None,
+                        progress: ProgressCallback | None = None) -> str:
+        """
+        クライアントにファイルを送信し、受信結果を返す
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            timeout (float | None): 送信完了から応答までを含めた期限(秒)
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+        """
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        stats = TransferStats(file_name, file_size)
+
+        async def send_body() -> None:
+            with open(file_path, "rb") as f:
+                await self.sender.send(self.writer, f, stats, progress=progress)
+            await self.writer.drain()
+            stats.finished_at = time.perf_counter()
+
+        result = await self._request(MessageType.FILE, f"{file_name}:{file_size}", send_body, timeout)
+        self.last_transfer = stats
+        logger.info(f"ファイルを送信しました({self.session_id}): {stats}")
+        return result
+
+    async def send_stream(self, source: GrowingFile, timeout: float | None = None,
+                          progress: ProgressCallback | None = None) -> str:
+        """
+        書き込み中のファイルを、書き込まれた分から順にクライアントに送信し、受信結果を返す
+
+        メッセージは send_file() と同じFILEで、クライアントからは通常のファイル受信と区別できない。
+
+        Args:
+            source (GrowingFile): 書き込み中のファイル
+            timeout (float | None): 送信完了から応答までを含めた期限(秒)
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+        """
+        stats = TransferStats(source.file_name, source.size, "streamed")
+
+        async def send_body() -> None:
+            async for chunk in source.chunks(self.chunk_size):
+                self.writer.write(chunk)
+                await self.writer.drain()
+                stats.bytes_sent += len(chunk)
+                if progress:
+                    progress(stats.bytes_sent, stats.total_bytes)
+            stats.finished_at = time.perf_counter()
+
+        result = await self._request(MessageType.FILE, f"{source.file_name}:{source.size}", send_body, timeout)
+        self.last_transfer = stats
+        logger.info(f"ファイルを送信しました({self.session_id}): {stats}")
+        return result
+
+    async def send_file_resumable(self, file_path: str, digest: str, options: SendOptions | None = None,
+                                  delta: dict | None = None) -> str:
+        """
+        クライアントにファイルを分割して送信し、受信結果を返す
+
+        1. UPLOAD でファイル名・サイズ・ダイジェストを通知し、クライアントが受信済みの位置(offset)を受け取る
+        2. offset 以降を CHUNK (offset, length, crc32 + 本体) に分割して送信する
+        3. UPLOAD_END でクライアントにダイジェストを検証させる。
+           不一致の場合はクライアントが返した正常な位置から再送する
+
+        圧縮方式が決まっている場合、チャンクはストリームとして圧縮して送信する。
+        ただし先頭のチャンクをサンプルとして圧縮し、効果がなければその転送では圧縮しない。
+
+        チャンクの間は書き込みのロックを解放するため、転送中も他のコマンドを送信できる。
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            digest (str): ファイル全体のsha256ダイジェスト
+            options (SendOptions | None): 転送全体の期限・進捗通知用のコールバック・先読みか
+            delta (dict | None): 差分ファイルを送信する場合の元のファイルと適用後のファイル
+                ({"base": ダイジェスト, "digest": ダイジェスト, "name": ファイル名})
+
+        Raises:
+            ConnectionError: 接続が切断された場合 (同じダイジェストで再度呼び出すと続きから再開する)
+            OSError: 再送してもダイジェストが一致しなかった場合
+        """
+        options = options or SendOptions()
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        upload = {"name": file_name, "size": file_size, "digest": digest, "chunk_size": self.chunk_size}
+        if options.prefetch:
+            upload["prefetch"] = True
+        if delta:
+            upload["delta"] = delta
+        header = json.dumps(upload, ensure_ascii=False)
+        stats = TransferStats(file_name, file_size, "chunked", encoding=self.encoding)
+        async with asyncio.timeout(options.timeout):
+            for _ in range(self.max_upload_attempts):
+                offset = int(json.loads(await self._request(MessageType.UPLOAD, header)).get("offset", 0))
+                if offset:
+                    logger.info(f"ファイルの転送を再開します({self.session_id}): {file_name} {offset}/{file_size}")
+                    stats.resumed_from = offset
+                await self._send_chunks(file_path, digest, offset, stats, options.progress)
+                stats.finished_at = time.perf_counter()
+                reply = json.loads(await self._request(MessageType.UPLOAD_END, digest))
+                if reply.get("ok"):
+                    self.last_transfer = stats
+                    logger.info(f"ファイルを送信しました({self.session_id}): {stats}")
+                    return reply.get("result", "")
+                logger.warning(
+                    f"受信したファイルが一致しないため再送します({self.session_id}): {file_name} "
+                    f"(正常に受信した位置: {reply.get('offset', 0)})"
+                )
+        raise OSError(f"ファイルを正しく送信できませんでした: {file_name}")
+
+    async def _send_chunks(self, file_path: str, digest: str, offset: int, stats: TransferStats,
+                           progress: ProgressCallback | None = None) -> None:
+        """
+        ファイルの offset 以降 (stats.total_bytes まで) をCHUNKに分割して送信する
+
+        CHUNKのヘッダーには元データの位置・長さ・CRC32と、圧縮した場合は圧縮方式と送信するサイズを含める。
+        圧縮のストリームはUPLOADごとに作り直し、最初の圧縮チャンクに reset を付ける。
+        """
+        encoder = None
+        file_size = stats.total_bytes
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            while offset < file_size:
+                chunk = f.read(min(self.chunk_size, file_size - offset))
+                if not chunk:
+                    raise EOFError(f"ファイルが途中で終了しました: {file_path}")
+                header = {"digest": digest, "offset": offset, "length": len(chunk), "crc32": zlib.crc32(chunk)}
+                if stats.encoding and encoder is None:
+                    if await asyncio.to_thread(is_compressible, chunk):
+                        encoder = ChunkEncoder(stats.encoding)
+                        header["reset"] = True
+                    else:
+                        logger.info(f"圧縮の効果がないため圧縮せずに送信します({self.session_id}): {file_path}")
+                        stats.encoding = None
+                body = chunk
+                if encoder is not None:
+                    body = await asyncio.to_thread(encoder.encode, chunk)
+                    header |= {"encoding": encoder.encoding, "size": len(body)}
+                async with self._write_lock:
+                    if self.closed:
+                        raise ConnectionError("クライアントとの接続が切断されました")
+                    # ヘッダーと本体を続けてバッファに積むので、drain中に中断されても区切りは壊れない
+                    self.writer.write(self._encode(MessageType.CHUNK, 0, json.dumps(header).encode()))
+                    self.writer.write(body)
+                    try:
+                        await self.writer.drain()
+                    except ConnectionError as e:
+                        self._connection_lost(e)
+                        raise
+                offset += len(chunk)
+                stats.bytes_sent += len(chunk)
+                stats.wire_bytes += len(body)
+                if progress:
+                    progress(offset, file_size)
+        if encoder is not None:
+            stats.compress_seconds += encoder.cpu_seconds
+
+    async def query_assets(self, digests: list[str], timeout: float | None = None) -> set[str]:
+        """
+        クライアントが保持しているアセットを問い合わせる
+
+        Args:
+            digests (list[str]): 問い合わせるアセットのダイジェスト
+            timeout (float | None): 応答までの期限(秒)
+
+        Returns:
+            set[str]: digests のうちクライアントが保持しているダイジェスト
+        """
+        reply = json.loads(await self._request(MessageType.HAVE, json.dumps({"digests": digests}), timeout=timeout))
+        return set(reply.get("have", [])) & set(digests)
+
+    async def load_asset(self, digest: str, name: str, timeout: float | None = None) -> str:
+        """
+        クライアントが保持しているアセットを読み込ませ、結果を返す
+
+        Args:
+            digest (str): アセットのダイジェスト
+            name (str): アセットのファイル名
+            timeout (float | None): 応答までの期限(秒)
+        """
+        payload = json.dumps({"digest": digest, "name": name}, ensure_ascii=False)
+        result = await self._request(MessageType.LOAD, payload, timeout=timeout)
+        logger.info(f"保持済みのアセットを読み込ませました({self.session_id}): {name} ({digest[:12]})")
+        return result
+
+    def _connection_lost(self, error: Exception) -> None:
+        """
+        送信中に接続が切れた(ConnectionResetError, BrokenPipeErrorなど)場合に、セッションを閉じたことにする
+
+        受信側(read_loop)が切断に気付く前でも、このセッションに送信しないようにし、
+        再接続を待つ処理(wait_for_display)がこのセッションを返さないようにする。
+        """
+        if not self.closed:
+            logger.warning(f"送信中に接続が切断されました({self.session_id}): {error}")
+        self.closed = True
+        self.writer.close()
+
+    async def close(self) -> None:
+        """
+        クライアントとの接続を閉じる
+        """
+        self.closed = True
+        self._set_state(SessionState.CLOSED)
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+def _set_keepalive(sock: socket.socket | None, idle: int, interval: int, count: int) -> None:
+    """
+    TCPのkeepaliveを設定する (OSが対応していないオプションは設定しない)
+
+    Args:
+        sock (socket.socket | None): 設定するソケット
+        idle (int): 最後の通信からkeepaliveを送信し始めるまでの時間(秒)
+        interval (int): keepaliveを送信する間隔(秒)
+        count (int): 応答がない場合に切断するまでの回数
+    """
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    except OSError as e:
+        logger.warning(f"TCPのkeepaliveを設定できませんでした: {e}")
+
+
 class SocketServer:
     """
-    Socketサーバーを管理するクラス
+    Unityクライアントとの接続を管理するasyncioベースのサーバー
+
+    複数のUnityクライアントをセッションIDごとに保持し、
+    特定のセッションまたは全セッションへのコマンド・ファイル送信を行う。
+    イベントループは start() を呼び出したスレッドで動作し、
+    他のスレッドからは submit() や同期版のメソッドで操作する。
+
+    protocol には接続直後(クライアントからデータが届く前)に使用する通信形式 ("text" / "binary") を指定する。
+
+    resumable が有効な場合、またはクライアントがHELLOで "upload" に対応していると通知した場合、
+    ファイルはチェックサム付きの分割転送で送信し、
+    途中で切断されたときは同じDisplayの再接続を resume_timeout 秒まで待って続きから再開する。
+    分割転送ではHELLOで合意した圧縮方式 (compression の優先順) でチャンクを圧縮する。
+
+    クライアントが "assets" に対応している場合、ファイルは内容のダイジェストで識別し、
+    Displayがすでに保持しているファイルは送信せずに読み込みだけを指示する。
+    どのDisplayがどのアセットを保持しているかは assets (asset_manifest に保存) に記録する。
+
+    UIからのファイル転送は transfers (TransferManager) でバックグラウンドに実行し、進捗を参照する。
+
+    validate_splats が有効な場合、.plyファイルは送信前に3D Gaussian Splattingの形式か検証する。
+    splat_compression を指定した場合は、送信前にPLYを圧縮(app.splat.compress)して、圧縮したファイルを送信する。
+    splat_tile_size を指定した場合は、PLYのGaussianを空間的に近い順(Morton順)に並べ替えて splat_tile_size 件ずつの
+    タイル(app.splat.tiling)に分け、タイルの索引とバウンディングボックスを付けて送信する。
+    lod_fractions を指定した場合、"lod" に対応したクライアントにはPLYから重要度で間引いたLOD(app.splat.lod)を作成し、
+    最も粗いLODから順に送信する。
+    変換したファイル(圧縮・タイル分割・LOD)は variants (VariantCache) に元のファイルのダイジェストと設定ごとに保存し、
+    同じシーンを再び送信するときは変換せずに再利用する (合計 splat_cache_size バイトを超えたら古いものから削除する)。
+    PLYの検証と変換は workers (SplatWorkerPool) の splat_workers 個のワーカープロセスで実行し、
+    1ジョブのメモリ使用量を splat_job_memory バイトまでに制限する。
+
+    次・前のシーンへの切り替えは playlist (ScenePlaylist, scene_dir に保存) の順に prefetcher (ScenePrefetcher) で行い、
+    "prefetch" に対応したDisplayには表示中のシーンの前後 prefetch_radius 件をバックグラウンドで先読みさせる。
+
+    delta_updates が有効な場合、"delta" に対応したDisplayに送信したPLYは variants に差分の元として残し、
+    同じ名前のシーンを再び送信するときは、Displayが保持している版との差分(変更されたブロック)だけを送信する。
+
+    各セッションの接続状態 (SessionState) の変化は add_state_listener() で受け取れる。
+    切断されてから reconnect_grace 秒以内のDisplay宛てのコマンドは、エラーにせず再接続を待ってから送信する
+    (待機できるのは max_queued_commands 件まで)。
     """
-    def __init__(self, host="0.0.0.0", port=8765):
-        self.host = host
-        self.port = port
-        self.server_socket = None
-        self.client_socket = None
-        self.client_address = None
+    # 差分がファイル全体のこの割合を超える場合は、差分を使わずに全体を送信する
+    delta_max_ratio = 0.5
+
+    def __init__(self, settings: ServerSettings | None = None):
+        settings = settings or ServerSettings()
+        self.settings = settings
+        self.host = settings.host
+        self.port = settings.port
+        self.resumable = settings.resumable
+        self.resume_timeout = settings.resume_timeout
+        self.max_resume_attempts = settings.max_resume_attempts
+        self.assets = AssetManifest(settings.asset_manifest)
+        self.validate_splats = settings.validate_splats
+        # 送信前にPLYを圧縮する設定 (Noneの場合は圧縮しない。{} の場合は既定の設定で圧縮する)
+        self.splat_compression = (
+            SplatCompressionOptions(**settings.splat_compression) if settings.splat_compression is not None else None
+        )
+        # 変換したファイルのキャッシュ (アップロードしたファイルは送信後に削除されるため、変換結果はここに残す)
+        self.variants = VariantCache(settings.splat_cache_dir, settings.splat_cache_size)
+        # PLYの検証・変換を実行するワーカープロセス (UIやイベントループを止めないように別プロセスで実行する)
+        self.workers = SplatWorkerPool(settings.splat_workers, settings.splat_job_memory)
+        # 送信前にPLYをタイルに分割する場合の1タイルのGaussianの数 (Noneの場合は分割しない)
+        self.splat_tile_size = settings.splat_tile_size
+        # LODに含めるGaussianの累積の割合 (Noneの場合はLODを作成しない)
+        self.lod_fractions = settings.lod_fractions
+        # 同じ名前のシーンを、Displayが保持している版との差分で送信するか
+        self.delta_updates = settings.delta_updates
+        # 次・前のシーンに切り替える順番と、前後のシーンの先読み
+        self.playlist = ScenePlaylist(settings.scene_dir)
+        self.prefetcher = ScenePrefetcher(self, self.playlist, settings.prefetch_radius)
+        # Displayが接続されていないときにアップロードされ、接続後に送信するファイル
+        self.spooled_files: list[str] = []
+        # バックグラウンドで実行するファイル転送 (同時に max_transfers 件まで)
+        self.transfers = TransferManager(self, settings.max_transfers)
+        # ハートビートとTCPのkeepaliveの設定(秒)
+        self.heartbeat_interval = settings.heartbeat_interval
+        self.heartbeat_timeout = settings.heartbeat_timeout
+        self.keepalive = (settings.keepalive_idle, settings.keepalive_interval, settings.keepalive_count)
+        # 切断から reconnect_grace 秒以内のDisplay宛てのコマンドは、再接続を待ってから送信する
+        self.reconnect_grace = settings.reconnect_grace
+        self.max_queued_commands = settings.max_queued_commands
+        self._queued_commands = 0
+        # 切断されたDisplayと切断された時刻 (再接続すると削除する)
+        self._disconnected_at: dict[str, float] = {}
+        self._state_listeners: list[StateListener] = []
+        # 送信から応答までの既定の期限(秒) Noneの場合は無期限
+        self.command_timeout = settings.command_timeout
+        self.file_timeout = settings.file_timeout
         self.running = False
-        self.is_connected = False
+        self.sessions: dict[str, UnitySession] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._stop_event: asyncio.Event | None = None
+        # Displayが名乗るたびにセットして差し替えるイベント (wait_for_display用)
+        self._display_identified: asyncio.Event | None = None
+        self._loop_thread_id: int | None = None
+
+    @property
+    def is_connected(self) -> bool:
+        """
+        1台以上のUnityクライアントが接続しているか
+        """
+        return any(session.state != SessionState.CLOSED for session in self.sessions.values())
 
     def start(self) -> None:
         """
         サーバを起動
+
+        呼び出したスレッドでイベントループを実行し、stop() が呼ばれるまでブロックする
         """
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(1)
-            logger.info(f"サーバーが起動しました: {self.host}:{self.port}")
-            self.running = True
+            self.loop.run_until_complete(self._serve())
+        except KeyboardInterrupt:
+            logger.info("サーバーを停止します")
         except OSError as e:
             logger.error(f"サーバを起動させるポートがすでに使用されています: {e}")
-            self.stop()
             raise e
         except Exception as e:
-            logger.error(f"サーバーの起動中にエラーが発生しました: {e}")
-            self.stop()
+            logger.error(f"サーバーでエラーが発生しました {e}")
             raise e
+        finally:
+            self.running = False
+            self.loop.close()
+            self.workers.shutdown()
+            logger.info("サーバーを完全に停止しました")
 
+    async def _serve(self) -> None:
+        """
+        クライアントの接続を受け付け、stop() が呼ばれるまで待機する
+        """
+        self._stop_event = asyncio.Event()
+        self._display_identified = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.running = True
+        logger.info(f"サーバーが起動しました: {self.host}:{self.port}")
+        logger.info("クライアントの接続を待機中...")
         try:
-            while self.running:
-                logger.info("クライアントの接続を待機中...")
-                self.client_socket, self.client_address = self.server_socket.accept()
-                logger.info(f"クライアントが接続しました: {self.client_address}")
-                self.handle_client(self.client_socket)
-        except KeyboardInterrupt:
-            logger.info("サーバーを停止します")
-        except Exception as e:
-            logger.error(f"サーバーでエラーが発生しました {e}")
+            async with self._server:
+                await self._stop_event.wait()
         finally:
-            self.stop()
+            await asyncio.gather(*(session.close() for session in list(self.sessions.values())))
+            self.sessions.clear()
 
     def stop(self) -> None:
         """
         サーバーを停止
         """
         self.running = False
-        self.is_connected = False
-        if self.client_socket:
-            self.client_socket.close()
-        if self.server_socket:
-            self.server_socket.close()
-        logger.info("サーバーを完全に停止しました")
-
-    def _wait_for_result(self) -> str:
-        """
-        クライアントからRESULT行を受け取るまでブロッキングで待機するユーティリティ
-        """
-        buffer = ""
-        while True:
-            data = self.client_socket.recv(1024).decode('utf-8')
-            if not data:
-                raise ConnectionError("クライアントとの接続が切断されました")
-            buffer += data
-            lines = buffer.split('\n')
-            # 最後の行は未完成の可能性があるので、完全な行だけ処理
-            for i in range(len(lines)-1):
-                line = lines[i].strip()
-                if line.startswith("RESULT:"):
-                    # 結果を返す
-                    return line[len("RESULT:"):]
-            # 未完成の最後の行をbufferに残す
-            if not buffer.endswith('\n'):
-                buffer = lines[-1]
-            else:
-                buffer = ""
-
-    def handle_client(self, client_socket: socket.socket) -> None:
-        """
-        クライアントとの通信を処理するスレッドを管理
-
-        Args:
-            client_socket (socket.socket): クライアントとの通信用ソケット
-        """
-        self.is_connected = True
+        if self.loop is not None and not self.loop.is_closed() and self._stop_event is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        クライアント1台との通信を処理する
+
+        Args:
+            reader (asyncio.StreamReader): クライアントからの受信用ストリーム
+            writer (asyncio.StreamWriter): クライアントへの送信用ストリーム
+        """
+        session = UnitySession(uuid.uuid4().hex[:8], reader, writer, self.settings)
+        session.on_hello = self._on_hello
+        session.on_state_change = self._on_state_change
+        _set_keepalive(writer.get_extra_info("socket"), *self.keepalive)
+        self.sessions[session.session_id] = session
+        logger.info(f"クライアントが接続しました: {session.address} (session: {session.session_id})")
+        heartbeat = asyncio.ensure_future(session.heartbeat(self.heartbeat_interval, self.heartbeat_timeout))
         try:
-            # クライアントからのデータを受け取る処理（必要なら実装）
-            while self.running:
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
-                    break
-                logger.debug(f"クライアントからのデータ: {data}")
+            await session.read_loop()
         except Exception as e:
             logger.error(f"クライアント処理中にエラーが発生しました: {e}")
         finally:
-            client_socket.close()
-            self.is_connected = False
-            logger.info("クライアントとの接続を終了しました")
+            heartbeat.cancel()
+            self.sessions.pop(session.session_id, None)
+            if session.identified:
+                self._disconnected_at[session.display_id] = time.monotonic()
+            await session.close()
+            logger.info(f"クライアントとの接続を終了しました (session: {session.session_id})")
 
-    def send_command(self, command: str) -> str:
+    def _on_hello(self, session: UnitySession) -> None:
         """
-        クライアントにコマンドを送信
+        クライアントがHELLOで名乗ったときに wait_for_display() の待機を解除し、保持していたファイルを送信する
+        """
+        self._disconnected_at.pop(session.display_id, None)
+        self._display_identified.set()
+        self._display_identified = asyncio.Event()
+        if self.spooled_files:
+            asyncio.ensure_future(self._send_spooled(session))
 
-        Args:
-            command (str): 送信するコマンド
+    def add_state_listener(self, listener: StateListener) -> None:
         """
-        if self.client_socket:
+        セッションの接続状態が変わったときに呼ばれるコールバックを登録する (イベントループのスレッドで呼ばれる)
+        """
+        self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener: StateListener) -> None:
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    def _on_state_change(self, session: UnitySession, state: SessionState) -> None:
+        for listener in list(self._state_listeners):
             try:
-                message = f"COMMAND:{command}\n"
-                self.client_socket.sendall(message.encode('utf-8'))
-                logger.debug(f"コマンドを送信しました: {command}")
-
-                # コマンドの実行結果を待機
-                result = self._wait_for_result()
-                logger.info(f"コマンドの実行結果: {result}")
-                return result
+                listener(session, state)
             except Exception as e:
-                logger.error(f"コマンド送信中にエラーが発生しました: {e}")
-        else:
-            logger.warning("クライアントが接続されていません")
+                logger.error(f"接続状態の通知中にエラーが発生しました: {e}")
 
-    def send_file(self, file_path: str) -> str:
+    def is_reconnecting(self, display_id: str | None = None) -> bool:
         """
-        クライアントにファイルを送信
+        切断されてから reconnect_grace 秒以内で、再接続を待っているDisplayがあるか
+
+        Args:
+            display_id (str | None): Displayの表示名。Noneの場合はいずれかのDisplay
+        """
+        now = time.monotonic()
+        if display_id is None:
+            return any(now - t < self.reconnect_grace for t in self._disconnected_at.values())
+        return display_id in self._disconnected_at and now - self._disconnected_at[display_id] < self.reconnect_grace
+
+    async def _wait_for_session(self, session_id: str | None) -> UnitySession:
+        """
+        送信先のセッションを取得する。再接続を待っているDisplayの場合は reconnect_grace 秒まで待機する
+
+        Raises:
+            ConnectionError: 該当するクライアントが接続されず、再接続も待っていない場合
+        """
+        try:
+            return self.get_session(session_id)
+        except ConnectionError:
+            if not self.is_reconnecting(session_id) or self._queued_commands >= self.max_queued_commands:
+                raise
+        self._queued_commands += 1
+        logger.info(f"Displayの再接続を待ってから送信します: {session_id or '(any)'}")
+        try:
+            async with asyncio.timeout(self.reconnect_grace):
+                while True:
+                    identified = self._display_identified
+                    try:
+                        return self.get_session(session_id)
+                    except ConnectionError:
+                        await identified.wait()
+        except TimeoutError as e:
+            raise ConnectionError(f"Displayが再接続されませんでした: {session_id or '(any)'}") from e
+        finally:
+            self._queued_commands -= 1
+
+    def find_display(self, display_id: str) -> UnitySession | None:
+        """
+        display_idが一致する接続中のセッションを取得する (複数ある場合は最も新しいもの)
+
+        Args:
+            display_id (str): Displayの表示名
+        """
+        for session in reversed(self.sessions.values()):
+            if session.display_id == display_id and not session.closed:
+                return session
+        return None
+
+    async def wait_for_display(self, display_id: str, timeout: float,
+                               exclude: UnitySession | None = None) -> UnitySession:
+        """
+        指定したDisplayが(再)接続するまで待機する
+
+        Args:
+            display_id (str): Displayの表示名
+            timeout (float): 待機する最大時間(秒)
+            exclude (UnitySession | None): 返さないセッション (送信に失敗した切断前のセッション)
+
+        Raises:
+            ConnectionError: 期限までに接続されなかった場合
+        """
+        try:
+            async with asyncio.timeout(timeout):
+                while (session := self.find_display(display_id)) is None or session is exclude:
+                    await self._display_identified.wait()
+                return session
+        except TimeoutError as e:
+            raise ConnectionError(f"Displayが再接続されませんでした: {display_id}") from e
+
+    def get_session(self, session_id: str | None = None) -> UnitySession:
+        """
+        送信先のセッションを取得する
+
+        Args:
+            session_id (str | None): セッションIDまたはdisplay_id。
+                Noneの場合は最も古くから接続しているセッション (閉じたセッションを除く)
+
+        Raises:
+            ConnectionError: 該当するクライアントが接続されていない場合
+        """
+        if session_id is None:
+            for session in self.sessions.values():
+                if not session.closed and session.state != SessionState.CLOSED:
+                    return session
+            raise ConnectionError("クライアントが接続されていません")
+        session = self.sessions.get(session_id) or self.find_display(session_id)
+        if session is None:
+            raise ConnectionError(f"クライアントが接続されていません: {session_id}")
+        return session
+
+    async def send_command_async(self, command: str, session_id: str | None = None,
+                                 timeout: float | None = None) -> str:
+        """
+        クライアントにコマンドを送信し、実行結果を返す
+
+        Args:
+            command (str): 送信するコマンド
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)。Noneの場合は command_timeout
+
+        Raises:
+            ConnectionError: クライアントが接続されていない場合
+                (再接続を待っているDisplayは reconnect_grace 秒まで待機する)
+            TimeoutError: 期限までに応答がなかった場合
+        """
+        session = await self._wait_for_session(session_id)
+        result = await session.send_command(command, timeout if timeout is not None else self.command_timeout)
+        logger.info(f"コマンドの実行結果({session.session_id}): {result}")
+        return result
+
+    async def send_file_async(self, file_path: str, session_id: str | None = None, timeout: float | None = None,
+                              progress: ProgressCallback | None = None, prefetch: bool = False) -> str:
+        """
+        クライアントにファイルを送信し、受信結果を返す
 
         Args:
             file_path (str): 送信するファイルのパス
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)。Noneの場合は file_timeout
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+            prefetch (bool): 表示させずに保持だけさせるか (クライアントが "assets" と "prefetch" に対応している場合のみ)
 
         Raises:
             FileNotFoundError: ファイルが見つからない場合
-            e: その他のエラー
+            ValueError: prefetch が指定されたが、クライアントが先読みに対応していない場合
+            ConnectionError: クライアントが接続されていない場合
+            TimeoutError: 期限までに応答がなかった場合
+            PlyError: .plyファイルが3D Gaussian Splattingの形式でない場合
         """
-        if not self.client_socket:
-            logger.warning("クライアントが接続されていません")
-            raise ConnectionError("クライアントが接続されていません")
+        if not os.path.isfile(file_path):
+            logger.error(f"ファイルが見つかりません: {file_path}")
+            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
+        session = self.get_session(session_id)
+        if prefetch and not ScenePrefetcher.supports(session):
+            raise ValueError(f"Displayが先読みに対応していません: {session.display_id}")
+        await self._validate_splat(file_path)
+        # 再開可能な分割転送は resumable の設定またはクライアントの対応状況に従う
+        options = SendOptions(
+            timeout if timeout is not None else self.file_timeout, progress,
+            self.resumable or "upload" in session.capabilities, prefetch,
+        )
+        # 送信中に使用する変換済みのファイルは、送信が終わるまでキャッシュから削除させない
+        pinned: list[str] = []
+        try:
+            file_path = await self._compress_splat(file_path, pinned)
+            file_path = await self._tile_splat(file_path, pinned)
+            if self.lod_fractions is not None and file_path.lower().endswith(".ply") and "lod" in session.capabilities:
+                return await self._send_lods(session, file_path, options, pinned)
+            result = await self._send_prepared(session, file_path, options)
+        finally:
+            for path in pinned:
+                await asyncio.to_thread(self.variants.unpin, path)
+        logger.info(f"ファイルの送信結果({session.session_id}): {result}")
+        return result
+
+    async def _send_prepared(self, session: UnitySession, file_path: str, options: SendOptions) -> str:
+        """
+        検証・圧縮したファイルを、クライアントの対応状況に合った方法で送信する
+        """
+        if "assets" in session.capabilities:
+            return await self._send_asset(session, file_path, options)
+        if options.resumable:
+            return await self._send_file_resumable(session, file_path, options)
+        return await session.send_file(file_path, options.timeout, options.progress)
+
+    async def _send_lods(self, session: UnitySession, file_path: str, options: SendOptions,
+                         pinned: list[str]) -> str:
+        """
+        PLYのLODを作成し、最も粗いLODから順に送信する
+
+        粗いLODは全体の数%の大きさなので、シーンを切り替えるとすぐに表示され、残りのLODで徐々に詳細になる。
+        進捗は全てのLODを合わせたサイズに対して通知する。
+
+        Returns:
+            str: 最後のLODの受信結果
+        """
+        lod_set = await self._build_lods(file_path, pinned)
+        # 以前に作成したLODには、Gaussianを含まない空のLODが残っている場合があるため送信しない
+        tiers = [
+            (tier, path) for tier, path in zip(lod_set.tiers, lod_set.paths(), strict=True) if tier.vertex_count
+        ]
+        total = sum(os.path.getsize(path) for _, path in tiers)
+        sent = 0
+        result = ""
+        for tier, path in tiers:
+            def tier_progress(tier_sent: int, tier_total: int, offset: int = sent) -> None:
+                if options.progress:
+                    options.progress(offset + tier_sent, total)
+
+            result = await self._send_prepared(session, path, dataclasses.replace(options, progress=tier_progress))
+            sent += os.path.getsize(path)
+            logger.info(
+                f"LODの送信結果({session.session_id}): {tier.file_name} ({tier.vertex_count} vertices) {result}"
+            )
+        return result
 
+    async def _build_lods(self, file_path: str, pinned: list[str]) -> LodSet:
+        """
+        ワーカープロセスでPLYのLODを作成して variants に保存する (作成済みの場合は再利用する)
+        """
+        def create(directory: str) -> None:
+            self.workers.run(
+                "lod", file_path, build_lods, file_path, self.lod_fractions, directory=directory, with_progress=True
+            )
+
+        params = f"lod {json.dumps(sorted(self.lod_fractions))} {os.path.basename(file_path)}"
+        digest = await self._digest(file_path)
+        directory = await asyncio.to_thread(self.variants.get_or_create, digest, params, create, True)
+        pinned.append(directory)
+        # キャッシュのLODはダイジェストが一致するため、作り直さずに読み込まれる
+        return await asyncio.to_thread(build_lods, file_path, self.lod_fractions, directory=directory)
+
+    async def prepare_splat_async(self, file_path: str) -> dict[str, Any]:
+        """
+        送信前の変換(圧縮・タイル分割・LOD)を送信せずに行い、variants に保存する
+
+        取り込み時に呼び出しておくと、以降の送信では変換済みのファイルをそのまま使用する。
+
+        Returns:
+            dict[str, Any]: 作成した変換の種類ごとの概要
+                ("compress": 圧縮後のバイト数, "tile": 1タイルのGaussianの数, "lod": LODごとのGaussianの数)
+
+        Raises:
+            PlyError: 3D Gaussian SplattingのPLYでない場合
+        """
+        variants: dict[str, Any] = {}
+        if not file_path.lower().endswith(".ply"):
+            return variants
+        await self._validate_splat(file_path)
+        pinned: list[str] = []
         try:
-            if not os.path.isfile(file_path):
-                logger.error(f"ファイルが見つかりません: {file_path}")
-                raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
+            compressed = await self._compress_splat(file_path, pinned)
+            if compressed != file_path:
+                variants["compress"] = os.path.getsize(compressed)
+            tiled = await self._tile_splat(compressed, pinned)
+            if tiled != compressed:
+                variants["tile"] = self.splat_tile_size
+            if self.lod_fractions is not None:
+                lod_set = await self._build_lods(tiled, pinned)
+                variants["lod"] = [tier.vertex_count for tier in lod_set.tiers]
+        finally:
+            for path in pinned:
+                await asyncio.to_thread(self.variants.unpin, path)
+        return variants
 
-            # ファイル情報を送信
-            file_name = os.path.basename(file_path)
-            file_size = os.path.getsize(file_path)
-            file_header = f"FILE:{file_name}:{file_size}\n"
-            self.client_socket.sendall(file_header.encode('utf-8'))
+    async def _send_asset(self, session: UnitySession, file_path: str, options: SendOptions) -> str:
+        """
+        ファイルをダイジェストで識別し、Displayが保持していない場合だけ分割転送で送信する
 
-            # ファイル内容を送信
-            with open(file_path, "rb") as f:
-                while chunk := f.read(1024):
-                    self.client_socket.sendall(chunk)
+        保持している場合は読み込みだけを指示するため、同じファイルを複数のDisplayに
+        再配布するときはダイジェストの計算(キャッシュ済み)と問い合わせだけで完了する。
+        prefetch の場合は保持させるだけで、読み込みは指示しない。
+        """
+        digest = await asyncio.to_thread(file_digest, file_path)
+        file_name = os.path.basename(file_path)
+        display_id = session.display_id
+        bases = self._delta_bases(session, file_name, digest)
+        held = await session.query_assets([digest, *bases], self.command_timeout)
+        if digest in held and options.prefetch:
+            result = f"already held {file_name}"
+        elif digest in held:
+            result = await session.load_asset(digest, file_name, options.timeout)
+            if options.progress:
+                file_size = os.path.getsize(file_path)
+                options.progress(file_size, file_size)
+        else:
+            self.assets.discard(display_id, digest)
+            result = None
+            if base_digest := next((base for base in bases if base in held), None):
+                result = await self._send_delta(session, file_path, digest, base_digest, options)
+            if result is None:
+                result = await self._send_file_resumable(session, file_path, options, digest)
+            if self._delta_enabled(session, file_name):
+                await self._keep_delta_base(file_path, digest)
+        self.assets.add(display_id, digest, file_name)
+        return result
+
+    def _delta_enabled(self, session: UnitySession, file_name: str) -> bool:
+        return self.delta_updates and "delta" in session.capabilities and file_name.lower().endswith(".ply")
+
+    def _delta_bases(self, session: UnitySession, file_name: str, digest: str) -> list[str]:
+        """
+        Displayが保持している同じ名前の以前の版のうち、差分の元として variants に残っているもの (新しい順)
+        """
+        if not self._delta_enabled(session, file_name):
+            return []
+        return [
+            base_digest for base_digest, name in reversed(self.assets.assets(session.display_id).items())
+            if name == file_name and base_digest != digest and self.variants.has(base_digest, f"delta-base {name}")
+        ]
 
-            logger.debug(f"ファイルを送信しました: {file_path}")
+    async def _keep_delta_base(self, file_path: str, digest: str) -> None:
+        """
+        送信したファイルを、次に同じ名前のシーンを送信するときの差分の元として variants に残す
+        """
+        file_name = os.path.basename(file_path)
+
+        def create(directory: str) -> None:
+            path = os.path.join(directory, file_name)
+            try:
+                # 変換済みのファイルやプレイリストのファイルと同じファイルシステムであればコピーしない
+                os.link(file_path, path)
+            except OSError:
+                shutil.copyfile(file_path, path)
+
+        await asyncio.to_thread(self.variants.get_or_create, digest, f"delta-base {file_name}", create)
 
-            # ファイルの送信結果を待機
-            result = self._wait_for_result()
-            logger.info(f"ファイルの送信結果: {result}")
+    async def _send_delta(self, session: UnitySession, file_path: str, digest: str, base_digest: str,
+                          options: SendOptions) -> str | None:
+        """
+        Displayが保持している base_digest の版との差分を作成して送信する
+
+        差分を作成できない場合や、差分が元のファイルの delta_max_ratio を超える場合は送信せずにNoneを返す
+        (呼び出し元がファイル全体を送信する)。差分は variants に保存し、他のDisplayへの送信でも再利用する。
+
+        Returns:
+            str | None: Displayの受信結果
+        """
+        file_name = os.path.basename(file_path)
+        base_dir = await asyncio.to_thread(self.variants.get, base_digest, f"delta-base {file_name}", True)
+        if base_dir is None:
+            return None
+        patch_dir = None
+        try:
+            def create(directory: str) -> None:
+                self.workers.run(
+                    "delta", file_name, build_delta, os.path.join(base_dir, file_name), file_path,
+                    os.path.join(directory, f"{file_name}.delta"), with_progress=True,
+                )
+
+            patch_dir = await asyncio.to_thread(
+                self.variants.get_or_create, digest, f"delta {base_digest} {file_name}", create, True
+            )
+            patch_path = os.path.join(patch_dir, f"{file_name}.delta")
+            patch_size, file_size = os.path.getsize(patch_path), os.path.getsize(file_path)
+            if patch_size > file_size * self.delta_max_ratio:
+                logger.info(f"差分が大きいため全体を送信します: {file_name} ({patch_size / file_size:.0%})")
+                return None
+            result = await self._send_file_resumable(
+                session, patch_path, options, delta={"base": base_digest, "digest": digest, "name": file_name}
+            )
+            logger.info(
+                f"差分を送信しました({session.session_id}): {file_name} "
+                f"{patch_size / 1024**2:.1f} MiB / {file_size / 1024**2:.1f} MiB ({patch_size / file_size:.1%})"
+            )
             return result
+        except (ConnectionError, TimeoutError):
+            raise
+        except (DeltaError, OSError) as e:
+            # Displayが差分を適用できなかった場合も含む
+            logger.warning(f"差分を送信できなかったため全体を送信します({session.session_id}): {file_name} {e}")
+            return None
+        finally:
+            for path in (base_dir, patch_dir):
+                if path is not None:
+                    await asyncio.to_thread(self.variants.unpin, path)
+
+    async def _send_file_resumable(self, session: UnitySession, file_path: str, options: SendOptions,
+                                   digest: str | None = None, delta: dict | None = None) -> str:
+        """
+        分割転送でファイルを送信し、切断された場合は同じDisplayの再接続を待って再開する
+        """
+        if digest is None:
+            digest = await asyncio.to_thread(file_digest, file_path)
+        display_id = session.display_id
+        for attempt in range(self.max_resume_attempts):
+            try:
+                return await session.send_file_resumable(file_path, digest, options, delta)
+            except ConnectionError as e:
+                if attempt + 1 >= self.max_resume_attempts:
+                    raise
+                logger.warning(f"ファイルの転送中に切断されました。{display_id} の再接続を待機します: {e}")
+                session = await self.wait_for_display(display_id, self.resume_timeout, exclude=session)
+        raise ConnectionError(f"ファイルの転送を再開できませんでした: {file_path}")
+
+    async def _validate_splat(self, file: str | GrowingFile) -> None:
+        """
+        .plyファイルが3D Gaussian Splattingの形式かを検証する (validate_splats が無効な場合は何もしない)
+
+        書き込み中のファイルはヘッダーが書き込まれるのを待ち、ヘッダーと最終的なサイズだけで検証する。
+
+        Raises:
+            PlyError: 3D Gaussian SplattingのPLYとして正しくない場合
+        """
+        file_name = file.file_name if isinstance(file, GrowingFile) else file
+        if not self.validate_splats or not file_name.lower().endswith(".ply"):
+            return
+        if isinstance(file, GrowingFile):
+            validate_splat_header(parse_header(await file.head(MAX_HEADER_SIZE)), file.size)
+        else:
+            await asyncio.to_thread(self.workers.run, "validate", file, validate_splat, file)
+
+    def compresses(self, file_name: str) -> bool:
+        """
+        送信前に圧縮するファイルか (圧縮するファイルはアップロードの完了を待ってから送信する)
+        """
+        return self.splat_compression is not None and file_name.lower().endswith(".ply")
+
+    def needs_complete_file(self, file_name: str) -> bool:
+        """
+        送信前にファイル全体が必要か (圧縮・タイル分割・LODの作成を行うファイルは、書き込み中に送信を始められない)
+
+        LODは "lod" に対応したクライアントにだけ作成するため、対応したクライアントが接続している場合だけ
+        ファイル全体を待つ。
+        """
+        if not file_name.lower().endswith(".ply"):
+            return False
+        if self.compresses(file_name) or self.splat_tile_size is not None:
+            return True
+        sessions = list(self.sessions.values())
+        return self.lod_fractions is not None and any("lod" in session.capabilities for session in sessions)
+
+    async def _compress_splat(self, file_path: str, pinned: list[str]) -> str:
+        """
+        splat_compression が指定されている場合、PLYを圧縮したファイルのパスを返す (それ以外は file_path のまま)
+
+        圧縮したファイルは内容のダイジェストと設定ごとに保存し、同じファイルを複数のDisplayに送信する場合は再利用する。
+        ファイル名は送信先での表示のために元のファイル名のままにする。
+        """
+        if not self.compresses(file_path) or read_quantization(await asyncio.to_thread(read_header, file_path)):
+            return file_path
+        options = json.dumps(dataclasses.asdict(self.splat_compression), sort_keys=True)
+        return await self._convert_splat(file_path, "compress", options, pinned, compress_splat, self.splat_compression)
+
+    async def _tile_splat(self, file_path: str, pinned: list[str]) -> str:
+        """
+        splat_tile_size が指定されている場合、PLYをタイルに分割したファイルのパスを返す (それ以外は file_path のまま)
+        """
+        if self.splat_tile_size is None or not file_path.lower().endswith(".ply"):
+            return file_path
+        if is_tiled(await asyncio.to_thread(read_header, file_path)):
+            return file_path
+        return await self._convert_splat(
+            file_path, "tile", str(self.splat_tile_size), pinned, tile_splat, self.splat_tile_size
+        )
+
+    async def _convert_splat(self, file_path: str, kind: str, params: str, pinned: list[str],
+                             convert: Callable[..., Any], *args: Any) -> str:
+        """
+        ワーカープロセスで convert(file_path, 出力先, *args) を実行して変換したファイルを variants に保存し、
+        そのパスを返す
+
+        変換したファイルは内容のダイジェストと変換の種類(kind)・設定(params)ごとに保存し、同じファイルを再び送信する場合は
+        再利用する。ファイル名は送信先での表示のために元のファイル名のままにする
+        (同じ内容でも名前が違えば別のエントリになる)。
+        保存したエントリは pinned に追加し、呼び出し元が送信を終えるまで削除されないようにする。
+        """
+        file_name = os.path.basename(file_path)
+
+        def create(directory: str) -> None:
+            self.workers.run(
+                kind, file_path, convert, file_path, os.path.join(directory, file_name), *args, with_progress=True
+            )
+
+        digest = await self._digest(file_path)
+        params = f"{kind} {params} {file_name}"
+        directory = await asyncio.to_thread(self.variants.get_or_create, digest, params, create, True)
+        pinned.append(directory)
+        return os.path.join(directory, file_name)
+
+    @staticmethod
+    async def _digest(file_path: str) -> str:
+        return await asyncio.to_thread(file_digest, file_path)
+
+    async def stream_file_async(self, source: GrowingFile, session_id: str | None = None,
+                                timeout: float | None = None, progress: ProgressCallback | None = None) -> str:
+        """
+        書き込み中のファイルをクライアントに書き込まれた分から送信し、受信結果を返す
+
+        Args:
+            source (GrowingFile): 書き込み中のファイル
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)。Noneの場合は file_timeout
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+        """
+        session = self.get_session(session_id)
+        await self._validate_splat(source)
+        result = await session.send_stream(source, timeout if timeout is not None else self.file_timeout, progress)
+        logger.info(f"ファイルの送信結果({session.session_id}): {result}")
+        return result
+
+    async def broadcast_stream_async(self, source: GrowingFile, timeout: float | None = None,
+                                     progress: ProgressCallback | None = None) -> dict[str, str | Exception]:
+        """
+        書き込み中のファイル(アップロード中のファイルなど)を、接続中の全クライアントに書き込まれた分から転送する
+
+        書き込みの完了を待たずに送信を始めるため、アップロードとUnityへの転送が並行して進む。
+
+        Args:
+            source (GrowingFile): 書き込み中のファイル
+            timeout (float | None): 応答までの期限(秒)。Noneの場合は file_timeout
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック
+
+        Returns:
+            dict[str, str | Exception]: セッションIDごとの受信結果 (失敗した場合は例外)
+        """
+        session_ids = list(self.sessions)
+        results = await asyncio.gather(
+            *(self.stream_file_async(source, session_id, timeout, progress) for session_id in session_ids),
+            return_exceptions=True,
+        )
+        return dict(zip(session_ids, results, strict=True))
+
+    def spool_file(self, file_path: str) -> None:
+        """
+        Displayが接続されていないときのファイルを保持し、次にDisplayが名乗ったときに送信する
+
+        送信に成功したファイルは削除する。
+
+        Args:
+            file_path (str): 送信するファイルのパス
+        """
+        self.spooled_files.append(file_path)
+        logger.info(f"Displayが接続されていないため、接続後に送信します: {file_path}")
+
+    async def _send_spooled(self, session: UnitySession) -> None:
+        """
+        保持していたファイルを、名乗ったDisplayに送信する
+        """
+        while self.spooled_files and not session.closed:
+            file_path = self.spooled_files.pop(0)
+            try:
+                await self.send_file_async(file_path, session.session_id)
+            except Exception as e:
+                logger.error(f"保持していたファイルを送信できませんでした({session.session_id}): {file_path} {e}")
+                self.spooled_files.insert(0, file_path)
+                return
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    async def broadcast_command_async(self, command: str, timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        接続中の全クライアントにコマンドを送信する
+
+        Args:
+            command (str): 送信するコマンド
+            timeout (float | None): 応答までの期限(秒)
+
+        Returns:
+            dict[str, str | Exception]: セッションIDごとの実行結果 (失敗した場合は例外)
+        """
+        if not self.sessions and self.is_reconnecting():
+            await self._wait_for_session(None)
+        session_ids = list(self.sessions)
+        results = await asyncio.gather(
+            *(self.send_command_async(command, session_id, timeout) for session_id in session_ids),
+            return_exceptions=True,
+        )
+        return dict(zip(session_ids, results, strict=True))
+
+    async def broadcast_file_async(self, file_path: str, timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        接続中の全クライアントにファイルを送信する
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            timeout (float | None): 応答までの期限(秒)
+
+        Returns:
+            dict[str, str | Exception]: セッションIDごとの受信結果 (失敗した場合は例外)
+        """
+        if not os.path.isfile(file_path):
+            logger.error(f"ファイルが見つかりません: {file_path}")
+            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
+        session_ids = list(self.sessions)
+        results = await asyncio.gather(
+            *(self.send_file_async(file_path, session_id, timeout) for session_id in session_ids),
+            return_exceptions=True,
+        )
+        return dict(zip(session_ids, results, strict=True))
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """
+        サーバーのイベントループでコルーチンを実行する (他スレッドからブロックせずに呼び出す用)
+
+        Args:
+            coro (Coroutine): 実行するコルーチン
+
+        Returns:
+            concurrent.futures.Future: 実行結果を受け取るFuture
+        """
+        if self.loop is None or self.loop.is_closed():
+            coro.close()
+            raise ConnectionError("サーバーが起動していません")
+        if threading.get_ident() == self._loop_thread_id:
+            coro.close()
+            raise RuntimeError("イベントループのスレッドからは *_async メソッドを使用してください")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit_command(self, command: str, session_id: str | None = None,
+                       timeout: float | None = None) -> concurrent.futures.Future:
+        """
+        クライアントにコマンドを送信し、結果を受け取るFutureを返す (ブロックしない)
+
+        複数のコマンドを続けて送信した場合も応答を待たずに送信される。
+        返したFutureを cancel() するとクライアントにCANCELが通知される。
+
+        Args:
+            command (str): 送信するコマンド
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)
+        """
+        return self.submit(self.send_command_async(command, session_id, timeout))
+
+    def send_command(self, command: str, session_id: str | None = None, timeout: float | None = None) -> str:
+        """
+        クライアントにコマンドを送信 (結果が返るまでブロックする)
+
+        Args:
+            command (str): 送信するコマンド
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)
+        """
+        try:
+            return self.submit_command(command, session_id, timeout).result()
+        except TimeoutError as e:
+            logger.error(f"コマンドの応答が期限内に返りませんでした: {command} {e}")
+        except ConnectionError as e:
+            logger.warning(f"クライアントが接続されていません: {e}")
         except Exception as e:
-            raise e
+            logger.error(f"コマンド送信中にエラーが発生しました: {e}")
+
+    def send_file(self, file_path: str, session_id: str | None = None, timeout: float | None = None,
+                  progress: ProgressCallback | None = None) -> str:
+        """
+        クライアントにファイルを送信 (結果が返るまでブロックする)
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            session_id (str | None): 送信先のセッションID
+            timeout (float | None): 応答までの期限(秒)
+            progress (ProgressCallback | None): 送信の進捗通知用のコールバック (イベントループのスレッドで呼ばれる)
+
+        Raises:
+            FileNotFoundError: ファイルが見つからない場合
+            ConnectionError: クライアントが接続されていない場合
+            TimeoutError: 期限までに応答がなかった場合
+        """
+        return self.submit(self.send_file_async(file_path, session_id, timeout, progress)).result()
+
+    def broadcast_command(self, command: str, timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        接続中の全クライアントにコマンドを送信 (結果が揃うまでブロックする)
+
+        Args:
+            command (str): 送信するコマンド
+            timeout (float | None): 応答までの期限(秒)
+        """
+        return self.submit(self.broadcast_command_async(command, timeout)).result()
+
+    def broadcast_file(self, file_path: str, timeout: float | None = None) -> dict[str, str | Exception]:
+        """
+        接続中の全クライアントにファイルを送信 (結果が揃うまでブロックする)
+
+        Args:
+            file_path (str): 送信するファイルのパス
+            timeout (float | None): 応答までの期限(秒)
+        """
+        return self.submit(self.broadcast_file_async(file_path, timeout)).result()
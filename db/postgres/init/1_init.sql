@@ -10,3 +10,25 @@ CREATE TABLE documents (
 	created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
 	updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+
+-- シーン(アップロードしたアセット)のカタログ作成
+DROP TABLE IF EXISTS assets;
+CREATE TABLE assets (
+	asset_id SERIAL PRIMARY KEY,
+	digest CHAR(64) NOT NULL UNIQUE,
+	file_name VARCHAR(255) NOT NULL,
+	byte_size BIGINT NOT NULL,
+	gaussian_count INTEGER NOT NULL,
+	sh_degree SMALLINT NOT NULL,
+	min_x REAL NOT NULL,
+	min_y REAL NOT NULL,
+	min_z REAL NOT NULL,
+	max_x REAL NOT NULL,
+	max_y REAL NOT NULL,
+	max_z REAL NOT NULL,
+	variants TEXT NOT NULL DEFAULT '{}',
+	created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX assets_file_name_prefix_idx ON assets (file_name varchar_pattern_ops);
+CREATE INDEX assets_created_at_idx ON assets (created_at);
@@ -0,0 +1,11 @@
+-- ドキュメントの全文検索の索引 (起動時に毎回実行するため、何度実行しても同じ結果になるようにする)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 空白で区切った単語の検索用 (documents の変更に合わせて自動で更新される)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector
+	GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(content, ''))) STORED;
+CREATE INDEX IF NOT EXISTS documents_search_vector_idx ON documents USING GIN (search_vector);
+
+-- 部分一致(ILIKE)の検索用 (日本語のように空白で単語を区切らない文章も検索できる)
+CREATE INDEX IF NOT EXISTS documents_title_trgm_idx ON documents USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS documents_content_trgm_idx ON documents USING GIN (content gin_trgm_ops);
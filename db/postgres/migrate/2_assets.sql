@@ -0,0 +1,24 @@
+-- シーン(アップロードしたアセット)のカタログ (カタログを追加する前に作成したデータベースにも作成する)
+CREATE TABLE IF NOT EXISTS assets (
+	asset_id SERIAL PRIMARY KEY,
+	digest CHAR(64) NOT NULL UNIQUE,
+	file_name VARCHAR(255) NOT NULL,
+	byte_size BIGINT NOT NULL,
+	gaussian_count INTEGER NOT NULL,
+	sh_degree SMALLINT NOT NULL,
+	min_x REAL NOT NULL,
+	min_y REAL NOT NULL,
+	min_z REAL NOT NULL,
+	max_x REAL NOT NULL,
+	max_y REAL NOT NULL,
+	max_z REAL NOT NULL,
+	variants TEXT NOT NULL DEFAULT '{}',
+	created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ファイル名の前方一致(LIKE 'name%')の検索用
+-- データベースの照合順序がCでない場合、通常の索引は LIKE に使われないため varchar_pattern_ops で作成する
+DROP INDEX IF EXISTS assets_file_name_idx;
+CREATE INDEX IF NOT EXISTS assets_file_name_prefix_idx ON assets (file_name varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS assets_created_at_idx ON assets (created_at);
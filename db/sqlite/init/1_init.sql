@@ -6,4 +6,26 @@ CREATE TABLE documents (
     content TEXT,
     created_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime')),
     updated_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime'))
-);
\ No newline at end of file
+);
+
+-- シーン(アップロードしたアセット)のカタログ作成
+DROP TABLE IF EXISTS assets;
+CREATE TABLE assets (
+    asset_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL UNIQUE,
+    file_name TEXT NOT NULL,
+    byte_size INTEGER NOT NULL,
+    gaussian_count INTEGER NOT NULL,
+    sh_degree INTEGER NOT NULL,
+    min_x REAL NOT NULL,
+    min_y REAL NOT NULL,
+    min_z REAL NOT NULL,
+    max_x REAL NOT NULL,
+    max_y REAL NOT NULL,
+    max_z REAL NOT NULL,
+    variants TEXT NOT NULL DEFAULT '{}',
+    created_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime')),
+    updated_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime'))
+);
+CREATE INDEX assets_file_name_prefix_idx ON assets (file_name COLLATE NOCASE);
+CREATE INDEX assets_created_at_idx ON assets (created_at);
@@ -0,0 +1,28 @@
+-- ドキュメントの全文検索の索引 (起動時に毎回実行するため、何度実行しても同じ結果になるようにする)
+-- trigram は3文字ずつに区切るため、日本語のように空白で単語を区切らない文章も部分一致で検索できる
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title,
+    content,
+    content='documents',
+    content_rowid='document_id',
+    tokenize='trigram'
+);
+
+-- documents の変更を索引に反映する
+CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, content) VALUES (new.document_id, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, content)
+    VALUES ('delete', old.document_id, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, content)
+    VALUES ('delete', old.document_id, old.title, old.content);
+    INSERT INTO documents_fts (rowid, title, content) VALUES (new.document_id, new.title, new.content);
+END;
+
+-- 索引を作成する前からあるドキュメント(索引の行数が一致しない場合)は、索引を作り直して登録する
+INSERT INTO documents_fts (documents_fts)
+SELECT 'rebuild'
+WHERE (SELECT count(*) FROM documents_fts_docsize) != (SELECT count(*) FROM documents);
@@ -0,0 +1,24 @@
+-- シーン(アップロードしたアセット)のカタログ (カタログを追加する前に作成したデータベースにも作成する)
+CREATE TABLE IF NOT EXISTS assets (
+    asset_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL UNIQUE,
+    file_name TEXT NOT NULL,
+    byte_size INTEGER NOT NULL,
+    gaussian_count INTEGER NOT NULL,
+    sh_degree INTEGER NOT NULL,
+    min_x REAL NOT NULL,
+    min_y REAL NOT NULL,
+    min_z REAL NOT NULL,
+    max_x REAL NOT NULL,
+    max_y REAL NOT NULL,
+    max_z REAL NOT NULL,
+    variants TEXT NOT NULL DEFAULT '{}',
+    created_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime')),
+    updated_at DATETIME NOT NULL DEFAULT (DATETIME(CURRENT_TIMESTAMP,'localtime'))
+);
+
+-- ファイル名の前方一致(LIKE 'name%')の検索用
+-- SQLiteの LIKE は大文字と小文字を区別しないため、NOCASE の索引でなければ使われない
+DROP INDEX IF EXISTS assets_file_name_idx;
+CREATE INDEX IF NOT EXISTS assets_file_name_prefix_idx ON assets (file_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS assets_created_at_idx ON assets (created_at);
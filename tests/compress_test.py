@@ -0,0 +1,85 @@
+"""
+PLYの圧縮(app.splat.compress)の量子化の誤差と、圧縮できない場合を確認するテスト
+
+使い方:
+    python -m pytest tests/compress_test.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+from app.splat import compress
+from app.splat.compress import (
+    SplatCompressionOptions,
+    compress_splat,
+    dequantize,
+    read_quantization,
+)
+from app.splat.ply import PlyError, open_vertices, read_header, validate_splat
+from tests.splat_benchmark import generate_splat
+
+
+def test_round_trip(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    output_path = str(tmp_path / "compressed.ply")
+    generate_splat(source_path, 5000)
+    options = SplatCompressionOptions(min_opacity=0.2, sh_degree=1, block_size=1000)
+    report = compress_splat(source_path, output_path, options)
+
+    source = open_vertices(source_path)
+    kept = source[1.0 / (1.0 + np.exp(-source["opacity"])) >= options.min_opacity]
+    header = read_header(output_path)
+    quantization = read_quantization(header)
+    restored = dequantize(open_vertices(output_path, header), quantization)
+    info = validate_splat(output_path)
+    assert report.output_vertices == len(kept) == info.vertex_count, report
+    assert info.sh_degree == 1, info
+    assert report.output_bytes < report.input_bytes / 4, report
+
+    # 次数を下げたSHは、各色の先頭の係数を残す (3次の f_rest_15 は1次の f_rest_3 になる)
+    for name, source_name in (("x", "x"), ("z", "z"), ("f_dc_0", "f_dc_0"), ("scale_2", "scale_2"),
+                              ("f_rest_0", "f_rest_0"), ("f_rest_3", "f_rest_15")):
+        q = quantization[name]
+        # 量子化の誤差は1段階の半分まで (float32で復元する分の誤差を許容する)
+        tolerance = (q.high - q.low) / q.levels * 0.51
+        error = np.abs(restored[name] - kept[source_name]).max()
+        assert error <= tolerance, (name, error, tolerance)
+    rmse, max_error = report.errors["position"]
+    assert 0 < rmse <= max_error, report.errors
+
+
+def test_already_quantized(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    output_path = str(tmp_path / "compressed.ply")
+    generate_splat(source_path, 100)
+    compress_splat(source_path, output_path)
+    with pytest.raises(PlyError):
+        compress_splat(output_path, str(tmp_path / "twice.ply"))
+
+
+def test_invalid_options(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    generate_splat(source_path, 100)
+    for options, error in (
+        (SplatCompressionOptions(position_bits=12), ValueError),
+        (SplatCompressionOptions(min_opacity=1.0), PlyError),
+    ):
+        with pytest.raises(error):
+            compress_splat(source_path, str(tmp_path / "invalid.ply"), options)
+
+
+def test_failed_write(tmp_path, monkeypatch) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    output_path = str(tmp_path / "compressed.ply")
+    generate_splat(source_path, 100)
+
+    def fail(*args) -> None:
+        raise OSError("書き込みに失敗しました")
+
+    monkeypatch.setattr(compress, "_write_quantized", fail)
+    with pytest.raises(OSError):
+        compress_splat(source_path, output_path)
+    # 作成途中のファイルは残さない
+    assert sorted(os.listdir(tmp_path)) == ["scene.ply"]
+
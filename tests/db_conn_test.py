@@ -0,0 +1,135 @@
+"""
+SQLiteでのデータベースの接続(app.db_conn)の、スレッドごとの接続・SQL文の統計・まとめての書き込み・スキーマの変更を確認するテスト
+
+使い方:
+    python -m pytest tests/db_conn_test.py
+"""
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.db_conn import DatabaseHandler, StatementCache
+from app.settings import DEFAULT_SETTINGS
+
+# 初期化・スキーマの変更のSQLは、リポジトリの最上位からの相対パスで読み込まれる
+ROOT = Path(__file__).resolve().parent.parent
+# まとめて書き込む行数と、そのうち更新する行数
+ROWS = 100
+UPDATED_ROWS = 10
+
+
+def sqlite_database(database: Path) -> DatabaseHandler:
+    """
+    database に作成したSQLiteのデータベースに接続する
+    """
+    db_settings = {**DEFAULT_SETTINGS["db_settings"], "use_postgres": False}
+    db_settings["sqlite_settings"] = {**db_settings["sqlite_settings"], "database": str(database)}
+    return DatabaseHandler({**DEFAULT_SETTINGS, "db_settings": db_settings})
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    db = sqlite_database(tmp_path / "test.db")
+    yield db
+    db.close_connection()
+
+
+def fts_rowids(db: DatabaseHandler, phrase: str) -> list[int]:
+    """
+    全文検索の索引で phrase を含むドキュメントのID
+    """
+    rows = db.fetch_query("SELECT rowid FROM documents_fts WHERE documents_fts MATCH %s;", (f'"{phrase}"',))
+    return [row[0] for row in rows]
+
+
+def in_thread(func):
+    """
+    func を別のスレッドで実行し、結果を返す
+    """
+    results = []
+    thread = threading.Thread(target=lambda: results.append(func()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_connection_per_thread(db: DatabaseHandler) -> None:
+    main = db.connection
+    assert db.connection is main
+    other = in_thread(lambda: db.connection)
+    assert other is not main
+    size = db.sqlite_pool.size
+    # 終了したスレッドの接続は、次に接続を作成するときに閉じる (接続は増え続けない)
+    in_thread(lambda: db.connection)
+    assert db.sqlite_pool.size == size
+    # どのスレッドの接続にも、WALモードと synchronous=normal を設定する
+    assert db.fetch_query("PRAGMA journal_mode;") == [("wal",)]
+    assert in_thread(lambda: db.fetch_query("PRAGMA synchronous;")) == [(1,)]
+
+
+def test_statement_cache(db: DatabaseHandler) -> None:
+    assert StatementCache("sqlite").translate("SELECT * FROM t WHERE a = %s AND b = %s") == (
+        "SELECT * FROM t WHERE a = ? AND b = ?"
+    )
+    assert StatementCache("postgres").translate("SELECT %s") == "SELECT %s"
+    query = "SELECT title FROM documents WHERE document_id = %s;"
+    for document_id in (1, 2, 3):
+        db.fetch_query(query, (document_id,))
+    with pytest.raises(sqlite3.OperationalError):
+        db.fetch_query("SELECT missing FROM documents WHERE document_id = %s;", (1,))
+    stats = {statement.query: statement for statement in db.query_stats()}
+    assert stats[query].sql == "SELECT title FROM documents WHERE document_id = ?;"
+    assert (stats[query].calls, stats[query].errors) == (3, 0), stats[query]
+    failed = stats["SELECT missing FROM documents WHERE document_id = %s;"]
+    assert (failed.calls, failed.errors) == (1, 1), failed
+    assert stats[query].max_seconds <= stats[query].total_seconds
+
+
+def test_bulk_insert_and_execute_many(db: DatabaseHandler) -> None:
+    rows = [(f"doc {i}", f"content {i}") for i in range(ROWS)]
+    assert db.bulk_insert("documents", ["title", "content"], rows) == len(rows)
+    assert db.fetch_query("SELECT count(*) FROM documents;") == [(len(rows),)]
+    updated = db.execute_many(
+        "UPDATE documents SET content = %s WHERE title = %s;", [("updated", f"doc {i}") for i in range(UPDATED_ROWS)]
+    )
+    assert updated == UPDATED_ROWS
+    assert db.fetch_query("SELECT count(*) FROM documents WHERE content = %s;", ("updated",)) == [(UPDATED_ROWS,)]
+
+
+def test_bulk_insert_rollback(db: DatabaseHandler) -> None:
+    rows = [("doc", "content"), ("doc", None), (None, "no title")]
+    # 途中の行で失敗した場合は、それまでに追加した行も取り消す
+    with pytest.raises(sqlite3.IntegrityError):
+        db.bulk_insert("documents", ["title", "content"], rows)
+    assert db.fetch_query("SELECT count(*) FROM documents;") == [(0,)]
+
+
+def test_migrate_rerun(db: DatabaseHandler, caplog) -> None:
+    db.bulk_insert("documents", ["title", "content"], [("before", "migrate")])
+    with caplog.at_level(logging.ERROR, logger="app.db_conn"):
+        db.migrate()
+        db.migrate()
+    assert not caplog.records, caplog.records
+    # 全文検索の索引は重複せず、ドキュメントと同じ行数になる
+    assert db.fetch_query("SELECT count(*) FROM documents_fts_docsize;") == [(1,)]
+    assert fts_rowids(db, "migrate") == [1]
+
+
+def test_migrate_existing_database(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(ROOT)
+    database = tmp_path / "old.db"
+    # 全文検索の索引を追加する前に作成したデータベース
+    with sqlite3.connect(database) as connection:
+        connection.executescript((ROOT / "db/sqlite/init/1_init.sql").read_text(encoding="utf-8"))
+        connection.executemany("INSERT INTO documents (title, content) VALUES (?, ?)", [("a", "gaussian"), ("b", "")])
+    connection.close()
+    db = sqlite_database(database)
+    try:
+        assert db.fetch_query("SELECT count(*) FROM documents_fts_docsize;") == [(2,)]
+        assert fts_rowids(db, "gaussian") == [1]
+    finally:
+        db.close_connection()
@@ -0,0 +1,84 @@
+"""
+シーンの差分(app.splat.delta)の作成と適用を確認するテスト
+
+使い方:
+    python -m pytest tests/delta_test.py
+"""
+import numpy as np
+import pytest
+
+from app.splat.delta import DeltaError, apply_delta, build_delta
+from app.splat.ply import open_vertices
+from tests.splat_benchmark import generate_splat
+
+COUNT = 20_000
+# 一部だけ変更したシーンの差分の、新しいファイルに対する割合の上限
+MAX_RATIO = 0.2
+
+
+def write_vertices(file_path, vertices: np.ndarray) -> None:
+    """
+    float のプロパティだけを持つ頂点をPLYとして書き込む
+    """
+    header = (
+        "ply\nformat binary_little_endian 1.0\n"
+        f"element vertex {len(vertices)}\n"
+        + "".join(f"property float {name}\n" for name in vertices.dtype.names)
+        + "end_header\n"
+    )
+    with open(file_path, "wb") as f:
+        f.write(header.encode("ascii"))
+        vertices.tofile(f)
+
+
+def edited_scene(tmp_path) -> tuple:
+    """
+    元のシーンと、一部の頂点を変更・追加・削除した新しいシーンを作成する
+    """
+    base_path = tmp_path / "base.ply"
+    generate_splat(str(base_path), COUNT)
+    vertices = np.array(open_vertices(str(base_path)))
+    vertices["opacity"][5000:5100] += 1.0
+    added = vertices[:300].copy()
+    added["x"] += 100.0
+    target = np.concatenate([vertices[:12_000], added, vertices[12_500:]])
+    target_path = tmp_path / "target.ply"
+    write_vertices(target_path, target)
+    return base_path, target_path
+
+
+def test_round_trip(tmp_path) -> None:
+    base_path, target_path = edited_scene(tmp_path)
+    patch_path = tmp_path / "scene.delta"
+    info = build_delta(str(base_path), str(target_path), str(patch_path))
+    output_path = tmp_path / "output.ply"
+    assert apply_delta(str(base_path), str(patch_path), str(output_path)) == info.target_digest
+    assert output_path.read_bytes() == target_path.read_bytes()
+    # 変更していないブロックは元のファイルからコピーするため、差分は新しいファイルよりずっと小さい
+    assert 0 < info.changed_blocks < info.blocks and info.ratio < MAX_RATIO, info
+    assert info.copied_bytes + info.added_bytes == target_path.stat().st_size, info
+
+
+def test_identical(tmp_path) -> None:
+    base_path = tmp_path / "base.ply"
+    generate_splat(str(base_path), COUNT)
+    patch_path = tmp_path / "scene.delta"
+    info = build_delta(str(base_path), str(base_path), str(patch_path))
+    output_path = tmp_path / "output.ply"
+    apply_delta(str(base_path), str(patch_path), str(output_path))
+    assert output_path.read_bytes() == base_path.read_bytes()
+    # 頂点がすべて一致する場合は、ヘッダーだけを送信する
+    assert info.changed_blocks == 0, info
+    assert info.added_bytes == base_path.read_bytes().index(b"end_header\n") + len(b"end_header\n"), info
+
+
+def test_wrong_base(tmp_path) -> None:
+    base_path, target_path = edited_scene(tmp_path)
+    patch_path = tmp_path / "scene.delta"
+    build_delta(str(base_path), str(target_path), str(patch_path))
+    other_path = tmp_path / "other.ply"
+    generate_splat(str(other_path), COUNT, seed=1)
+    output_path = tmp_path / "output.ply"
+    with pytest.raises(DeltaError):
+        apply_delta(str(other_path), str(patch_path), str(output_path))
+    assert not output_path.exists() and not (tmp_path / "output.ply.tmp").exists()
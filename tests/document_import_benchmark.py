@@ -0,0 +1,128 @@
+"""
+Markdownのドキュメントの一括登録(app.document_import)のスループットを計測するベンチマーク
+
+合成したMarkdownのファイルを一時ディレクトリに作成し、1件ずつ execute_query() で登録した場合と、
+import_documents() でまとめて登録した場合の処理時間を、新しいSQLiteのデータベースでそれぞれ計測してJSONに保存する。
+--postgres を指定すると、local.settings.json のPostgreSQLに登録して計測する (登録したドキュメントは削除する)。
+
+使い方:
+    python -m tests.document_import_benchmark [--documents 10000] [--size 2000]
+                                              [--output document_import_benchmark.json] [--postgres]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from app.db_conn import DatabaseHandler
+from app.document_import import find_markdown, import_documents, read_markdown
+from app.settings import DEFAULT_SETTINGS, load_settings
+
+DEFAULT_DOCUMENTS = 10_000
+# 1件の本文のおおよその文字数
+DEFAULT_SIZE = 2000
+
+
+def generate_documents(directory: Path, count: int, size: int) -> None:
+    """
+    見出しと本文からなる合成したMarkdownのファイルを count 件作成する
+    """
+    paragraph = "これは展示の説明のサンプルです。3D Gaussian Splattingのシーンについて説明します。\n\n"
+    body = paragraph * max(1, size // len(paragraph))
+    for i in range(count):
+        (directory / f"document_{i:06d}.md").write_text(f"# 展示 {i}\n\n## 概要\n\n{body}", encoding="utf-8")
+
+
+def _database(postgres: bool, work_dir: Path, name: str) -> DatabaseHandler:
+    settings = load_settings() if postgres else DEFAULT_SETTINGS
+    db_settings = {**settings["db_settings"], "use_postgres": postgres}
+    if not postgres:
+        db_settings["sqlite_settings"] = {**db_settings["sqlite_settings"], "database": str(work_dir / name)}
+    return DatabaseHandler({**settings, "db_settings": db_settings})
+
+
+def _cleanup(db: DatabaseHandler, postgres: bool) -> None:
+    if postgres:
+        db.execute_query("DELETE FROM documents WHERE title LIKE %s", ("展示 %",))
+    db.close_connection()
+
+
+def bench_single(files: list[Path], postgres: bool, work_dir: Path) -> float:
+    """
+    1件ずつ execute_query() で登録し、処理時間を返す
+    """
+    db = _database(postgres, work_dir, "single.db")
+    try:
+        started = time.perf_counter()
+        for file_path in files:
+            db.execute_query("INSERT INTO documents (title, content) VALUES (%s, %s)", read_markdown(file_path))
+        return time.perf_counter() - started
+    finally:
+        _cleanup(db, postgres)
+
+
+def bench_bulk(files: list[Path], postgres: bool, work_dir: Path) -> float:
+    """
+    import_documents() でまとめて登録し、処理時間を返す
+    """
+    db = _database(postgres, work_dir, "bulk.db")
+    try:
+        report = import_documents(db, files)
+        assert report.documents == len(files), report
+        return report.seconds
+    finally:
+        _cleanup(db, postgres)
+
+
+def run_benchmark(count: int, size: int, postgres: bool) -> dict[str, Any]:
+    work_dir = Path(tempfile.mkdtemp(prefix="document-import-"))
+    try:
+        source_dir = work_dir / "markdown"
+        source_dir.mkdir()
+        generate_documents(source_dir, count, size)
+        files = find_markdown(source_dir)
+        total_bytes = sum(path.stat().st_size for path in files)
+        results = {}
+        for name, bench in (("single", bench_single), ("bulk", bench_bulk)):
+            seconds = bench(files, postgres, work_dir)
+            results[name] = {
+                "seconds": seconds,
+                "documents_per_second": count / seconds if seconds else None,
+                "mib_per_second": total_bytes / 1024**2 / seconds if seconds else None,
+            }
+            print(f"  {name:<8} {seconds:8.2f}s  {count / seconds:10.0f} documents/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "created_at": datetime.now().astimezone().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": "postgres" if postgres else "sqlite",
+        "documents": count,
+        "bytes": total_bytes,
+        "results": results,
+        "speedup": results["single"]["seconds"] / results["bulk"]["seconds"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=DEFAULT_DOCUMENTS)
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--output", default="document_import_benchmark.json")
+    parser.add_argument("--postgres", action="store_true", help="local.settings.json のPostgreSQLで計測する")
+    args = parser.parse_args()
+
+    print(f"{args.documents:,} documents ({'postgres' if args.postgres else 'sqlite'})")
+    report = run_benchmark(args.documents, args.size, args.postgres)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"一括登録は1件ずつの登録の {report['speedup']:.1f} 倍の速さです")
+    print(f"結果を保存しました: {args.output}")
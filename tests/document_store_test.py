@@ -0,0 +1,143 @@
+"""
+ドキュメントの一覧(app.document_store)のキーセットページネーションと全文検索を確認するテスト
+
+使い方:
+    python -m pytest tests/document_store_test.py
+"""
+import pytest
+
+from app.db_conn import DatabaseHandler
+from app.document_store import HIGHLIGHT, DocumentStore
+from tests.db_conn_test import ROOT, sqlite_database
+
+# 1ページのドキュメントの数と、ページの数が割り切れない・割り切れるドキュメントの数
+PAGE_SIZE = 5
+DOCUMENTS = 23
+EXACT_DOCUMENTS = 20
+# 検索するドキュメント (title, content)
+SEARCH_DOCUMENTS = [
+    ("Gaussian Splatting", "3D Gaussian Splatting はシーンをガウシアンの集まりで表現する"),
+    ("点群の圧縮", "ガウシアンの位置と色を量子化して点群のファイルを小さくする"),
+    ("Unity への送信", "圧縮したシーンを Unity のビューアーに送信する"),
+    ("メモ", "LOD と AI の設定"),
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    db = sqlite_database(tmp_path / "test.db")
+    yield db
+    db.close_connection()
+
+
+def add_documents(db: DatabaseHandler, rows: list[tuple[str, str]]) -> list[int]:
+    """
+    ドキュメントを追加し、document_id を返す
+    """
+    db.bulk_insert("documents", ["title", "content"], rows)
+    return [row[0] for row in db.fetch_query("SELECT document_id FROM documents ORDER BY document_id;")]
+
+
+def read_all_pages(store: DocumentStore, limit: int = PAGE_SIZE) -> list[list[int]]:
+    """
+    最後のページまで順に読み込み、各ページの document_id を返す
+    """
+    pages = []
+    cursor = None
+    while True:
+        page = store.list_page(cursor, limit)
+        pages.append([document_id for document_id, _ in page.documents])
+        if not page.has_more:
+            return pages
+        cursor = page.next_cursor
+
+
+def test_list_page(db: DatabaseHandler) -> None:
+    ids = add_documents(db, [(f"doc {i}", "") for i in range(DOCUMENTS)])
+    pages = read_all_pages(DocumentStore(db))
+    # 全てのドキュメントを、重複も抜けもなく document_id の順に読み込む
+    assert [document_id for page in pages for document_id in page] == ids
+    assert [len(page) for page in pages] == [PAGE_SIZE] * (DOCUMENTS // PAGE_SIZE) + [DOCUMENTS % PAGE_SIZE]
+    assert DocumentStore(db).list_page(limit=1).documents == [(ids[0], "doc 0")]
+
+
+def test_list_page_exact_multiple(db: DatabaseHandler) -> None:
+    ids = add_documents(db, [(f"doc {i}", "") for i in range(EXACT_DOCUMENTS)])
+    store = DocumentStore(db)
+    pages = read_all_pages(store)
+    # ドキュメントの数がページの大きさで割り切れる場合も、空のページを読み込まずに終わる
+    assert [len(page) for page in pages] == [PAGE_SIZE] * (EXACT_DOCUMENTS // PAGE_SIZE)
+    assert store.list_page(ids[-1], PAGE_SIZE).documents == []
+
+
+def test_list_page_after_delete(db: DatabaseHandler) -> None:
+    ids = add_documents(db, [(f"doc {i}", "") for i in range(DOCUMENTS)])
+    store = DocumentStore(db)
+    first = store.list_page(limit=PAGE_SIZE)
+    # 読み込んだページの行と、まだ読み込んでいない行を削除しても、残りの行は重複も抜けもない
+    deleted = {ids[0], first.next_cursor, ids[PAGE_SIZE + 1]}
+    for document_id in deleted:
+        db.execute_query("DELETE FROM documents WHERE document_id = %s;", (document_id,))
+    pages = []
+    cursor = first.next_cursor
+    while cursor is not None:
+        page = store.list_page(cursor, PAGE_SIZE)
+        pages.extend(document_id for document_id, _ in page.documents)
+        cursor = page.next_cursor
+    assert pages == [document_id for document_id in ids[PAGE_SIZE:] if document_id not in deleted]
+
+
+def search_ids(store: DocumentStore, query: str) -> set[int]:
+    """
+    query の検索結果の document_id
+    """
+    return {result.document_id for result in store.search(query)}
+
+
+def test_search(db: DatabaseHandler) -> None:
+    ids = add_documents(db, SEARCH_DOCUMENTS)
+    store = DocumentStore(db)
+    # 3文字以上の語は trigram の索引で、大文字・小文字を区別せず、日本語も部分一致で検索する
+    assert search_ids(store, "gaussian") == {ids[0]}
+    assert search_ids(store, "ガウシアン") == {ids[0], ids[1]}
+    # 空白(全角を含む)で区切った語は、全ての語を含むドキュメントだけを返す
+    assert search_ids(store, "ガウシアン　量子化") == {ids[1]}
+    assert search_ids(store, "ガウシアン Unity") == set()
+    # タイトルに一致したドキュメントの関連度が高い
+    assert store.search("Gaussian")[0].document_id == ids[0]
+    assert store.search("") == []
+
+
+def test_search_short_terms(db: DatabaseHandler) -> None:
+    ids = add_documents(db, SEARCH_DOCUMENTS)
+    store = DocumentStore(db)
+    # trigram の索引で検索できない短い語は LIKE で検索する
+    assert search_ids(store, "AI") == {ids[3]}
+    assert search_ids(store, "点群") == {ids[1]}
+    assert search_ids(store, "3D") == {ids[0]}
+    # 長い語と短い語を組み合わせた場合は、索引の検索結果を短い語で絞り込む
+    assert search_ids(store, "シーン 3D") == {ids[0]}
+    assert search_ids(store, "シーン 点群") == set()
+    # % と _ は LIKE のワイルドカードとして扱わない
+    assert search_ids(store, "%") == set()
+
+
+def test_search_snippet(db: DatabaseHandler) -> None:
+    add_documents(db, SEARCH_DOCUMENTS)
+    store = DocumentStore(db)
+    start, end = HIGHLIGHT
+    # 索引での検索も LIKE での検索も、抜粋の一致した部分を強調する
+    assert f"{start}量子化{end}" in store.search("量子化")[0].snippet
+    assert f"{start}AI{end}" in store.search("AI")[0].snippet
+
+
+def test_search_after_update(db: DatabaseHandler) -> None:
+    ids = add_documents(db, SEARCH_DOCUMENTS)
+    store = DocumentStore(db)
+    # ドキュメントの変更・削除は、トリガーで索引に反映する
+    db.execute_query("UPDATE documents SET content = %s WHERE document_id = %s;", ("レンダリングの設定", ids[1]))
+    assert search_ids(store, "量子化") == set()
+    assert search_ids(store, "レンダリング") == {ids[1]}
+    db.execute_query("DELETE FROM documents WHERE document_id = %s;", (ids[0],))
+    assert search_ids(store, "ガウシアン") == set()
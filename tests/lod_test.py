@@ -0,0 +1,92 @@
+"""
+LODの作成(app.splat.lod)で、Gaussianが重要度の順にLODへ振り分けられることを確認するテスト
+
+使い方:
+    python -m pytest tests/lod_test.py
+"""
+import os
+
+import numpy as np
+
+from app.splat.lod import LOD_MANIFEST, build_lods, importance
+from app.splat.ply import open_vertices, read_header, validate_splat
+from app.splat.tiling import is_tiled, read_tiles, tile_splat
+from tests.splat_benchmark import generate_splat
+
+COUNT = 10_000
+FRACTIONS = [0.1, 0.4, 1.0]
+TILE_SIZE = 512
+
+
+def sorted_rows(vertices: np.ndarray) -> np.ndarray:
+    """
+    頂点の並びによらずに比べられるように、頂点をバイト列として並べ替える
+    """
+    return np.sort(np.ascontiguousarray(vertices).view(f"V{vertices.dtype.itemsize}"))
+
+
+def test_partition(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    generate_splat(source_path, COUNT)
+    lod_set = build_lods(source_path, FRACTIONS, block_size=3000, directory=str(tmp_path / "lod"))
+
+    assert [tier.fraction for tier in lod_set.tiers] == FRACTIONS, lod_set.tiers
+    assert [tier.vertex_count for tier in lod_set.tiers] == [1000, 3000, 6000], lod_set.tiers
+    tiers = []
+    for tier, path in zip(lod_set.tiers, lod_set.paths(), strict=True):
+        assert validate_splat(path).vertex_count == tier.vertex_count, tier
+        header = read_header(path)
+        tiers.append((open_vertices(path, header), importance(open_vertices(path, header), header)))
+    # 粗いLODほど重要度の高いGaussianを含む
+    for (_, coarse), (_, fine) in zip(tiers, tiers[1:], strict=False):
+        assert coarse.min() >= fine.max(), (coarse.min(), fine.max())
+    # 全てのLODを合わせると元のシーンと同じGaussianになる
+    merged = np.concatenate([vertices for vertices, _ in tiers])
+    assert np.array_equal(sorted_rows(merged), sorted_rows(open_vertices(source_path)))
+
+
+def test_reuse(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    generate_splat(source_path, 1000)
+    directory = str(tmp_path / "lod")
+    first = build_lods(source_path, FRACTIONS, directory=directory)
+    modified = [os.path.getmtime(path) for path in first.paths()]
+    second = build_lods(source_path, FRACTIONS, directory=directory)
+    assert [os.path.getmtime(path) for path in second.paths()] == modified
+    # 割合を変えた場合は作り直す
+    third = build_lods(source_path, [0.5], directory=directory)
+    assert [tier.vertex_count for tier in third.tiers] == [500, 500], third.tiers
+
+
+def test_tiled_source(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    tiled_path = str(tmp_path / "tiled.ply")
+    generate_splat(source_path, COUNT)
+    tile_splat(source_path, tiled_path, tile_size=TILE_SIZE)
+    directory = str(tmp_path / "lod")
+    lod_set = build_lods(tiled_path, FRACTIONS, directory=directory)
+    # タイルに分割する前の一時ファイルは残らない
+    assert sorted(os.listdir(directory)) == sorted([*(tier.file_name for tier in lod_set.tiers), LOD_MANIFEST])
+    for tier, path in zip(lod_set.tiers, lod_set.paths(), strict=True):
+        header = read_header(path)
+        assert is_tiled(header), path
+        tiles = read_tiles(path, header)
+        assert sum(tile.count for tile in tiles) == tier.vertex_count, tier
+        assert max(tile.count for tile in tiles) <= TILE_SIZE, tier
+
+
+
+def test_small_scene(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    generate_splat(source_path, 3)
+    directory = str(tmp_path / "lod")
+    # 3つのGaussianでは最も粗いLOD (10%) に振り分けられるGaussianがないため、そのLODは作成しない
+    lod_set = build_lods(source_path, FRACTIONS, directory=directory)
+    assert [(tier.level, tier.vertex_count) for tier in lod_set.tiers] == [(1, 1), (2, 2)], lod_set.tiers
+    assert sorted(os.listdir(directory)) == sorted([*(tier.file_name for tier in lod_set.tiers), LOD_MANIFEST])
+    for tier, path in zip(lod_set.tiers, lod_set.paths(), strict=True):
+        assert validate_splat(path).vertex_count == tier.vertex_count, tier
+    # 空のLODを除いても、同じ割合であれば再利用する
+    modified = [os.path.getmtime(path) for path in lod_set.paths()]
+    reused = build_lods(source_path, FRACTIONS, directory=directory)
+    assert reused.tiers == lod_set.tiers and [os.path.getmtime(path) for path in reused.paths()] == modified
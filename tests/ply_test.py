@@ -0,0 +1,103 @@
+"""
+3D Gaussian SplattingのPLYの検証(app.splat.ply)を確認するテスト
+
+使い方:
+    python -m pytest tests/ply_test.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+from app.splat.ply import PlyError, parse_header, read_header, validate_splat
+from tests.splat_benchmark import generate_splat, splat_properties
+
+COUNT = 10
+
+
+def write_splat(file_path: str, count: int, types: dict[str, str] | None = None,
+                last: dict[str, float] | None = None, comments: list[str] | None = None) -> None:
+    """
+    値が0のPLYを作成する
+
+    Args:
+        file_path (str): 出力先
+        count (int): 頂点数
+        types (dict[str, str] | None): プロパティ名 -> PLYの型名 (指定しないプロパティは float)
+        last (dict[str, float] | None): 最後の頂点に設定する値
+        comments (list[str] | None): ヘッダーに書き込むコメント
+    """
+    types = types or {}
+    properties = splat_properties()
+    numpy_types = {"float": "<f4", "int": "<i4"}
+    dtype = np.dtype([(name, numpy_types[types.get(name, "float")]) for name in properties])
+    header = (
+        "ply\nformat binary_little_endian 1.0\n"
+        + "".join(f"comment {comment}\n" for comment in comments or [])
+        + f"element vertex {count}\n"
+        + "".join(f"property {types.get(name, 'float')} {name}\n" for name in properties)
+        + "end_header\n"
+    )
+    with open(file_path, "wb") as f:
+        f.write(header.encode("ascii"))
+        vertices = np.zeros(count, dtype=dtype)
+        for name, value in (last or {}).items():
+            vertices[name][-1] = value
+        vertices.tofile(f)
+
+
+def assert_rejected(file_path: str) -> None:
+    with pytest.raises(PlyError):
+        validate_splat(file_path)
+
+
+def test_valid(tmp_path) -> None:
+    file_path = str(tmp_path / "valid.ply")
+    generate_splat(file_path, 100)
+    info = validate_splat(file_path)
+    assert (info.vertex_count, info.sh_degree) == (100, 3), info
+
+
+def test_truncated(tmp_path) -> None:
+    file_path = str(tmp_path / "truncated.ply")
+    generate_splat(file_path, 100)
+    with open(file_path, "r+b") as f:
+        f.truncate(os.path.getsize(file_path) - 1)
+    assert_rejected(file_path)
+
+
+def test_not_float(tmp_path) -> None:
+    file_path = str(tmp_path / "int.ply")
+    write_splat(file_path, COUNT, {"opacity": "int"})
+    assert_rejected(file_path)
+
+
+def test_not_finite(tmp_path) -> None:
+    for value in (np.nan, np.inf):
+        file_path = str(tmp_path / "not_finite.ply")
+        write_splat(file_path, COUNT, last={"scale_1": value})
+        assert_rejected(file_path)
+
+
+def test_end_header_in_comment(tmp_path) -> None:
+    file_path = str(tmp_path / "comment.ply")
+    # コメントの中の end_header ではヘッダーを終了しない
+    write_splat(file_path, COUNT, comments=["contains end_header", "end_header"])
+    header = read_header(file_path)
+    assert header.element("vertex").count == COUNT
+    assert header.comments == ["contains end_header", "end_header"]
+    assert validate_splat(file_path).vertex_count == COUNT
+
+
+def test_truncated_header() -> None:
+    data = b"ply\nformat binary_little_endian 1.0\nelement vertex 1\nproperty float x\n"
+    for end in (data, data + b"end_header", data + b"end_hea"):
+        with pytest.raises(PlyError):
+            parse_header(end)
+    assert parse_header(data + b"end_header\r\n").header_size == len(data) + len(b"end_header\r\n")
+
+
+def test_bare_quantize_comment(tmp_path) -> None:
+    file_path = str(tmp_path / "quantize.ply")
+    write_splat(file_path, COUNT, comments=["quantize"])
+    assert validate_splat(file_path).vertex_count == COUNT
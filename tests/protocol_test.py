@@ -0,0 +1,85 @@
+"""
+Unityとの通信形式(app.unity.protocol)の受信データの分割を確認するテスト
+
+使い方:
+    python -m pytest tests/protocol_test.py
+"""
+import pytest
+
+from app.unity.protocol import (
+    HEADER,
+    MAGIC,
+    MAX_PAYLOAD_SIZE,
+    PROTOCOL_VERSION,
+    BinaryCodec,
+    FrameDecoder,
+    LineDecoder,
+    MessageType,
+    ProtocolError,
+    TextCodec,
+)
+
+
+def feed_bytewise(decoder: LineDecoder | FrameDecoder, data: bytes) -> list:
+    """
+    1バイトずつ受信した場合の、取り出せたメッセージの一覧
+    """
+    messages = []
+    for i in range(len(data)):
+        decoder.feed(data[i:i + 1])
+        messages.extend(decoder)
+    return messages
+
+
+def test_line_decoder_split_multibyte() -> None:
+    data = TextCodec().encode(MessageType.RESULT, 7, "次のシーン".encode())
+    data += TextCodec().encode(MessageType.COMMAND, None, "前のシーン".encode())
+    messages = feed_bytewise(LineDecoder(), data)
+    assert [(m.type, m.request_id, m.text) for m in messages] == [
+        (MessageType.RESULT, 7, "次のシーン"),
+        (MessageType.COMMAND, None, "前のシーン"),
+    ], messages
+
+
+def test_line_decoder_take_after_message() -> None:
+    decoder = LineDecoder()
+    decoder.feed(b"FILE:3:f.ply:5\nhel")
+    assert [m.text for m in decoder] == ["f.ply:5"]
+    assert decoder.take(5) == b"hel"
+    decoder.feed(b"loRESULT:4:ok\n")
+    assert decoder.take(2) == b"lo"
+    assert [(m.request_id, m.text) for m in decoder] == [(4, "ok")]
+
+
+def test_line_decoder_oversize_line() -> None:
+    decoder = LineDecoder()
+    decoder.feed(b"RESULT:1:" + b"x" * LineDecoder.max_line_size)
+    with pytest.raises(ProtocolError):
+        decoder.next_message()
+
+
+def test_frame_decoder_split_multibyte() -> None:
+    codec = BinaryCodec()
+    data = codec.encode(MessageType.COMMAND, 1, "次のシーン".encode()) + codec.encode(MessageType.PING, 2)
+    messages = feed_bytewise(FrameDecoder(), data)
+    assert [(m.type, m.request_id, m.text) for m in messages] == [
+        (MessageType.COMMAND, 1, "次のシーン"),
+        (MessageType.PING, 2, ""),
+    ], messages
+
+
+def test_frame_decoder_oversize_frame() -> None:
+    decoder = FrameDecoder()
+    decoder.feed(HEADER.pack(MAGIC, PROTOCOL_VERSION, MessageType.RESULT, 1, MAX_PAYLOAD_SIZE + 1))
+    with pytest.raises(ProtocolError):
+        decoder.next_message()
+    with pytest.raises(ValueError):
+        BinaryCodec().encode(MessageType.RESULT, 1, b"x" * (MAX_PAYLOAD_SIZE + 1))
+
+
+def test_frame_decoder_bad_magic() -> None:
+    decoder = FrameDecoder()
+    decoder.feed(b"RESULT:1:ok\n")
+    with pytest.raises(ProtocolError):
+        decoder.next_message()
+
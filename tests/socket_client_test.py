@@ -0,0 +1,281 @@
+"""
+Unityクライアントの代わりにサーバーへ接続する動作確認用のクライアント
+
+使い方:
+    python -m tests.socket_client_test [--protocol text|binary] [--save-dir DIR]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import zlib
+from dataclasses import dataclass, field
+from threading import Event
+
+from app.logging_config import setup_logging
+from app.splat.delta import DeltaError, apply_delta
+from app.unity.compression import ChunkDecoder, available_encodings
+from app.unity.protocol import CODECS, FrameDecoder, LineDecoder, Message, MessageType, TextCodec
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReceivingUpload:
+    name: str
+    size: int
+    digest: str
+    offset: int = 0
+    # 表示せずに保持だけするか (先読み)
+    prefetch: bool = False
+    # 差分ファイルの場合の元のファイルと適用後のファイル ({"base", "digest", "name"})
+    delta: dict | None = None
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256)
+    decoder: ChunkDecoder | None = None
+
+
+class FakeUnityClient:
+    """
+    Unityクライアントを模したクライアント
+
+    COMMANDには受け取ったコマンドをそのまま結果として返し、
+    FILE・分割転送(UPLOAD/CHUNK/UPLOAD_END)は受信してsave_dirに保存(未指定の場合は破棄)する。
+    分割転送の受信状態は再接続しても保持するため、切断後に続きから受信できる。
+    drop_after を設定すると、分割転送でそのバイト数を受信した時点で接続を切断する(不安定な回線の再現用)。
+    接続時のHELLOではリクエストID("request_id")・分割転送("upload")・アセット("assets")・ハートビート("heartbeat")と
+    compression の圧縮方式に対応していることを通知する。respond_to_ping を False にするとPINGに応答しない。
+    分割転送で受信したファイルはダイジェストで記録し、HAVE・LOADに応答する。
+    "prefetch": true が付いた分割転送は先読みとして prefetched_assets に記録する(表示はしない)。
+    save_dir を指定した場合は受信したファイルを save_dir/.assets にダイジェストごとに残し、
+    "delta" に対応して、差分ファイル(app.splat.delta)を保持しているファイルに適用する。
+    """
+    recv_size = 1024 * 1024
+
+    def __init__(self, host="127.0.0.1", port=8765, protocol: str = TextCodec.name, name: str = "fake-unity",
+                 save_dir: str | None = None):
+        self.host = host
+        self.port = port
+        self.codec = CODECS[protocol]
+        self.name = name
+        self.save_dir = save_dir
+        self.sock: socket.socket | None = None
+        self.received_files: list[tuple[str, int]] = []
+        self.cancelled: set[int] = set()
+        self.uploads: dict[str, ReceivingUpload] = {}
+        # 保持しているアセット (ダイジェスト -> ファイル名)
+        self.assets: dict[str, str] = {}
+        self.loaded_assets: list[str] = []
+        self.prefetched_assets: list[str] = []
+        # 差分で受信したファイル (ファイル名, 差分のバイト数)
+        self.delta_files: list[tuple[str, int]] = []
+        self.drop_after: int | None = None
+        # HELLOで通知する圧縮方式 (connect() の前に変更できる)
+        self.compression = available_encodings()
+        self.encoding: str | None = None
+        self.respond_to_ping = True
+        self.stopped = Event()
+
+    def connect(self) -> None:
+        """
+        サーバーに接続し、通信形式を伝えるためにHELLOを送信する
+        """
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        capabilities = ["request_id", "upload", "assets", "heartbeat", "lod", "prefetch"]
+        if self.save_dir:
+            capabilities.append("delta")
+        hello = {"display_id": self.name, "capabilities": capabilities, "compression": self.compression}
+        self._send(MessageType.HELLO, 0, json.dumps(hello).encode())
+        logger.info(f"サーバーに接続しました: {self.host}:{self.port} ({self.codec.name})")
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.sock:
+            self.sock.close()
+
+    def _send(self, message_type: MessageType, request_id: int, payload: bytes = b"") -> None:
+        self.sock.sendall(self.codec.encode(message_type, request_id, payload))
+
+    def run(self) -> None:
+        """
+        サーバーからのメッセージを処理し続ける
+        """
+        decoder = self.codec.decoder()
+        try:
+            while not self.stopped.is_set():
+                data = self.sock.recv(self.recv_size)
+                if not data:
+                    break
+                decoder.feed(data)
+                for message in decoder:
+                    self._handle(message, decoder)
+        except OSError as e:
+            if not self.stopped.is_set():
+                logger.error(f"サーバーとの通信中にエラーが発生しました: {e}")
+        finally:
+            logger.info("サーバーとの接続を終了しました")
+
+    def _handle(self, message: Message, decoder: LineDecoder | FrameDecoder) -> None:
+        if message.type == MessageType.COMMAND:
+            logger.debug(f"コマンドを受信しました: {message.text}")
+            self._send(MessageType.RESULT, message.request_id, f"{self.name}: {message.text}".encode())
+        elif message.type == MessageType.FILE:
+            file_name, _, file_size = message.text.rpartition(":")
+            size = self._receive_file(file_name, int(file_size), decoder)
+            self.received_files.append((file_name, size))
+            self._send(MessageType.RESULT, message.request_id, f"received {file_name} ({size} bytes)".encode())
+        elif message.type == MessageType.UPLOAD:
+            header = json.loads(message.payload)
+            upload = self.uploads.setdefault(
+                header["digest"], ReceivingUpload(header["name"], header["size"], header["digest"])
+            )
+            # 先読みの途中から通常の転送で再開された場合は表示する
+            upload.prefetch = header.get("prefetch", False)
+            upload.delta = header.get("delta")
+            self._send(MessageType.RESULT, message.request_id, json.dumps({"offset": upload.offset}).encode())
+        elif message.type == MessageType.CHUNK:
+            self._receive_chunk(json.loads(message.payload), decoder)
+        elif message.type == MessageType.UPLOAD_END:
+            self._send(MessageType.RESULT, message.request_id, json.dumps(self._finish_upload(message.text)).encode())
+        elif message.type == MessageType.HAVE:
+            have = [digest for digest in json.loads(message.payload)["digests"] if digest in self.assets]
+            self._send(MessageType.RESULT, message.request_id, json.dumps({"have": have}).encode())
+        elif message.type == MessageType.LOAD:
+            asset = json.loads(message.payload)
+            self.loaded_assets.append(asset["digest"])
+            self._send(MessageType.RESULT, message.request_id, f"loaded {self.assets[asset['digest']]}".encode())
+        elif message.type == MessageType.HELLO:
+            self.encoding = json.loads(message.payload).get("compression")
+            logger.info(f"サーバーと圧縮方式を合意しました: {self.encoding}")
+        elif message.type == MessageType.PING:
+            if self.respond_to_ping:
+                self._send(MessageType.PONG, message.request_id)
+        elif message.type == MessageType.CANCEL:
+            self.cancelled.add(message.request_id)
+        else:
+            logger.debug(f"メッセージを受信しました: {message}")
+
+    def _receive_file(self, file_name: str, file_size: int, decoder: LineDecoder | FrameDecoder) -> int:
+        """
+        FILEメッセージに続くファイル本体を受信する
+        """
+        f = open(os.path.join(self.save_dir, file_name), "wb") if self.save_dir else None
+        try:
+            for data in self._read_raw(file_size, decoder):
+                if f:
+                    f.write(data)
+            return file_size
+        finally:
+            if f:
+                f.close()
+
+    def _read_raw(self, size: int, decoder: LineDecoder | FrameDecoder):
+        """
+        メッセージに続く size バイトの生データを受信した順に返す
+        """
+        data = decoder.take(size)
+        while True:
+            yield data
+            size -= len(data)
+            if size <= 0:
+                break
+            data = self.sock.recv(min(size, self.recv_size))
+            if not data:
+                raise ConnectionError("ファイルの受信中に接続が切断されました")
+
+    def _part_path(self, upload: ReceivingUpload) -> str:
+        return os.path.join(self.save_dir, f".{upload.digest}.part")
+
+    def _receive_chunk(self, header: dict, decoder: LineDecoder | FrameDecoder) -> None:
+        """
+        CHUNKメッセージに続くチャンクを受信し、位置とCRC32が正しければ書き込む
+        """
+        data = b"".join(self._read_raw(header.get("size", header["length"]), decoder))
+        upload = self.uploads.get(header["digest"])
+        if upload is not None and header.get("encoding"):
+            if header.get("reset"):
+                upload.decoder = ChunkDecoder(header["encoding"])
+            data = upload.decoder.decode(data) if upload.decoder else b""
+        if upload is None or header["offset"] != upload.offset or zlib.crc32(data) != header["crc32"]:
+            logger.warning(f"不正なチャンクを破棄しました: {header}")
+            return
+        if self.save_dir:
+            with open(self._part_path(upload), "r+b" if upload.offset else "wb") as f:
+                f.seek(upload.offset)
+                f.write(data)
+        upload.hasher.update(data)
+        upload.offset += len(data)
+        if self.drop_after is not None and upload.offset >= self.drop_after:
+            self.drop_after = None
+            logger.info(f"動作確認のため接続を切断します: {upload.offset}/{upload.size}")
+            self.sock.shutdown(socket.SHUT_RDWR)
+
+    def _finish_upload(self, digest: str) -> dict:
+        """
+        分割転送を完了し、ダイジェストの検証結果を返す
+        """
+        upload = self.uploads.get(digest)
+        if upload is None:
+            return {"ok": False, "offset": 0}
+        if upload.offset < upload.size:
+            return {"ok": False, "offset": upload.offset}
+        del self.uploads[digest]
+        if upload.hasher.hexdigest() != digest:
+            logger.warning(f"ダイジェストが一致しません: {upload.name}")
+            return {"ok": False, "offset": 0}
+        name, size = upload.name, upload.size
+        if upload.delta:
+            # 差分を保持しているファイルに適用し、適用後のファイルとして受信する
+            name, digest = upload.delta["name"], upload.delta["digest"]
+            try:
+                apply_delta(self._asset_path(upload.delta["base"]), self._part_path(upload), self._asset_path(digest))
+            except (DeltaError, OSError) as e:
+                logger.warning(f"差分を適用できませんでした: {name} {e}")
+                return {"ok": False, "offset": 0}
+            finally:
+                os.remove(self._part_path(upload))
+            size = os.path.getsize(self._asset_path(digest))
+            self.delta_files.append((name, upload.size))
+        elif self.save_dir:
+            os.makedirs(os.path.dirname(self._asset_path(digest)), exist_ok=True)
+            os.replace(self._part_path(upload), self._asset_path(digest))
+        if self.save_dir:
+            tmp_path = os.path.join(self.save_dir, f".{name}.tmp")
+            os.link(self._asset_path(digest), tmp_path)
+            os.replace(tmp_path, os.path.join(self.save_dir, name))
+        self.received_files.append((name, size))
+        self.assets[digest] = name
+        if upload.prefetch:
+            self.prefetched_assets.append(digest)
+            return {"ok": True, "result": f"stored {name} ({size} bytes)"}
+        return {"ok": True, "result": f"received {name} ({size} bytes)"}
+
+    def _asset_path(self, digest: str) -> str:
+        return os.path.join(self.save_dir, ".assets", digest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--protocol", choices=list(CODECS), default=TextCodec.name)
+    parser.add_argument("--name", default="fake-unity")
+    parser.add_argument("--save-dir", default=None)
+    parser.add_argument("--drop-after", type=int, default=None)
+    parser.add_argument("--compression", nargs="*", default=None)
+    args = parser.parse_args()
+
+    setup_logging()
+    client = FakeUnityClient(args.host, args.port, args.protocol, args.name, args.save_dir)
+    client.drop_after = args.drop_after
+    if args.compression is not None:
+        client.compression = args.compression
+    client.connect()
+    try:
+        client.run()
+    except KeyboardInterrupt:
+        print("\nクライアントを停止します")
+    finally:
+        client.close()
@@ -1,13 +1,21 @@
 from queue import Empty, Queue
-from threading import Thread
-from time import sleep
+from threading import Event, Thread
 
 from app.logging_config import setup_logging
-from app.unity_conn import SocketServer
+from app.unity_conn import SessionState, SocketServer
 
 setup_logging()
 
 server = SocketServer()
+# 接続状態が変わるたびにセットするイベント (接続を待つ間はポーリングせずにこのイベントを待つ)
+connection_changed = Event()
+
+
+def on_state_change(session, state: SessionState):
+    print(f"\n[{session.display_id}] {state.value}")
+    connection_changed.set()
+
+server.add_state_listener(on_state_change)
 server_thread = Thread(target=server.start, daemon=True)
 server_thread.start()
 
@@ -35,11 +43,12 @@ try:
             if not server.is_connected:
                 print("サーバーとの接続がありません。再接続を待機しています...")
             else:
-                print("サーバーに接続されました。")
+                print(f"サーバーに接続されました。セッション: {', '.join(server.sessions)}")
 
         # サーバーが接続されていない場合は再接続を待機
         if not server.is_connected:
-            sleep(1)
+            connection_changed.wait()
+            connection_changed.clear()
             continue
 
         # メニューを一度だけ表示
@@ -47,6 +56,7 @@ try:
             print("\n送信オプション: ")
             print("1: コマンドを送信")
             print("2: ファイルを送信")
+            print("3: 全クライアントにコマンドを送信")
             print("q: サーバーを停止")
             print("選択してください: ", end="", flush=True)
             menu_displayed = True
@@ -90,6 +100,17 @@ try:
                 continue
             server.send_file(file_path)
             print("選択してください: ", end="", flush=True)
+        elif option == "3":
+            print("送信するコマンド: ", end="", flush=True)
+            try:
+                command = input_queue.get(timeout=30)  # コマンド入力を待機
+            except Empty:
+                print("コマンド入力がタイムアウトしました。")
+                continue
+
+            for session_id, result in server.broadcast_command(command).items():
+                print(f"{session_id}: {result}")
+            print("選択してください: ", end="", flush=True)
         elif option.lower() == "q":
             server.stop()
             break
@@ -0,0 +1,242 @@
+"""
+アセットの処理(PLYの検証・変換・Unityへの送信)が、Gaussianの数に対してどう伸びるかを計測するベンチマーク
+
+合成した3D Gaussian SplattingのPLY (既定では10万・100万・1000万個) を作成し、段階ごとに
+処理時間・スループット・ピークのメモリ使用量(RSS)を計測してJSONに保存する。
+各段階は新しいプロセスで実行するため、ピークのRSSは段階ごとの値になる。
+--baseline に以前の結果を指定すると、段階ごとの処理時間の比を表示する (1.0より大きければ遅くなっている)。
+
+使い方:
+    python -m tests.splat_benchmark [--sizes 100000 1000000 10000000] [--output splat_benchmark.json]
+                                    [--baseline previous.json] [--work-dir DIR]
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+
+from app.splat.compress import SplatCompressionOptions, compress_splat
+from app.splat.lod import build_lods
+from app.splat.ply import SPLAT_PROPERTIES, validate_splat
+from app.splat.tiling import tile_splat
+from app.unity_conn import ServerSettings, SocketServer
+from tests.socket_client_test import FakeUnityClient
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+# 合成するPLYのSHの次数 (学習済みのシーンと同じ3次 = f_rest_* 45個)
+SH_DEGREE = 3
+# 一度に生成する頂点数
+BLOCK_SIZE = 1_000_000
+BENCHMARK_PORT = 18765
+
+
+def splat_properties(sh_degree: int = SH_DEGREE) -> list[str]:
+    rest = [f"f_rest_{i}" for i in range(3 * ((sh_degree + 1) ** 2 - 1))]
+    return SPLAT_PROPERTIES[:6] + rest + SPLAT_PROPERTIES[6:]
+
+
+def generate_splat(file_path: str, count: int, seed: int = 0) -> None:
+    """
+    学習済みのシーンに近い分布の値を持つ、合成した3D Gaussian SplattingのPLYを作成する
+
+    Args:
+        file_path (str): 出力先
+        count (int): Gaussianの数
+        seed (int): 乱数のシード (同じ値なら同じファイルになる)
+    """
+    properties = splat_properties()
+    dtype = np.dtype([(name, "<f4") for name in properties])
+    header = (
+        "ply\nformat binary_little_endian 1.0\n"
+        f"element vertex {count}\n"
+        + "".join(f"property float {name}\n" for name in properties)
+        + "end_header\n"
+    )
+    rng = np.random.default_rng(seed)
+    with open(file_path, "wb") as f:
+        f.write(header.encode("ascii"))
+        for start in range(0, count, BLOCK_SIZE):
+            block = np.zeros(min(BLOCK_SIZE, count - start), dtype=dtype)
+            size = len(block)
+            for axis in ("x", "y", "z"):
+                block[axis] = rng.normal(0, 10, size)
+            for name in properties[3:]:
+                block[name] = rng.normal(0, 0.5, size)
+            block["opacity"] = rng.normal(0, 4, size)
+            for i in range(3):
+                block[f"scale_{i}"] = rng.normal(-4, 1, size)
+            block.tofile(f)
+
+
+def _peak_rss() -> int:
+    """
+    このプロセスのピークのRSS(バイト)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _stage_validate(source_path: str, work_dir: str) -> dict[str, Any]:
+    validate_splat(source_path)
+    return {}
+
+
+def _stage_compress(source_path: str, work_dir: str) -> dict[str, Any]:
+    output_path = os.path.join(work_dir, "compressed.ply")
+    report = compress_splat(source_path, output_path, SplatCompressionOptions(sh_degree=1))
+    return {"output_bytes": os.path.getsize(output_path), "output_vertices": report.output_vertices}
+
+
+def _stage_tile(source_path: str, work_dir: str) -> dict[str, Any]:
+    output_path = os.path.join(work_dir, "tiled.ply")
+    tiles = tile_splat(source_path, output_path)
+    return {"tiles": len(tiles)}
+
+
+def _stage_lod(source_path: str, work_dir: str) -> dict[str, Any]:
+    lod_set = build_lods(source_path, directory=os.path.join(work_dir, "lod"))
+    return {"tiers": [tier.vertex_count for tier in lod_set.tiers]}
+
+
+def _stage_send(source_path: str, work_dir: str) -> dict[str, Any]:
+    """
+    ローカルの FakeUnityClient に send_file で送信する (変換は行わず、分割転送とアセットの経路を通す)
+    """
+    server = SocketServer(ServerSettings(
+        host="127.0.0.1", port=BENCHMARK_PORT, lod_fractions=None, splat_cache_dir=os.path.join(work_dir, "cache"),
+        scene_dir=os.path.join(work_dir, "scenes"), delta_updates=False,
+    ))
+    server_thread = threading.Thread(target=server.start, daemon=True)
+    server_thread.start()
+    while not server.running:
+        time.sleep(0.01)
+    client = FakeUnityClient(port=BENCHMARK_PORT, name="benchmark")
+    client.connect()
+    threading.Thread(target=client.run, daemon=True).start()
+    while not any(session.identified for session in server.sessions.values()):
+        time.sleep(0.01)
+    try:
+        session_id = next(iter(server.sessions))
+        server.send_file(source_path, session_id)
+        stats = server.get_session(session_id).last_transfer
+        return {"wire_bytes": stats.wire_bytes if stats else None, "encoding": stats.encoding if stats else None}
+    finally:
+        client.close()
+        server.stop()
+        # サーバーのワーカーを止め終わる前にプロセスを終了すると、終了処理で止まることがあるため待機する
+        server_thread.join()
+
+
+STAGES: dict[str, Callable[[str, str], dict[str, Any]]] = {
+    "validate": _stage_validate,
+    "compress": _stage_compress,
+    "tile": _stage_tile,
+    "lod": _stage_lod,
+    "send_file": _stage_send,
+}
+
+
+def _run_stage(stage: str, source_path: str, work_dir: str) -> dict[str, Any]:
+    """
+    段階を実行し、処理時間とピークのRSSを返す (新しいプロセスで実行する)
+    """
+    started = time.perf_counter()
+    details = STAGES[stage](source_path, work_dir)
+    return {"seconds": time.perf_counter() - started, "peak_rss": _peak_rss(), **details}
+
+
+def _run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    func を新しいプロセスで実行して結果を返す
+    """
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(func, *args).result()
+
+
+def run_stage(stage: str, source_path: str, work_dir: str, count: int) -> dict[str, Any]:
+    """
+    段階を新しいプロセスで実行し、処理時間・スループット・ピークのRSSを返す
+    """
+    result = _run_in_process(_run_stage, stage, source_path, work_dir)
+    seconds = result["seconds"]
+    file_size = os.path.getsize(source_path)
+    result["gaussians_per_second"] = count / seconds if seconds else None
+    result["mib_per_second"] = file_size / 1024**2 / seconds if seconds else None
+    return result
+
+
+def run_benchmark(sizes: list[int], work_dir: str, stages: list[str]) -> dict[str, Any]:
+    results = []
+    for count in sizes:
+        size_dir = tempfile.mkdtemp(prefix=f"splat-{count}-", dir=work_dir)
+        try:
+            source_path = os.path.join(size_dir, "scene.ply")
+            started = time.perf_counter()
+            # LinuxではピークのRSSが子プロセスに引き継がれるため、別のプロセスで作成する
+            _run_in_process(generate_splat, source_path, count)
+            print(f"{count:,} Gaussians: {os.path.getsize(source_path) / 1024**2:.1f} MiB "
+                  f"(generated in {time.perf_counter() - started:.1f}s)")
+            entry = {"gaussians": count, "file_bytes": os.path.getsize(source_path), "stages": {}}
+            for stage in stages:
+                result = run_stage(stage, source_path, size_dir, count)
+                entry["stages"][stage] = result
+                print(f"  {stage:<10} {result['seconds']:8.2f}s  {result['mib_per_second']:8.1f} MiB/s  "
+                      f"peak RSS {result['peak_rss'] / 1024**2:8.1f} MiB")
+            results.append(entry)
+        finally:
+            shutil.rmtree(size_dir, ignore_errors=True)
+    return {
+        "created_at": datetime.now().astimezone().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """
+    段階ごとの処理時間を以前の結果と比べて表示する
+    """
+    previous = {entry["gaussians"]: entry["stages"] for entry in baseline.get("results", [])}
+    print("\n処理時間の比 (今回 / 以前):")
+    for entry in report["results"]:
+        stages = previous.get(entry["gaussians"])
+        if stages is None:
+            continue
+        for stage, result in entry["stages"].items():
+            if stage in stages and stages[stage]["seconds"]:
+                ratio = result["seconds"] / stages[stage]["seconds"]
+                print(f"  {entry['gaussians']:>12,} {stage:<10} {ratio:5.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", default="splat_benchmark.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--work-dir", default=None, help="合成したPLYの作成先 (既定では一時ディレクトリ)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.gettempdir()
+    report = run_benchmark(args.sizes, work_dir, args.stages)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"結果を保存しました: {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
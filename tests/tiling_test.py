@@ -0,0 +1,122 @@
+"""
+Mortonコードによるタイル分割(app.splat.tiling)の並び順とタイルの範囲を確認するテスト
+
+使い方:
+    python -m pytest tests/tiling_test.py
+"""
+import os
+
+import numpy as np
+
+from app.splat.compress import compress_splat, dequantize, read_quantization
+from app.splat.ply import open_vertices, read_header, validate_splat
+from app.splat.tiling import MORTON_BITS, SplatTile, morton_codes, morton_order, read_tiles, tile_splat
+from tests.lod_test import sorted_rows
+from tests.splat_benchmark import generate_splat
+
+COUNT = 10_000
+TILE_SIZE = 1000
+
+
+def reference_morton(x: int, y: int, z: int) -> int:
+    """
+    ビットを1つずつ並べるMortonコード (x が最下位ビット)
+    """
+    code = 0
+    for bit in range(MORTON_BITS):
+        for axis, value in enumerate((x, y, z)):
+            code |= ((value >> bit) & 1) << (bit * 3 + axis)
+    return code
+
+
+def test_morton_codes() -> None:
+    levels = (1 << MORTON_BITS) - 1
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, levels, size=(100, 3))
+    values[0] = [levels, levels, levels]
+    values[1] = [1, 0, 0]
+    bounds = (np.zeros(3), np.full(3, float(levels)))
+    codes = morton_codes(values[:, 0], values[:, 1], values[:, 2], *bounds)
+    assert codes.dtype == np.uint64
+    assert [int(code) for code in codes] == [reference_morton(*map(int, row)) for row in values]
+    assert int(codes[0]) == (1 << (3 * MORTON_BITS)) - 1 and int(codes[1]) == 1
+    # 範囲外と有限でない座標は範囲の端に丸める
+    clipped = morton_codes(np.array([-5.0, np.nan]), np.array([levels * 2.0, 0.0]), np.zeros(2), *bounds)
+    assert [int(code) for code in clipped] == [reference_morton(0, levels, 0), 0]
+
+
+def test_morton_order() -> None:
+    rng = np.random.default_rng(1)
+    vertices = np.zeros(COUNT, dtype=[("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+    for axis in ("x", "y", "z"):
+        vertices[axis] = rng.normal(0, 10, COUNT)
+    vertices["x"][5] = np.inf
+    order = morton_order(vertices, block_size=3000)
+    assert np.array_equal(np.sort(order), np.arange(COUNT))
+    bounds_min = np.array([vertices[axis][np.isfinite(vertices[axis])].min() for axis in ("x", "y", "z")])
+    bounds_max = np.array([vertices[axis][np.isfinite(vertices[axis])].max() for axis in ("x", "y", "z")])
+    codes = morton_codes(vertices["x"], vertices["y"], vertices["z"], bounds_min, bounds_max)
+    assert np.all(np.diff(codes[order].astype(np.float64)) >= 0)
+
+
+def tile_volume(positions: dict[str, np.ndarray], start: int, count: int) -> float:
+    """
+    頂点の範囲のバウンディングボックスの体積
+    """
+    return float(np.prod([np.ptp(positions[name][start:start + count]) for name in ("x", "y", "z")]))
+
+
+def assert_tiles(path: str, tiles: list[SplatTile], positions: dict[str, np.ndarray]) -> None:
+    """
+    タイルが頂点を隙間なく順に覆い、各タイルの頂点がバウンディングボックスに収まることを確認する
+    """
+    count = len(positions["x"])
+    assert [tile.start for tile in tiles] == list(range(0, count, TILE_SIZE)), tiles
+    assert sum(tile.count for tile in tiles) == count, tiles
+    assert all(tile.count == TILE_SIZE for tile in tiles[:-1]), tiles
+    assert tiles[-1].offset + tiles[-1].size == os.path.getsize(path), tiles[-1]
+    for tile in tiles:
+        for axis, name in enumerate(("x", "y", "z")):
+            values = positions[name][tile.start:tile.start + tile.count]
+            assert tile.bounds_min[axis] <= values.min() and values.max() <= tile.bounds_max[axis], (tile, name)
+
+
+def test_tile_splat(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    output_path = str(tmp_path / "tiled.ply")
+    generate_splat(source_path, COUNT)
+    tiles = tile_splat(source_path, output_path, TILE_SIZE)
+    assert tiles == read_tiles(output_path)
+    assert validate_splat(output_path).vertex_count == COUNT
+    vertices = open_vertices(output_path)
+    assert np.array_equal(sorted_rows(vertices), sorted_rows(open_vertices(source_path)))
+    positions = {name: vertices[name] for name in ("x", "y", "z")}
+    assert_tiles(output_path, tiles, positions)
+    # Mortonコードの順に並べたタイルは、元の順に区切った場合よりずっと小さな範囲にまとまる
+    source = open_vertices(source_path)
+    source_positions = {name: source[name] for name in ("x", "y", "z")}
+    tiled_volume = sum(tile_volume(positions, tile.start, tile.count) for tile in tiles)
+    unordered_volume = sum(tile_volume(source_positions, tile.start, tile.count) for tile in tiles)
+    assert tiled_volume < unordered_volume / 2, (tiled_volume, unordered_volume)
+
+    tile = tiles[0]
+    assert tile.intersects(tile.bounds_min, tile.bounds_max)
+    outside = tuple(high + 1.0 for high in tile.bounds_max)
+    assert not tile.intersects(outside, tuple(value + 1.0 for value in outside))
+
+
+def test_tile_quantized(tmp_path) -> None:
+    source_path = str(tmp_path / "scene.ply")
+    compressed_path = str(tmp_path / "compressed.ply")
+    output_path = str(tmp_path / "tiled.ply")
+    generate_splat(source_path, COUNT)
+    compress_splat(source_path, compressed_path)
+    header = read_header(compressed_path)
+    tiles = tile_splat(compressed_path, output_path, TILE_SIZE)
+    output_header = read_header(output_path)
+    assert read_quantization(output_header) == read_quantization(header)
+    # タイルの範囲は量子化した値ではなく、復元した座標で記録する
+    vertices = open_vertices(output_path, output_header)
+    positions = dequantize(vertices[["x", "y", "z"]], read_quantization(output_header))
+    assert_tiles(output_path, tiles, positions)
+
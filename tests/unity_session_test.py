@@ -0,0 +1,356 @@
+"""
+Unityとの通信(app.unity_conn.UnitySession)を、ローカルの接続で確認するテスト
+
+使い方:
+    python -m pytest tests/unity_session_test.py
+"""
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from app.unity.protocol import LineDecoder, Message, MessageType, TextCodec
+from app.unity.transfer import SendOptions, file_digest
+from app.unity_conn import ServerSettings, SessionState, SocketServer, UnitySession
+from tests.socket_client_test import FakeUnityClient
+
+# 各テストの待機の上限(秒)
+WAIT_TIMEOUT = 10.0
+# 分割転送の途中で切断するまでに受信するバイト数と、送信するファイルのサイズ
+# (切断までに受信バッファに届いた分は受信されるため、ファイルは受信バッファより十分に大きくする)
+DROP_AFTER = 1024 * 1024
+RESUME_FILE_SIZE = 32 * 1024 * 1024
+
+
+class SessionListener:
+    """
+    ローカルのポートで接続を受け付け、接続ごとの UnitySession をキューに入れる
+    """
+
+    def __init__(self, settings: ServerSettings | None = None):
+        self.settings = settings or ServerSettings()
+        self.sessions: asyncio.Queue[UnitySession] = asyncio.Queue()
+        self.server: asyncio.Server | None = None
+        self._session_ids = iter(range(1, 1000))
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def __aenter__(self) -> "SessionListener":
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.server.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = UnitySession(f"session-{next(self._session_ids)}", reader, writer, self.settings)
+        await self.sessions.put(session)
+        try:
+            await session.read_loop()
+        finally:
+            writer.close()
+
+    async def next_session(self) -> UnitySession:
+        """
+        次に接続したセッションを、HELLOを受信するまで待って返す
+        """
+        async with asyncio.timeout(WAIT_TIMEOUT):
+            session = await self.sessions.get()
+            while not session.identified:
+                await asyncio.sleep(0.01)
+        return session
+
+
+def start_fake_client(client: FakeUnityClient) -> threading.Thread:
+    """
+    FakeUnityClient を接続し、受信を別スレッドで始める (切断後に呼び出すと再接続する)
+
+    Returns:
+        threading.Thread: 受信するスレッド (再接続する前に終了を待つ)
+    """
+    client.stopped.clear()
+    client.connect()
+    sock = client.sock
+
+    def serve() -> None:
+        # 受信を終えたら、Unityのアプリと同じようにソケットを閉じる
+        try:
+            client.run()
+        finally:
+            sock.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread
+
+
+class RawClient:
+    """
+    応答の順番やタイミングをテストから指定するための、テキスト形式のクライアント
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = LineDecoder()
+
+    @classmethod
+    async def connect(cls, port: int, hello: bytes, hello_reply: bool | None = None) -> "RawClient":
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"HELLO:" + hello + b"\n")
+        await writer.drain()
+        client = cls(reader, writer)
+        if hello_reply if hello_reply is not None else hello.startswith(b"{"):
+            # JSON形式のHELLOには、サーバーからHELLOの応答が届く
+            reply = await client.receive()
+            assert reply.type == MessageType.HELLO, reply
+        return client
+
+    async def receive(self) -> Message:
+        async with asyncio.timeout(WAIT_TIMEOUT):
+            while (message := self.decoder.next_message()) is None:
+                self.decoder.feed(await self.reader.read(64 * 1024))
+        return message
+
+    async def reply(self, request_id: int, result: str) -> None:
+        self.writer.write(TextCodec().encode(MessageType.RESULT, request_id, result.encode()))
+        await self.writer.drain()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def json_hello(capabilities: list[str]) -> bytes:
+    return json.dumps({"display_id": "display", "capabilities": capabilities}).encode()
+
+
+@pytest.fixture
+def socket_server(tmp_path) -> SocketServer:
+    """
+    起動せずに送信処理だけを呼び出すための SocketServer (保存先は一時ディレクトリ)
+    """
+    return SocketServer(ServerSettings(
+        splat_cache_dir=str(tmp_path / "cache"), scene_dir=str(tmp_path / "scenes"), delta_updates=False,
+    ))
+
+
+def test_legacy_hello() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = await RawClient.connect(listener.port, b"display-1")
+            session = await listener.next_session()
+            assert (session.display_id, session.uses_request_ids) == ("display-1", False)
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_malformed_json_hello() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            # JSONとして解析できないHELLOは、旧形式の表示名として扱う
+            client = await RawClient.connect(listener.port, b"{display-1", hello_reply=False)
+            session = await listener.next_session()
+            assert session.display_id == "{display-1" and not session.closed
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_get_session_skips_closed(socket_server: SocketServer) -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            first_client = await RawClient.connect(listener.port, b"display-1")
+            first = await listener.next_session()
+            second_client = await RawClient.connect(listener.port, b"display-2")
+            second = await listener.next_session()
+            socket_server.sessions = {first.session_id: first, second.session_id: second}
+            assert socket_server.get_session() is first
+            first_client.close()
+            async with asyncio.timeout(WAIT_TIMEOUT):
+                while first.state != SessionState.CLOSED:
+                    await asyncio.sleep(0.01)
+            # 切断されたセッションが一覧に残っていても、接続中のセッションを返す
+            assert socket_server.get_session() is second
+            second_client.close()
+            async with asyncio.timeout(WAIT_TIMEOUT):
+                while second.state != SessionState.CLOSED:
+                    await asyncio.sleep(0.01)
+            with pytest.raises(ConnectionError):
+                socket_server.get_session()
+
+    asyncio.run(run())
+
+
+def test_out_of_order_results() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = await RawClient.connect(listener.port, json_hello(["request_id"]))
+            session = await listener.next_session()
+            first = asyncio.create_task(session.send_command("first"))
+            second = asyncio.create_task(session.send_command("second"))
+            commands = [await client.receive(), await client.receive()]
+            assert [(m.type, m.text) for m in commands] == [
+                (MessageType.COMMAND, "first"), (MessageType.COMMAND, "second"),
+            ], commands
+            assert session.in_flight == len(commands)
+            # 後に送信したリクエストから応答する
+            await client.reply(commands[1].request_id, "second done")
+            assert await second == "second done"
+            assert not first.done()
+            await client.reply(commands[0].request_id, "first done")
+            assert await first == "first done"
+            assert session.in_flight == 0
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_timeout_sends_cancel() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = await RawClient.connect(listener.port, json_hello(["request_id"]))
+            session = await listener.next_session()
+            with pytest.raises(TimeoutError):
+                await session.send_command("slow", timeout=0.2)
+            command = await client.receive()
+            cancel = await client.receive()
+            assert (cancel.type, cancel.request_id) == (MessageType.CANCEL, command.request_id), cancel
+            assert session.in_flight == 0
+            # 期限切れの後に届いた応答は無視し、次のリクエストには影響しない
+            await client.reply(command.request_id, "late")
+            next_command = asyncio.create_task(session.send_command("next"))
+            await client.reply((await client.receive()).request_id, "next done")
+            assert await next_command == "next done"
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_disconnect_fails_pending_requests() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = await RawClient.connect(listener.port, json_hello(["request_id"]))
+            session = await listener.next_session()
+            pending = asyncio.create_task(session.send_command("never"))
+            await client.receive()
+            client.close()
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(pending, WAIT_TIMEOUT)
+            assert session.closed
+
+    asyncio.run(run())
+
+
+def test_resume_after_drop(tmp_path) -> None:
+    file_path = tmp_path / "scene.bin"
+    file_path.write_bytes(os.urandom(RESUME_FILE_SIZE))
+    digest = file_digest(str(file_path))
+    save_dir = tmp_path / "received"
+    save_dir.mkdir()
+
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = FakeUnityClient(port=listener.port, name="display", save_dir=str(save_dir))
+            client.drop_after = DROP_AFTER
+            thread = start_fake_client(client)
+            session = await listener.next_session()
+            with pytest.raises(ConnectionError):
+                async with asyncio.timeout(WAIT_TIMEOUT):
+                    await session.send_file_resumable(str(file_path), digest)
+            await asyncio.to_thread(thread.join, WAIT_TIMEOUT)
+            # 受信済みの位置はクライアントが保持しているため、再接続後は続きから送信する
+            received = client.uploads[digest].offset
+            assert DROP_AFTER <= received < RESUME_FILE_SIZE, received
+            start_fake_client(client)
+            session = await listener.next_session()
+            result = await session.send_file_resumable(str(file_path), digest)
+            assert result.startswith("received scene.bin"), result
+            assert session.last_transfer.resumed_from == received, session.last_transfer
+            assert session.last_transfer.bytes_sent == RESUME_FILE_SIZE - received
+            client.close()
+
+    asyncio.run(run())
+    assert (save_dir / "scene.bin").read_bytes() == file_path.read_bytes()
+
+
+def test_have_hit_skips_upload(tmp_path, socket_server: SocketServer) -> None:
+    file_path = tmp_path / "scene.bin"
+    file_path.write_bytes(os.urandom(64 * 1024))
+    digest = file_digest(str(file_path))
+
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = FakeUnityClient(port=listener.port, name="display")
+            start_fake_client(client)
+            session = await listener.next_session()
+            first = await socket_server._send_asset(session, str(file_path), SendOptions())
+            assert first.startswith("received scene.bin"), first
+            # 2回目はDisplayが保持しているため、アップロードせずに読み込みだけを指示する
+            second = await socket_server._send_asset(session, str(file_path), SendOptions())
+            assert second == "loaded scene.bin", second
+            assert client.received_files == [("scene.bin", 64 * 1024)], client.received_files
+            assert client.loaded_assets == [digest]
+            assert socket_server.assets.assets("display") == {digest: "scene.bin"}
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_heartbeat_timeout_closes_session() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = FakeUnityClient(port=listener.port, name="display")
+            client.respond_to_ping = False
+            start_fake_client(client)
+            session = await listener.next_session()
+            states = []
+            session.on_state_change = lambda _, state: states.append(state)
+            # PINGに応答しないため、DEGRADED を経て接続を閉じる
+            await asyncio.wait_for(session.heartbeat(0.05, 0.3), WAIT_TIMEOUT)
+            async with asyncio.timeout(WAIT_TIMEOUT):
+                while session.state != SessionState.CLOSED:
+                    await asyncio.sleep(0.01)
+            assert states == [SessionState.DEGRADED, SessionState.CLOSED], states
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_heartbeat_keeps_responsive_session() -> None:
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = FakeUnityClient(port=listener.port, name="display")
+            start_fake_client(client)
+            session = await listener.next_session()
+            heartbeat = asyncio.create_task(session.heartbeat(0.05, 0.3))
+            await asyncio.sleep(0.6)
+            assert not heartbeat.done() and session.state == SessionState.READY, session.state
+            heartbeat.cancel()
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_fan_out_unknown_session(tmp_path, socket_server: SocketServer) -> None:
+    file_path = tmp_path / "scene.bin"
+    file_path.write_bytes(os.urandom(1024))
+
+    async def run() -> None:
+        async with SessionListener() as listener:
+            client = FakeUnityClient(port=listener.port, name="display")
+            start_fake_client(client)
+            session = await listener.next_session()
+            socket_server.sessions = {session.session_id: session}
+            # 送信先が1つでも見つからない場合は、どの送信先への転送も始めない
+            with pytest.raises(ConnectionError):
+                await socket_server.transfers.fan_out(str(file_path), [session.session_id, "missing"])
+            assert socket_server.transfers.jobs == {}
+            assert client.received_files == []
+            client.close()
+
+    asyncio.run(run())
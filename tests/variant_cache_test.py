@@ -0,0 +1,169 @@
+"""
+変換したアセットのキャッシュ(app.unity.variant_cache)の、LRUによる削除と作成の排他を確認するテスト
+
+使い方:
+    python -m pytest tests/variant_cache_test.py
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from app.unity.variant_cache import VariantCache
+
+ENTRY_SIZE = 100
+DIGEST = "0" * 64
+# 同時に get_or_create() を呼び出すスレッドの数
+THREADS = 4
+
+
+def writer(size: int = ENTRY_SIZE):
+    """
+    size バイトのファイルを1つ書き込む create 関数
+    """
+    def create(directory: str) -> None:
+        with open(os.path.join(directory, "variant.ply"), "wb") as f:
+            f.write(bytes(size))
+        # 最後に使用した時刻(更新時刻)で順番が決まるように、エントリごとに時刻をずらす
+        time.sleep(0.01)
+    return create
+
+
+def test_lru_eviction(tmp_path) -> None:
+    root = str(tmp_path)
+    cache = VariantCache(root, max_size=ENTRY_SIZE * 2)
+    first = cache.get_or_create(DIGEST, "a", writer())
+    second = cache.get_or_create(DIGEST, "b", writer())
+    # a を使用すると、最も長く使われていないのは b になる
+    assert cache.get(DIGEST, "a") == first
+    time.sleep(0.01)
+    third = cache.get_or_create(DIGEST, "c", writer())
+    assert os.path.isdir(first) and os.path.isdir(third) and not os.path.exists(second)
+    assert (cache.stats.entries, cache.stats.size, cache.stats.evictions) == (2, ENTRY_SIZE * 2, 1), cache.stats
+    assert cache.get(DIGEST, "b") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 4), cache.stats
+
+
+def test_pinned_entry(tmp_path) -> None:
+    root = str(tmp_path)
+    cache = VariantCache(root, max_size=ENTRY_SIZE)
+    pinned = cache.get_or_create(DIGEST, "a", writer(), pin=True)
+    other = cache.get_or_create(DIGEST, "b", writer())
+    # 使用中のエントリは容量を超えていても削除しない
+    assert os.path.isdir(pinned) and os.path.isdir(other)
+    cache.unpin(pinned)
+    assert not os.path.exists(pinned) and os.path.isdir(other)
+    assert cache.stats.size == ENTRY_SIZE, cache.stats
+
+
+def test_failed_create(tmp_path) -> None:
+    root = str(tmp_path)
+    cache = VariantCache(root)
+
+    def fail(directory: str) -> None:
+        writer()(directory)
+        raise RuntimeError("変換に失敗しました")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create(DIGEST, "a", fail)
+    assert os.listdir(root) == [] and not cache.has(DIGEST, "a")
+    assert (cache.stats.entries, cache.stats.size) == (0, 0), cache.stats
+
+
+def test_restart(tmp_path) -> None:
+    root = str(tmp_path)
+    cache = VariantCache(root, max_size=ENTRY_SIZE * 2)
+    first = cache.get_or_create(DIGEST, "a", writer())
+    cache.get_or_create(DIGEST, "b", writer())
+    # 作成途中で終了したエントリは、次に起動したときに削除する
+    os.makedirs(os.path.join(root, f"unfinished{VariantCache.tmp_suffix}"))
+    restarted = VariantCache(root, max_size=ENTRY_SIZE * 2)
+    assert (restarted.stats.entries, restarted.stats.size) == (2, ENTRY_SIZE * 2), restarted.stats
+    assert not any(name.endswith(VariantCache.tmp_suffix) for name in os.listdir(root))
+    # 最後に使用した時刻は再起動後も引き継ぐ
+    restarted.get_or_create(DIGEST, "c", writer())
+    assert not os.path.exists(first) and restarted.has(DIGEST, "b") and restarted.has(DIGEST, "c")
+
+
+def run_concurrently(cache: VariantCache, create, count: int, late: int = 0, delay: float = 0.0) -> list:
+    """
+    count 個のスレッドから同時に、late 個のスレッドから delay 秒後に get_or_create() を呼び出す
+
+    Returns:
+        list: スレッドごとの結果 (エントリのパス、または発生した例外)
+    """
+    results = []
+
+    def run(wait: float) -> None:
+        time.sleep(wait)
+        try:
+            results.append(cache.get_or_create(DIGEST, "a", create))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=run, args=(0.0,)) for _ in range(count)]
+    threads += [threading.Thread(target=run, args=(delay,)) for _ in range(late)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class CountingCreate:
+    """
+    呼び出された回数と同時に実行された数を記録する create 関数 (fail_first 回目までは失敗する)
+    """
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, directory: str) -> None:
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            fail = self.calls <= self.fail_first
+        try:
+            time.sleep(0.1)
+            if fail:
+                raise RuntimeError("変換に失敗しました")
+            writer()(directory)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_create_once(tmp_path) -> None:
+    cache = VariantCache(str(tmp_path))
+    create = CountingCreate()
+    results = run_concurrently(cache, create, THREADS)
+    assert create.calls == 1 and len(set(results)) == 1 and len(results) == THREADS, (create.calls, results)
+    assert cache.stats.entries == 1 and cache._creating == {}, cache.stats
+
+
+def test_create_retry_after_failure(tmp_path) -> None:
+    cache = VariantCache(str(tmp_path))
+    create = CountingCreate(fail_first=1)
+    # 最初の作成が失敗した後に来たスレッドも、待っていたスレッドと同じロックで待つ
+    results = run_concurrently(cache, create, THREADS, late=2, delay=0.15)
+    errors = [result for result in results if isinstance(result, Exception)]
+    paths = {result for result in results if isinstance(result, str)}
+    assert len(errors) == 1 and len(paths) == 1, results
+    assert (create.calls, create.max_running) == (2, 1), (create.calls, create.max_running)
+    assert cache.stats.entries == 1 and cache._creating == {}, cache.stats
+
+
+def test_create_always_fails(tmp_path) -> None:
+    cache = VariantCache(str(tmp_path))
+    create = CountingCreate(fail_first=10)
+    results = run_concurrently(cache, create, 3)
+    # 失敗した場合は待っていたスレッドが順に作成し直し、同時には作成しない
+    assert all(isinstance(result, RuntimeError) for result in results), results
+    assert (create.calls, create.max_running) == (3, 1), (create.calls, create.max_running)
+    assert os.listdir(tmp_path) == [] and cache._creating == {}
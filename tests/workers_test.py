@@ -0,0 +1,57 @@
+"""
+PLYの処理を実行するワーカープロセス(app.splat.workers)の、異常終了からの復帰を確認するテスト
+
+使い方:
+    python -m pytest tests/workers_test.py
+"""
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.splat.workers import JobState, SplatWorkerPool
+
+# 各テストの待機の上限(秒)
+WAIT_TIMEOUT = 30.0
+
+
+@pytest.fixture
+def pool():
+    pool = SplatWorkerPool(max_workers=1, memory_limit=None)
+    yield pool
+    pool.shutdown()
+
+
+def wait_until(condition) -> None:
+    """
+    ジョブの完了の処理(done callback)は別スレッドで行われるため、condition() が真になるまで待つ
+    """
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_recover_from_broken_pool(pool: SplatWorkerPool) -> None:
+    assert pool.run("test", "a.ply", abs, -1) == 1
+    broken = pool._executor
+    # ワーカーが異常終了すると、そのジョブは失敗し、プールは次のジョブで作り直す
+    with pytest.raises(BrokenProcessPool):
+        pool.run("test", "b.ply", os._exit, 1)
+    wait_until(lambda: pool._executor is None)
+    assert [job.state for job in pool.jobs.values()] == [JobState.DONE, JobState.FAILED]
+    assert pool.run("test", "c.ply", abs, -1) == 1
+    assert pool._executor is not None and pool._executor is not broken
+
+
+def test_stale_failure_keeps_new_pool(pool: SplatWorkerPool) -> None:
+    pool.run("test", "a.ply", abs, -1)
+    old = pool._executor
+    pool.shutdown()
+    pool.run("test", "b.ply", abs, -1)
+    current = pool._executor
+    # 作り直す前のプールの失敗の通知で、新しいプールを破棄しない
+    pool._discard_executor(old)
+    assert pool._executor is current
+    assert pool.run("test", "c.ply", abs, -1) == 1